@@ -322,7 +322,8 @@ class AdvancedEmergeDialog:
             #~ # Remove properties object so everything's recalculated
             #~ del self.package.properties[ebuild]
         # Remove properties object so everything's recalculated
-        self.package.properties.pop(ebuild, None)
+        if self.package.properties:
+            self.package.properties.pop(ebuild, None)
         self.system_use_flags = portage_lib.settings.SystemUseFlags
         self.package_use_flags = db.userconfigs.get_user_config('USE', self.package.full_name)
         #debug.dprint(self.package_use_flags)
@@ -35,6 +35,7 @@ from sys import exit, stderr
 import os, thread
 from gettext import gettext as _
 from itertools import izip
+from hashlib import md5
 
 IMPORT_DONE = False
 
@@ -298,6 +299,32 @@ def get_cpv_use(cpv):
         settings.settings.lock()
     return myuse, use_expand_hidden, usemask, useforce
 
+# a private copy of the config for get_final_use(), setcpv() changes it
+_use_config = [None, None]
+_use_config_lock = thread.allocate_lock()
+
+def get_final_use(cpv):
+    """Returns the list of USE flags cpv would be merged with, the IUSE
+    defaults, the profile and user package.use, use.force and use.mask
+    applied, or None if cpv is not in the tree.  Unlike get_cpv_use()
+    it is safe to call from a thread."""
+    if not settings.portdb.cpv_exists(cpv):
+        return None
+    _use_config_lock.acquire()
+    try:
+        if _use_config[0] is not settings.settings:
+            # the config was reloaded
+            _use_config[:] = [settings.settings, portage.config(clone=settings.settings)]
+        mysettings = _use_config[1]
+        try:
+            mysettings.setcpv(cpv, mydb=settings.portdb)
+            return mysettings['PORTAGE_USE'].split()
+        except Exception, e:
+            debug.dprint("PORTAGELIB: get_final_use(); failed for %s: %s" %(cpv, str(e)))
+            return None
+    finally:
+        _use_config_lock.release()
+
 def get_name(full_name):
     """Extract name from full name."""
     return full_name.split('/')[1]
@@ -322,6 +349,15 @@ def get_installed(package_name):
     """
     return settings.trees[settings.settings["ROOT"]]["vartree"].dep_match(str(package_name))
 
+def get_installed_cpvs():
+    """Returns a dictionary of cat/pkg: [installed cpv's] for every
+    installed package, read in one pass over the vdb"""
+    installed = {}
+    vardb = settings.trees[settings.settings["ROOT"]]["vartree"].dbapi
+    for cpv in vardb.cpv_all():
+        installed.setdefault(portage.cpv_getkey(cpv), []).append(cpv)
+    return installed
+
 def xmatch(*args, **kwargs):
     """Pass arguments on to portage's caching match function.
     xmatch('match-all',package-name) returns all ebuilds of <package-name> in a list,
@@ -401,10 +437,140 @@ def extract_package(ebuild):
         result = "/".join(parts[0:2])
     return result
 
+def get_vdb_path():
+    """Returns the path to the installed package database (vdb)"""
+    return EPREFIX + "/var/db/pkg"
+
+def get_repo_paths():
+    """Returns the paths of the main tree and any overlays"""
+    return settings.portdb.porttrees[:]
+
+def get_config_paths():
+    """Returns the paths of the user config files and dirs that
+    affect package visibility, world membership and sets"""
+    paths = [os.path.join(portage.root, portage_const.MAKE_CONF_FILE),
+            os.path.join('/', portage.WORLD_FILE)]
+    config_dir = os.path.join(settings.config_root,
+            settings.user_config_dir)
+    for name in ['package.use', 'package.keywords', 'package.accept_keywords',
+            'package.mask', 'package.unmask', 'package.provided', 'sets']:
+        paths.append(os.path.join(config_dir, name))
+    return paths
+
+def get_profile_paths():
+    """Returns the dirs of the current profile and the profiles
+    it inherits from"""
+    try:
+        return list(settings.settings.profiles)
+    except AttributeError:
+        return [os.path.join(settings.config_root, portage_const.PROFILE_PATH)]
+
+def get_vdb_counter():
+    """Returns portage's merge counter, it is bumped by every merge,
+    or '' if it can not be read"""
+    try:
+        _file = open(EPREFIX + "/var/cache/edb/counter", "r")
+        counter = _file.read().strip()
+        _file.close()
+    except IOError:
+        counter = ''
+    return counter
+
+def get_categories():
+    """Returns the list of valid categories"""
+    return list(settings.settings.categories)
+
+# the top level dirs of a repo that are not categories
+NON_CATEGORY_DIRS = frozenset(['metadata', 'profiles', 'eclass', 'licenses',
+    'distfiles', 'packages', 'scripts'])
+
+def get_tree_categories():
+    """Returns the sorted valid categories and the category dirs of
+    the main tree and overlays, so a category only an overlay has a
+    dir for is included"""
+    categories = set(settings.settings.categories)
+    for repo in get_repo_paths():
+        try:
+            entries = os.listdir(repo)
+        except OSError:
+            continue
+        for name in entries:
+            if (name not in NON_CATEGORY_DIRS and not name.startswith('.')
+                    and os.path.isdir(os.path.join(repo, name))):
+                categories.add(name)
+    return sorted(categories)
+
+def get_category_nodes(category):
+    """Returns the cat/pkg names of one category in the main tree
+    and overlays, the per category part of get_allnodes()"""
+    names = set()
+    for repo in get_repo_paths():
+        cat_dir = os.path.join(repo, category)
+        try:
+            entries = os.listdir(cat_dir)
+        except OSError:
+            continue
+        for name in entries:
+            if os.path.isdir(os.path.join(cat_dir, name)):
+                names.add(category + '/' + name)
+    return sorted(names)
+
+def get_cache_signatures(categories = None):
+    """Returns a dictionary of cat/pkg: signature for every package
+    in the main tree and overlays, or only those in categories.
+    The signature is built from the md5-cache entries (or the package
+    dir mtime for repos without one) so it changes whenever an ebuild
+    of the package changes."""
+    signatures = {}
+    for repo in get_repo_paths():
+        cache_dir = os.path.join(repo, "metadata", "md5-cache")
+        if os.path.isdir(cache_dir):
+            if categories is None:
+                cache_categories = os.listdir(cache_dir)
+            else:
+                cache_categories = categories
+            for category in cache_categories:
+                cat_dir = os.path.join(cache_dir, category)
+                try:
+                    entries = os.listdir(cat_dir)
+                except OSError:
+                    continue
+                for pf in entries:
+                    parts = portage.pkgsplit(pf)
+                    if not parts:
+                        continue
+                    try:
+                        mtime = os.stat(os.path.join(cat_dir, pf)).st_mtime
+                    except OSError:
+                        continue
+                    signatures.setdefault(category + '/' + parts[0], []).append(
+                        (repo, pf, mtime))
+        else:
+            if categories is None:
+                tree_categories = settings.settings.categories
+            else:
+                tree_categories = categories
+            for category in tree_categories:
+                cat_dir = os.path.join(repo, category)
+                try:
+                    entries = os.listdir(cat_dir)
+                except OSError:
+                    continue
+                for name in entries:
+                    try:
+                        mtime = os.stat(os.path.join(cat_dir, name)).st_mtime
+                    except OSError:
+                        continue
+                    signatures.setdefault(category + '/' + name, []).append(
+                        (repo, name, mtime))
+    for cp in signatures:
+        signatures[cp] = tuple(sorted(signatures[cp]))
+    return signatures
+
 def get_installed_files(ebuild):
     """Get a list of installed files for an ebuild, assuming it has
     been installed."""
-    path = EPREFIX + "/var/db/pkg/" + ebuild + "/CONTENTS"
+    path = get_vdb_path() + "/" + ebuild + "/CONTENTS"
     files = []
     try:
         # hoping some clown won't use spaces in filenames ...
@@ -414,6 +580,44 @@ def get_installed_files(ebuild):
     files.sort()
     return files
 
+def get_installed_contents(cpv):
+    """Returns the list of files and symlinks installed by cpv,
+    read from its vdb CONTENTS.  Directories are left out, they
+    are shared by many packages."""
+    path = os.path.join(get_vdb_path(), cpv, "CONTENTS")
+    files = []
+    try:
+        _file = open(path, "r")
+        for line in _file:
+            kind, sep, rest = line.rstrip('\n').partition(' ')
+            if kind == 'obj':
+                # obj <path> <md5> <mtime>, the path may have spaces
+                files.append(rest.rsplit(' ', 2)[0])
+            elif kind == 'sym':
+                # sym <path> -> <target> <mtime>
+                files.append(rest.split(' -> ', 1)[0])
+        _file.close()
+    except IOError, e:
+        debug.dprint("PORTAGELIB: get_installed_contents(); failed to read %s: %s"
+            %(path, str(e)))
+    return files
+
+def get_installed_depends(cpv):
+    """Returns (USE flags, {'DEPEND': .., 'RDEPEND': .., 'PDEPEND': ..})
+    of an installed cpv, as it was merged"""
+    vardb = settings.trees[settings.settings["ROOT"]]["vartree"].dbapi
+    kinds = ["DEPEND", "RDEPEND", "PDEPEND"]
+    try:
+        values = vardb.aux_get(cpv, ["USE"] + kinds)
+    except KeyError:
+        debug.dprint("PORTAGELIB: get_installed_depends(); not installed: " + cpv)
+        return [], {}
+    return values[0].split(), dict(zip(kinds, values[1:]))
+
+def match_from_list(atom, cpvs):
+    """Returns the cpv's of the list that atom matches"""
+    return portage.match_from_list(str(atom), cpvs)
+
 # this is obsolete
 def get_property(ebuild, property):
     """Read a property of an ebuild. Returns a string."""
@@ -525,6 +729,35 @@ def get_size(mycpv):
     #debug.dprint( "PORTAGELIB: get_size; returning mysum[1] = " + mysum[1])
     return mysum[1]
 
+def get_distdir():
+    """Returns the directory the distfiles are fetched to"""
+    return settings.settings["DISTDIR"]
+
+def get_distfiles(cpv, use_flags):
+    """Returns a dictionary of distfile: size in bytes of the files cpv
+    fetches with use_flags set, the sizes from its Manifest.
+    A file missing from the Manifest has a size of 0."""
+    myebuild = settings.portdb.findname(cpv)
+    if not myebuild:
+        return {}
+    mf = manifest.Manifest(os.path.dirname(myebuild), settings.settings["DISTDIR"])
+    try:
+        if portage.VERSION >= '2.1.6':# newer portage
+            fetchlist = settings.portdb.getFetchMap(cpv, set(use_flags))
+        else:
+            fetchlist = settings.portdb.getfetchlist(cpv, mysettings=settings.settings, all=True)[1]
+    except Exception, e:
+        debug.dprint("PORTAGELIB: get_distfiles(); no fetch list for %s: %s" %(cpv, str(e)))
+        return {}
+    dist = mf.fhashdict.get("DIST", {})
+    sizes = {}
+    for name in fetchlist:
+        try:
+            sizes[name] = int(dist[name]["size"])
+        except (KeyError, ValueError):
+            sizes[name] = 0
+    return sizes
+
 def get_digest(ebuild): ## deprecated
     """Returns digest of an ebuild"""
     mydigest = settings.portdb.finddigest(ebuild)
@@ -561,6 +794,231 @@ def get_properties(ebuild):
         else: return Properties()
 
 
+def _parse_cache_lines(data):
+    """Returns a dictionary of KEY: value for the lines of an
+    md5-cache entry"""
+    values = {}
+    for line in data.splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            values[key] = value
+    return values
+
+def parse_cache_entry(data):
+    """Returns a Properties for the KEY=value lines of an
+    md5-cache entry"""
+    return _cache_properties(_parse_cache_lines(data))
+
+def _cache_properties(values):
+    """Returns a Properties for a _parse_cache_lines() dictionary"""
+    props = {}
+    for key, value in values.iteritems():
+        # skip the _md5_ and _eclasses_ validation keys
+        if not key.startswith('_'):
+            props[key.lower()] = value
+    return Properties(props)
+
+# path: (mtime, md5) of the eclasses, hashed once per change
+_eclass_md5s = {}
+
+def _file_md5(path):
+    """returns the hex md5 of the file at path"""
+    _file = open(path, "rb")
+    try:
+        return md5(_file.read()).hexdigest()
+    finally:
+        _file.close()
+
+def _eclass_md5(repo, name):
+    """returns the md5 of the eclass name an ebuild of repo inherits,
+    its own eclass dir first, then the main tree's, or None"""
+    for eclass_dir in [os.path.join(repo, "eclass"),
+            os.path.join(get_repo_paths()[0], "eclass")]:
+        path = os.path.join(eclass_dir, name + ".eclass")
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        cached = _eclass_md5s.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _eclass_md5s[path] = (mtime, _file_md5(path))
+        return cached[1]
+    return None
+
+def _cache_entry_valid(values, ebuild_path, repo):
+    """Validates a _parse_cache_lines() dictionary the way portage
+    does, against the md5 of the ebuild and of every eclass it
+    inherited.  mtimes are not enough, an eclass change does not
+    touch the ebuild."""
+    if values.get('_md5_') != _file_md5(ebuild_path):
+        return False
+    eclasses = values.get('_eclasses_')
+    eclasses = eclasses and eclasses.split('\t') or []
+    if len(eclasses) % 2:
+        return False
+    for pos in range(0, len(eclasses) - 1, 2):
+        if _eclass_md5(repo, eclasses[pos]) != eclasses[pos + 1]:
+            return False
+    return True
+
+def _read_cache_entries(repo, category, package, results, repos = None):
+    """Adds cpv: Properties for the ebuilds of one package in repo to
+    results, read straight from the repo's md5-cache.  An entry that is
+    missing or does not validate is added as cpv: None, to be read with
+    get_properties() if it is needed.  If given, repos gets cpv: repo."""
+    pkg_dir = os.path.join(repo, category, package)
+    try:
+        files = os.listdir(pkg_dir)
+    except OSError:
+        return
+    cache_dir = os.path.join(repo, "metadata", "md5-cache", category)
+    for name in files:
+        if not name.endswith('.ebuild'):
+            continue
+        pf = name[:-7]
+        props = None
+        try:
+            _file = open(os.path.join(cache_dir, pf), "rb")
+            values = _parse_cache_lines(_file.read())
+            _file.close()
+            if _cache_entry_valid(values, os.path.join(pkg_dir, name), repo):
+                props = _cache_properties(values)
+        except (IOError, OSError):
+            pass
+        results[category + '/' + pf] = props
+        if repos is not None:
+            repos[category + '/' + pf] = repo
+
+def get_package_properties(full_name):
+    """Returns a dictionary of cpv: Properties for all the ebuilds
+    of full_name in the main tree and overlays"""
+    category, package = full_name.split('/')
+    results = {}
+    # later repos override earlier ones, as in portage
+    for repo in get_repo_paths():
+        _read_cache_entries(repo, category, package, results)
+    # the others are read when they are asked for
+    for cpv in [cpv for cpv in results if results[cpv] is None]:
+        del results[cpv]
+    return results
+
+def get_category_properties(category, repos = None):
+    """Returns a dictionary of cpv: Properties for every ebuild
+    of category in the main tree and overlays, read in one pass.
+    The Properties of an ebuild without a valid md5-cache entry are
+    None, get_properties() reads them.  If given, repos gets
+    cpv: the repo path it was read from."""
+    results = {}
+    for repo in get_repo_paths():
+        try:
+            packages = os.listdir(os.path.join(repo, category))
+        except OSError:
+            continue
+        for package in packages:
+            _read_cache_entries(repo, category, package, results, repos)
+    return results
+
+def get_visible_best(full_name, cpvs, props, repos):
+    """Returns the best visible ebuild of full_name, like
+    get_best_ebuild(), from its ebuilds cpvs and their
+    get_category_properties() props and repos instead of an xmatch.
+    Falls back to get_best_ebuild() if an ebuild has no md5-cache
+    entry or this portage can not check them that way."""
+    visible = getattr(settings.portdb, '_visible', None)
+    if visible is None:
+        return get_best_ebuild(full_name)
+    try:
+        matches = []
+        for cpv in cpvs:
+            entry = props.get(cpv)
+            if entry is None:
+                return get_best_ebuild(full_name)
+            metadata = {'EAPI': entry.eapi or '0', 'SLOT': entry.slot,
+                'KEYWORDS': entry.keywords, 'LICENSE': entry.license,
+                'PROPERTIES': entry.properties, 'RESTRICT': entry.restrict,
+                'IUSE': entry.iuse,
+                'repository': settings.portdb.getRepositoryName(repos[cpv])}
+            if visible(cpv, metadata):
+                matches.append(cpv)
+    except Exception, e:
+        debug.dprint("PORTAGELIB: get_visible_best(); %s, using xmatch: %s"
+            %(full_name, str(e)))
+        return get_best_ebuild(full_name)
+    return best(matches)
+
+def iter_category_properties(categories = None):
+    """Yields (category, {cpv: Properties}) for each category,
+    one whole category at a time, see get_category_properties()"""
+    if categories is None:
+        categories = get_categories()
+    for category in categories:
+        yield category, get_category_properties(category)
+
+def group_versions(cpvs):
+    """Returns a dictionary of cat/pkg: [cpv,] for the cpvs"""
+    versions = {}
+    for cpv in cpvs:
+        parts = portage.pkgsplit(cpv)
+        if parts:
+            versions.setdefault(parts[0], []).append(cpv)
+    return versions
+
+def _latest_category_properties(category):
+    """Returns a dictionary of cat/pkg: Properties of the latest
+    ebuild for every package in category"""
+    props = get_category_properties(category)
+    versions = group_versions(props)
+    latest = {}
+    for full_name, cpvs in versions.iteritems():
+        cpv = best(cpvs)
+        latest[full_name] = props[cpv] or get_properties(cpv)
+    return latest
+
+def get_category_descriptions(category):
+    """Returns a dictionary of cat/pkg: DESCRIPTION of the latest
+    ebuild for every package in category"""
+    descriptions = {}
+    for full_name, props in _latest_category_properties(category).iteritems():
+        descriptions[full_name] = props.description
+    return descriptions
+
+def get_metadata_people(full_name):
+    """Returns (herds, maintainers) from the metadata.xml of full_name,
+    the last repo that has one wins.  A maintainer is "email name"."""
+    herds = []
+    maintainers = []
+    for repo in get_repo_paths():
+        path = os.path.join(repo, full_name, "metadata.xml")
+        if not os.path.exists(path):
+            continue
+        try:
+            metadata = parse_metadata(path)
+        except Exception, e:
+            debug.dprint("PORTAGELIB: get_metadata_people(); failed to parse %s: %s"
+                %(path, str(e)))
+            continue
+        herds = metadata.herds[:]
+        maintainers = [' '.join([m.get('email', ''), m.get('name', '')]).strip()
+            for m in metadata.maintainers]
+    return herds, maintainers
+
+def get_category_search_fields(category):
+    """Returns a dictionary of cat/pkg: {field: text} for every package
+    in category, with the DESCRIPTION, IUSE and HOMEPAGE of the latest
+    ebuild and the herds and maintainers from metadata.xml.
+    The fields are those of db.searchindex.FIELDS plus 'description'."""
+    fields = {}
+    for full_name, props in _latest_category_properties(category).iteritems():
+        herds, maintainers = get_metadata_people(full_name)
+        fields[full_name] = {
+            'description': props.description,
+            'use': ' '.join([flag.lstrip('+-') for flag in props.get_use_flags()]),
+            'homepage': props.homepage,
+            'herd': ' '.join(herds),
+            'maint': ' '.join(maintainers),
+        }
+    return fields
+
 def get_slot(ebuild):
     """Get the SLOT from the specified ebuild"""
     ebuild = str(ebuild) #just in case
@@ -580,6 +1038,35 @@ def get_slot(ebuild):
         else: return ''
 
 
+def get_description(ebuild):
+    """Get only the DESCRIPTION of the specified ebuild"""
+    ebuild = str(ebuild) #just in case
+    if settings.portdb.cpv_exists(ebuild): # if in portage tree
+        try:
+            return settings.portdb.aux_get(ebuild, ['DESCRIPTION'])[0]
+        except IOError, e: # Sync being performed may delete files
+            debug.dprint(" * PORTAGELIB: get_description(): IOError: %s" % str(e))
+            return ''
+        except Exception, e:
+            debug.dprint(" * PORTAGELIB: get_description(): Exception: %s" %str( e))
+            return ''
+    else:
+        vartree = settings.trees[settings.settings["ROOT"]]["vartree"]
+        if vartree.dbapi.cpv_exists(ebuild): # elif in installed pkg tree
+            return vartree.dbapi.aux_get(ebuild, ['DESCRIPTION'])[0]
+        else: return ''
+
+def get_package_description(full_name):
+    """Get the DESCRIPTION of the best visible, else the latest,
+    else the installed ebuild of full_name, without a Package"""
+    ebuild = (get_best_ebuild(full_name) or
+            best(get_versions(full_name)) or
+            best(get_installed(full_name)))
+    if not ebuild:
+        return ''
+    return get_description(ebuild)
+
+
 def get_virtual_dep(atom):
     """Returns the first (prefered) resolved virtual dependency
     if there is more than 1 possible resolution
@@ -647,20 +1134,26 @@ def get_metadata(cpv):
                 settings.portdir, get_full_name(cpv), "metadata.xml"))
         except: return None
 
+def get_system_atoms():
+    """Returns the atoms of the profile's system set"""
+    atoms = []
+    for x in settings.settings.packages:
+        atom = x.strip()
+        if len(atom) and atom[0] == "*":
+            atoms.append(atom[1:])
+    return atoms
+
 def get_system_pkgs(): # lifted from gentoolkit
     """Returns a tuple of lists, first list is resolved system packages,
     second is a list of unresolved packages."""
-    pkglist = settings.settings.packages
     resolved = []
     unresolved = []
-    for x in pkglist:
-        cpv = x.strip()
-        if len(cpv) and cpv[0] == "*":
-            pkg = find_best_match(cpv[1:])
-            if pkg:
-                resolved.append(get_full_name(pkg))
-            else:
-                unresolved.append(get_full_name(cpv))
+    for atom in get_system_atoms():
+        pkg = find_best_match(atom)
+        if pkg:
+            resolved.append(get_full_name(pkg))
+        else:
+            unresolved.append(get_full_name(atom))
     return (resolved + unresolved)
 
 
@@ -807,10 +1300,16 @@ class PortageSettings:
             except:
                 debug.dprint("PORTAGELIB: get_world(); Failed to locate the world file")
         self._world = world
+        # hashed copy for the per package in_world() checks
+        self._world_set = set(world)
 
     def get_world(self):
         return self._world
 
+    def in_world(self, full_name):
+        """Returns True if full_name is in the world file"""
+        return full_name in self._world_set
+
 settings = PortageSettings()
 
 IMPORT_DONE = True
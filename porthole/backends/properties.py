@@ -54,3 +54,10 @@ class Properties:
     def get_homepages(self):
         """Returns a list of strings."""
         return self.homepage.split()
+
+    def get_all_depends(self):
+        """Returns the DEPEND, RDEPEND, PDEPEND, BDEPEND and IDEPEND
+        strings joined, everything an emerge pulls in.  The last two
+        are empty with a portage that does not have them."""
+        return ' '.join([self.depend, self.rdepend, self.pdepend,
+            self.bdepend, self.idepend])
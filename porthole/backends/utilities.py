@@ -177,6 +177,17 @@ def get_reduced_flags(ebuild):
     #debug.dprint("BACKENDS Utilities: get_reduced_flags(); final ebuild_use_flags = %s" %str(ebuild_use_flags))
     return ebuild_use_flags
 
+def get_merge_flags(ebuild):
+    """Returns the USE flags ebuild would be merged with.  Unlike
+    get_reduced_flags() the IUSE defaults are included, and the
+    profile's package.use, use.force and use.mask if the backend
+    can tell"""
+    flags = portage_lib.get_final_use(ebuild)
+    if flags is None:
+        IUSE_defaults = flag_defaults(portage_lib.get_properties(ebuild).get_use_flags())
+        flags = reduce_flags(IUSE_defaults + get_reduced_flags(ebuild))
+    return flags
+
 def abs_flag(flag):
     if flag[0] in ["+","-"]:
         return flag[1:]
@@ -243,3 +254,65 @@ def filter_flags(myuse, use_expand_hidden, usemasked, useforced):
             myuse.remove(a)
     debug.dprint("BACKENDS Utilities:  filter_flags(); filtered myuse = " + str(myuse))
     return myuse
+
+def _nest_depends(tokens, pos = 0):
+    """nests the ( ) groups of a DEPEND token list,
+    returns (list of tokens and sub lists, position after the ')')"""
+    items = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            group, pos = _nest_depends(tokens, pos)
+            items.append(group)
+        elif token == ')':
+            break
+        else:
+            items.append(token)
+    return items, pos
+
+def _flatten(terms):
+    return [atom for term in terms for atom in term]
+
+def _depends_terms(items, use_flags, choose):
+    """returns a list of atom lists, one per term of items that
+    applies with use_flags"""
+    terms = []
+    pos = 0
+    while pos < len(items):
+        item = items[pos]
+        pos += 1
+        if isinstance(item, list):
+            terms.append(_flatten(_depends_terms(item, use_flags, choose)))
+        elif item.endswith('?'):
+            # a USE conditional, applies to the group following it
+            group = pos < len(items) and items[pos] or []
+            pos += 1
+            if item.startswith('!'):
+                wanted = item[1:-1] not in use_flags
+            else:
+                wanted = item[:-1] in use_flags
+            if wanted and isinstance(group, list):
+                terms.append(_flatten(_depends_terms(group, use_flags, choose)))
+        elif item == '||':
+            group = pos < len(items) and items[pos] or []
+            pos += 1
+            if isinstance(group, list):
+                alternatives = _depends_terms(group, use_flags, choose)
+                if alternatives:
+                    terms.append(choose(alternatives))
+        elif not item.startswith('!'): # blockers pull nothing in
+            terms.append([item])
+    return terms
+
+def reduce_depends(depends, use_flags, choose = None):
+    """Returns the flat list of atoms of a DEPEND string or token list
+    that apply with use_flags set.  Blockers are dropped, and of each
+    || ( ) group only the alternative choose(list of atom lists)
+    returns is kept, the first one by default."""
+    if isinstance(depends, basestring):
+        depends = depends.split()
+    if choose is None:
+        choose = lambda alternatives: alternatives[0]
+    items, pos = _nest_depends(depends)
+    return _flatten(_depends_terms(items, set(use_flags), choose))
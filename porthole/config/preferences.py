@@ -111,6 +111,8 @@ class PortholePreferences:
             ['vpane', 125],
             ['maximized', False],
             ['search_desc', False],
+            ['search_ranked', False],
+            ['search_top_k', 200],
             ['show_nag_dialog', True]
         ]
 
@@ -282,6 +284,18 @@ class PortholePreferences:
         #~ except XMLManagerError:
            #~ self.dbtotals = []
 
+        databaseoptions = [ \
+            ['parallel_scan', False],
+            ['scan_workers', 0],  # 0 = one per cpu
+        ]
+        self.database = OptionsClass()
+        for option, default in databaseoptions:
+            try:
+                value = dom.getitem(''.join(['/database/', option]))
+            except XMLManagerError:
+                value = default
+            setattr(self.database, option, value)
+
         self.plugins = OptionsClass()
 
         globaloptions = [ \
@@ -384,6 +398,8 @@ class PortholePreferences:
         dom.additem('/window/main/vpane', self.main.vpane)
         dom.additem('/window/main/maximized', self.main.maximized)
         dom.additem('/window/main/search_desc', self.main.search_desc)
+        dom.additem('/window/main/search_ranked', self.main.search_ranked)
+        dom.additem('/window/main/search_top_k', self.main.search_top_k)
         dom.additem('/window/main/show_nag_dialog', self.main.show_nag_dialog)
         dom.additem('/window/process/width', self.process.width)
         dom.additem('/window/process/height', self.process.height)
@@ -429,6 +445,8 @@ class PortholePreferences:
         dom.additem('/summary/showlicense', self.summary.showlicense)
         dom.additem('/summary/showurl', self.summary.showurl)
         dom.additem('/database/size', self.database_size)
+        dom.additem('/database/parallel_scan', self.database.parallel_scan)
+        dom.additem('/database/scan_workers', self.database.scan_workers)
         #debug.dprint("PREFS: save(); self.dbtime = %d" %self.dbtime)
         #dom.additem('/database/dbtime', self.dbtime)
         #dom.additem('/database/dbtotals', self.dbtotals)
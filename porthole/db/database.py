@@ -26,14 +26,22 @@ import datetime
 _id = datetime.datetime.now().microsecond
 print "DATABASE: id initialized to ", _id
 
-import pwd, cPickle, os
+import pwd, os
 import gobject
 
 from porthole.db.package import Package
 from porthole import backends
 portage_lib = backends.portage_lib
-from porthole.db.dbreader import DatabaseReader
+from porthole.db.dbreader import DatabaseReader, DatabaseRefresher
+from porthole.db.snapshot import save_snapshot
+from porthole.db.descstore import save_store, load_store
+from porthole.db.searchindex import save_index, load_index
+from porthole.db.vdbwatcher import VdbWatcher
+from porthole.db.fileindex import FileIndexReader, IndexSaver
+from porthole.db.revdepindex import RevDepIndexReader
 from porthole.readers.descriptions import DescriptionReader
+from porthole.readers.prefetch import PrefetchReader
+from porthole.readers.closure import DepClosure, ClosureReader
 from porthole.db.dbbase import DBBase
 from porthole.utils.dispatcher import Dispatcher
 from porthole.backends.utilities import get_sync_info
@@ -47,6 +55,10 @@ NEW = 0
 LOAD = 1
 SAVE = 2
 
+# ms after the last merge or unmerge the installed file and reverse
+# dependency indexes are saved
+INDEX_SAVE_DELAY = 30000
+
 
 class Database(DBBase):
     def __init__(self, action):
@@ -59,15 +71,43 @@ class Database(DBBase):
         self.db_init_new_sync = False
         self.db_thread = None
         self.callback = None
+        self.installed_callback = None
+        self.vdb_watcher = None
+        # cat/pkg's merged or unmerged while the db thread was running
+        self.vdb_pending = set()
+        # db.fileindex.FileIndex of the installed files, once it is read
+        self.file_index = None
+        self.file_index_thread = None
+        self.file_index_stale = False
+        # db.revdepindex.RevDepIndex of the installed packages
+        self.revdep_index = None
+        self.revdep_index_thread = None
+        self.revdep_index_stale = False
+        # callback()'s to run once the index is loaded
+        self.revdep_callbacks = []
+        # gobject source id of the pending save of the indexes
+        self.index_save_id = None
+        self.index_saver = None
+        # readers.closure.DepClosure, its per ebuild results are shared
+        # by the closures until the tree or the installed packages change
+        self.dep_closure = None
         self.desc_callback = None
         self.desc_thread = None
         ## get home directory
         ##home = pwd.getpwuid(os.getuid())[5]
         self._DBFile = EPREFIX + "/var/db/porthole/descriptions.db"
+        self._IndexFile = EPREFIX + "/var/db/porthole/search.idx"
+        # trigram index of the names and descriptions for searches
+        self.search_index = None
+        self.index_table = None
         self.valid_sync = False #used for auto-reload disabling
         ##del home
         #if action == NEW:
         self.dispatcher = Dispatcher(self.db_update)
+        self.prefetch_dispatcher = Dispatcher(self.prefetch_done)
+        self.file_index_dispatcher = Dispatcher(self.file_index_done)
+        self.revdep_index_dispatcher = Dispatcher(self.revdep_index_done)
+        self.closure_dispatcher = Dispatcher(self.closure_done)
         self.db_init()
         #if action == LOAD:
             #result = self.load()
@@ -92,9 +132,9 @@ class Database(DBBase):
             debug.dprint("DATABASE: get_package(); exception occured: " + str(e))
             return None
 
-    def update_package(self, fullname):
+    def update_package(self, full_name):
         """Update the package info in the full list and the installed list"""
-        #category, name = fullname.split("/")
+        #category, name = full_name.split("/")
         category = portage_lib.get_category(full_name)
         name = portage_lib.get_name(full_name)
         if (category in self.categories and name in self.categories[category]):
@@ -102,42 +142,295 @@ class Database(DBBase):
         if (category in self.installed and name in self.installed[category]):
             self.installed[category][name].update_info()
 
+    def prefetch(self, packages, fields, callback = None, batch_callback = None):
+        """Fill the caches of fields (see readers.prefetch.FIELDS)
+        for the Packages in packages, in that order, in a separate
+        thread.  callback(reader) is called in the gtk thread when done,
+        batch_callback(reader, count) each time the first count
+        packages are filled.
+        Returns the reader so the caller can cancel it."""
+        reader = PrefetchReader(packages, fields, callback,
+            self.prefetch_dispatcher, batch_callback)
+        reader.start()
+        return reader
+
+    def prefetch_done(self, reader, count = None):
+        """dispatcher callback, a prefetch has filled count packages
+        or has finished if count is None"""
+        if count is not None:
+            if reader.batch_callback and not reader.cancelled:
+                reader.batch_callback(reader, count)
+            return
+        reader.join()
+        if reader.callback and not reader.cancelled:
+            reader.callback(reader)
+
+    def get_closure(self, cpv, use_flags = None, callback = None):
+        """Find the not yet installed ebuilds an emerge of cpv, with
+        use_flags or the configured ones, pulls in and their download
+        size in a separate thread.  callback(closure) is called in the
+        gtk thread with the readers.closure.Closure when done.
+        Returns the reader so the caller can cancel it."""
+        if self.dep_closure is None:
+            self.dep_closure = DepClosure()
+        reader = ClosureReader(self.dep_closure, cpv, use_flags, callback,
+            self.closure_dispatcher)
+        reader.start()
+        return reader
+
+    def closure_done(self, reader):
+        """dispatcher callback, a closure has been computed"""
+        reader.join()
+        if reader.callback and not reader.cancelled:
+            reader.callback(reader.closure)
+
     def update(self, pkg):
         """callback function to update an individual package
             after a successfull install action was detected"""
-        raise NotImplemented
+        self.update_installed([pkg])
+
+    def update_installed(self, packages):
+        """Refresh the installed state of the cat/pkg's in packages.
+        Patches installed, installed_count and installed_pkg_count
+        in place and only resets the caches of those packages"""
+        list_changed = False
+        for full_name in packages:
+            category = portage_lib.get_category(full_name)
+            name = portage_lib.get_name(full_name)
+            package = self.get_package(full_name)
+            is_installed = portage_lib.get_installed(full_name) != []
+            if package is None:
+                if not is_installed:
+                    continue
+                # installed from somewhere other than the tree
+                package = Package(full_name)
+                package.deprecated = True
+                self.categories.setdefault(category, {})[name] = package
+                self.pkg_count[category] = self.pkg_count.get(category, 0) + 1
+                self.list.append((name, package))
+                self.deprecated_list.append(full_name)
+                list_changed = True
+            elif package.deprecated and not is_installed:
+                # gone from both the tree and the vdb
+                del self.categories[category][name]
+                self.pkg_count[category] -= 1
+                if not self.categories[category]:
+                    del self.categories[category]
+                    del self.pkg_count[category]
+                self.list.remove((name, package))
+                if full_name in self.deprecated_list:
+                    self.deprecated_list.remove(full_name)
+            package.reset_installed()
+            was_installed = (category in self.installed and
+                name in self.installed[category])
+            if is_installed and not was_installed:
+                self.installed.setdefault(category, {})[name] = package
+                self.installed_pkg_count[category] = \
+                    self.installed_pkg_count.get(category, 0) + 1
+                self.installed_count += 1
+            elif was_installed and not is_installed:
+                del self.installed[category][name]
+                self.installed_pkg_count[category] -= 1
+                self.installed_count -= 1
+                if not self.installed[category]:
+                    del self.installed[category]
+                    del self.installed_pkg_count[category]
+        if list_changed:
+            self.list = self.db_thread.sort(self.list)
+            self.deprecated_list.sort()
+
+    def set_installed_callback(self, callback):
+        self.installed_callback = callback
+
+    def vdb_changed(self, added, removed):
+        """VdbWatcher callback, cpv's were merged or unmerged"""
+        if self.file_index is not None:
+            self.file_index.update(added, removed)
+        elif self.file_index_thread:
+            # it may have read the vdb before the change
+            self.file_index_stale = True
+        if self.revdep_index is not None:
+            self.revdep_index.update(added, removed)
+        elif self.revdep_index_thread:
+            self.revdep_index_stale = True
+        if self.file_index is not None or self.revdep_index is not None:
+            self.schedule_index_save()
+        # the running closures keep the old one
+        self.dep_closure = None
+        packages = set([portage_lib.extract_package(cpv)
+            for cpv in added + removed])
+        packages.discard(None)
+        if self.db_thread_running:
+            # the running reader may have read the vdb before the
+            # change, apply it once the reader's db is in place
+            debug.dprint("DATABASE: vdb_changed(); queued packages: " + str(packages))
+            self.vdb_pending.update(packages)
+            return
+        debug.dprint("DATABASE: vdb_changed(); packages: " + str(packages))
+        self.apply_installed(packages)
+
+    def apply_installed(self, packages):
+        """Update the db and the views for the cat/pkg's in packages
+        that were merged or unmerged"""
+        # merges may have added to the world file
+        portage_lib.settings.reload_world()
+        self.update_installed(packages)
+        if self.installed_callback:
+            self.installed_callback(packages)
+
+    def load_file_index(self):
+        """loads the installed file index in a thread, if it is not
+        already loaded or loading"""
+        if self.file_index or self.file_index_thread:
+            return
+        self.file_index_thread = FileIndexReader(self.file_index_dispatcher)
+        self.file_index_thread.start()
+
+    def file_index_done(self, reader):
+        """dispatcher callback, the installed file index is read"""
+        reader.join()
+        self.file_index_thread = None
+        if reader.cancelled:
+            return
+        self.file_index = reader.index
+        if self.file_index_stale:
+            self.file_index_stale = False
+            if self.file_index.refresh():
+                self.schedule_index_save()
+
+    def schedule_index_save(self):
+        """saves the loaded installed file and reverse dependency
+        indexes INDEX_SAVE_DELAY ms after the last call, so a run of
+        merges is saved once"""
+        if self.index_save_id:
+            gobject.source_remove(self.index_save_id)
+        self.index_save_id = gobject.timeout_add(INDEX_SAVE_DELAY,
+            self.save_indexes)
+
+    def save_indexes(self):
+        """timeout callback, saves the loaded indexes in a thread"""
+        self.index_save_id = None
+        if self.index_saver and self.index_saver.isAlive():
+            # one save at a time, they write the same files
+            self.schedule_index_save()
+            return False
+        indexes = [index for index in (self.file_index, self.revdep_index)
+            if index is not None]
+        if indexes:
+            debug.dprint("DATABASE: save_indexes(); saving %d indexes" %len(indexes))
+            self.index_saver = IndexSaver(indexes)
+            self.index_saver.start()
+        return False # will not be called again
+
+    def get_owners(self, path):
+        """Returns the list of installed cpv's that own path,
+        or None if the file index is not loaded yet"""
+        if self.file_index is None:
+            self.load_file_index()
+            return None
+        return self.file_index.get_owners(path)
+
+    def find_installed_files(self, pattern):
+        """Returns a sorted list of (path, [cpv's]) for the installed
+        paths under pattern, which may have shell wildcards,
+        or None if the file index is not loaded yet"""
+        if self.file_index is None:
+            self.load_file_index()
+            return None
+        return self.file_index.find(pattern)
+
+    def get_file_collisions(self, paths = None):
+        """Returns a dictionary of path: [cpv's] of the paths installed
+        by more than one package (or of those among paths that are
+        installed), or None if the file index is not loaded yet"""
+        if self.file_index is None:
+            self.load_file_index()
+            return None
+        return self.file_index.get_collisions(paths)
+
+    def load_revdep_index(self):
+        """loads the reverse dependency index in a thread, if it is not
+        already loaded or loading"""
+        if self.revdep_index or self.revdep_index_thread:
+            return
+        self.revdep_index_thread = RevDepIndexReader(self.revdep_index_dispatcher)
+        self.revdep_index_thread.start()
+
+    def revdep_index_done(self, reader):
+        """dispatcher callback, the reverse dependency index is read"""
+        reader.join()
+        self.revdep_index_thread = None
+        if reader.cancelled:
+            return
+        self.revdep_index = reader.index
+        if self.revdep_index_stale:
+            self.revdep_index_stale = False
+            if self.revdep_index.refresh():
+                self.schedule_index_save()
+        for callback in self.revdep_callbacks[:]:
+            callback()
+
+    def add_revdep_callback(self, callback):
+        """callback() is run when the reverse dependency index is loaded"""
+        self.revdep_callbacks.append(callback)
+
+    def remove_revdep_callback(self, callback):
+        """stops running callback() when the index is loaded"""
+        if callback in self.revdep_callbacks:
+            self.revdep_callbacks.remove(callback)
+
+    def get_reverse_depends(self, name):
+        """Returns a sorted list of (installed cpv, kind, atom) of the
+        installed packages that depend on name, a cat/pkg or a cpv,
+        or None if the reverse dependency index is not loaded yet"""
+        if self.revdep_index is None:
+            self.load_revdep_index()
+            return None
+        return self.revdep_index.get_dependents(name)
 
     def save(self):
-        """saves the db to a file"""
+        """saves the descriptions to a file"""
         if self.valid_sync and self.desc_reloaded:
             sync_time, self.valid_sync = get_sync_info()
-            _db = {'sync_date': sync_time, 'descriptions': self.descriptions}
-            debug.dprint("DATABASE: save(); Pickling 'db' to file: " + self._DBFile)
-            # pickle it baby, yeah!
-            cPickle.dump(_db, open(self._DBFile, "w"))
-            del _db
+            debug.dprint("DATABASE: save(); saving descriptions to file: " + self._DBFile)
+            if save_store(self.descriptions, sync_time, self._DBFile):
+                # swap the in memory dict for the mapped file
+                store = load_store(self._DBFile)
+                if store is not None:
+                    self.descriptions = store
+                    self.desc_reloaded = False
+            if self.index_table and save_index(self.index_table, sync_time,
+                    self._IndexFile):
+                self.index_table = None
+                self.search_index = load_index(self._IndexFile)
 
     def load(self, filename = None):
-        """restores the db from a file"""
-        debug.dprint("DATABASE: load() loading 'db' from file: " + self._DBFile)
-        _db = None
+        """maps the saved descriptions file, they are read on demand"""
+        debug.dprint("DATABASE: load() loading descriptions from file: " + self._DBFile)
         current, self.valid_sync = get_sync_info()
-        if self.valid_sync and os.access(self._DBFile, os.F_OK):
-            _db = cPickle.load(open(self._DBFile))
-        elif not self.valid_sync:
+        if not self.valid_sync:
             debug.dprint("DATABASE: load(); Current portage tree did Not return a valid sync timestamp, not loading descriptions from the saved file" )
             return -1
-        else:
-            debug.dprint("DATABASE: load(); file does not exist :" + self._DBFile)
+        store = load_store(self._DBFile)
+        if store is None:
             return -1
-        if self.valid_sync and _db['sync_date'] != current:
-            debug.dprint("DATABASE: load(); 'db' is out of date")
+        if store.sync_date != current:
+            debug.dprint("DATABASE: load(); descriptions are out of date")
+            store.close()
             return -2
-        self.descriptions = _db['descriptions']
+        self.search_index = load_index(self._IndexFile)
+        if self.search_index and self.search_index.sync_date != current:
+            debug.dprint("DATABASE: load(); search index is out of date")
+            self.search_index.close()
+            self.search_index = None
+        if self.search_index is None:
+            # the field searches need it, read everything again
+            store.close()
+            return -2
+        self.descriptions = store
         self.desc_loaded = True
         self.desc_mtime = os.stat(self._DBFile).st_mtime
         debug.dprint("DATABASE: load(); file is loaded, mtime = " + str(self.desc_mtime))
-        del _db
         return 1
 
 
@@ -152,12 +445,34 @@ class Database(DBBase):
             self.db_init_new_sync = new_sync
         else:
             self.db_thread_running = True
-            self.db_thread = DatabaseReader(self.dispatcher)
+            if new_sync and self.list:
+                # only add, remove and invalidate what the sync changed
+                self.db_thread = DatabaseRefresher(self.dispatcher, self)
+            else:
+                # a new sync always invalidates the saved snapshot
+                self.db_thread = DatabaseReader(self.dispatcher, not new_sync,
+                        self.scan_workers())
             self.db_thread.start()
             self.db_init_new_sync = False
             if new_sync:
                 # force a reload
                 self.desc_loaded = False
+                self.search_index = None
+                self.dep_closure = None
+
+    def scan_workers(self):
+        """Returns the number of worker processes to scan the tree,
+        read the descriptions and check for upgrades with"""
+        if not config.Prefs.database.parallel_scan:
+            return 0
+        workers = config.Prefs.database.scan_workers
+        if workers < 1:
+            try:
+                import multiprocessing
+                workers = multiprocessing.cpu_count()
+            except (ImportError, NotImplementedError):
+                workers = 0
+        return workers
 
     def db_update(self, args):# extra args for dispatcher callback
         """Update the callback to the number of packages read."""
@@ -177,6 +492,18 @@ class Database(DBBase):
         elif self.db_thread.cancelled:
             self.db_thread.join()
             self.db_thread_running = False
+            if not self.db_init_waiting:
+                self.apply_vdb_pending()
+        elif isinstance(self.db_thread, DatabaseRefresher):
+            self.db_thread.join()
+            self.db_thread_running = False
+            # patch the db first so the views see the changes
+            self.apply_delta(self.db_thread.delta)
+            save_snapshot(self, self.db_thread.key)
+            if self.callback:
+                self.callback(args)
+            self.apply_vdb_pending()
+            self.load_descriptions()
         else: # args["done"] == True - db_thread is done
             self.db_thread_running = False
             if self.callback:
@@ -194,21 +521,90 @@ class Database(DBBase):
             self.installed_count = self.db.installed_count
             self.pkg_count = self.db.pkg_count
             self.installed_pkg_count = self.db.installed_pkg_count
+            self.deprecated_list = self.db.deprecated_list
+            self.cache_signatures = self.db.cache_signatures
             del self.db  # clean up
             debug.dprint("DATABASE: db_update(); db is updated")
+            if self.vdb_watcher:
+                self.vdb_watcher.stop()
+            # start with a fresh view of the vdb matching the new db
+            self.vdb_watcher = VdbWatcher(self.vdb_changed)
+            self.vdb_watcher.start()
+            self.apply_vdb_pending()
+            self.load_file_index()
+            self.load_revdep_index()
             self.load_descriptions()
         if self.db_init_waiting:
             self.db_init_waiting = False
             self.db_init(self.db_init_new_sync)
         return
 
+    def apply_vdb_pending(self):
+        """Apply the merges and unmerges queued while the db thread
+        was running"""
+        if not self.vdb_pending or not self.list:
+            return
+        packages, self.vdb_pending = self.vdb_pending, set()
+        debug.dprint("DATABASE: apply_vdb_pending(); packages: " + str(packages))
+        self.apply_installed(packages)
+
+    def apply_delta(self, delta):
+        """Patch the database in place with the changes found
+        by a DatabaseRefresher"""
+        if not delta:
+            return
+        debug.dprint("DATABASE: apply_delta(); %d added, %d removed, %d changed"
+            %(len(delta['added']), len(delta['removed']), len(delta['changed'])))
+        tree = delta['tree']
+        installed = delta['installed']
+        for full_name in delta['removed']:
+            category, name = full_name.split('/')
+            for _dict in [self.categories, self.installed]:
+                if category in _dict and name in _dict[category]:
+                    del _dict[category][name]
+        for full_name, data in delta['added'].iteritems():
+            category, name = full_name.split('/')
+            self.categories.setdefault(category, {})[name] = data
+            if full_name in installed:
+                self.installed.setdefault(category, {})[name] = data
+        for full_name in delta['changed']:
+            category, name = full_name.split('/')
+            data = self.categories[category][name]
+            data.reset()
+            data.deprecated = full_name not in tree
+            if full_name in installed:
+                self.installed.setdefault(category, {})[name] = data
+            elif category in self.installed and name in self.installed[category]:
+                del self.installed[category][name]
+        # drop emptied categories and recount
+        for _dict in [self.categories, self.installed]:
+            for category in _dict.keys():
+                if not _dict[category]:
+                    del _dict[category]
+        self.pkg_count = {}
+        for category in self.categories:
+            self.pkg_count[category] = len(self.categories[category])
+        self.installed_pkg_count = {}
+        self.installed_count = 0
+        for category in self.installed:
+            self.installed_pkg_count[category] = len(self.installed[category])
+            self.installed_count += self.installed_pkg_count[category]
+        if delta['added'] or delta['removed']:
+            _list = []
+            for category in self.categories:
+                _list.extend(self.categories[category].items())
+            self.list = self.db_thread.sort(_list)
+        self.deprecated_list = [data.full_name for name, data in self.list
+            if data.deprecated]
+        self.cache_signatures = delta['signatures']
+
     def load_descriptions(self):
         if not self.desc_loaded:
             #try loading from the db file
             result = self.load()
             if result < 0:
                 # create a new db
-                self.desc_thread = DescriptionReader(self.list)
+                self.desc_thread = DescriptionReader(self.list, self.scan_workers())
                 self.desc_thread.start()
                 gobject.timeout_add(100, self.desc_thread_update)
 
@@ -231,6 +627,10 @@ class Database(DBBase):
         if self.desc_thread.done:
             # grab the db
             self.descriptions = self.desc_thread.descriptions
+            self.index_table = self.desc_thread.index_table
+            if self.index_table:
+                # the index for the new descriptions is saved next
+                self.search_index = None
             if not self.desc_thread.cancelled:
                 self.desc_loaded = True
                 self.desc_reloaded = True
@@ -38,3 +38,5 @@ class DBBase(object):
         self.pkg_count = {}
         self.installed_pkg_count = {}
         self.depricated_list = []
+        # cat/pkg: md5-cache signature, used to detect changed packages
+        self.cache_signatures = {}
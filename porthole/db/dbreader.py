@@ -27,10 +27,17 @@ print "DBREADER: import id initialized to ", id
 
 import threading, os
 
+try:
+    import multiprocessing
+    HAS_MULTIPROCESSING = True
+except ImportError:
+    HAS_MULTIPROCESSING = False
+
 from porthole.utils import debug
 from porthole.db.package import Package
 from porthole.db.dbbase import DBBase
 from porthole.backends import portage_lib as PMS_LIB
+from porthole.db.snapshot import get_snapshot_key, load_snapshot, save_snapshot
 
 #~ # establish a semaphore for the Database
 #~ Installed_Semaphore = threading.Semaphore()
@@ -41,10 +48,47 @@ from porthole.backends import portage_lib as PMS_LIB
 #~ Installed_Semaphore.release()
 
 
+def valid_node(category, name):
+    """returns False for getallnodes() entries that are not packages"""
+    if category in ["metadata", "distfiles", "eclass"]:
+        return False
+    # why does getallnodes() return timestamps?
+    if (name.endswith('tbz2') or \
+            name.startswith('.') or \
+            name in ['timestamp.x', 'metadata.xml', 'CVS'] ):
+        return False
+    return True
+
+# the installed cat/pkg's, set in each worker process by init_worker()
+_worker_installed = frozenset()
+
+def init_worker(installed):
+    """Pool initializer for the parallel tree scan"""
+    global _worker_installed
+    _worker_installed = installed
+
+def scan_category(category):
+    """Worker process function for the parallel tree scan.
+    Returns a (category, records, signatures, error) tuple for one
+    category.  records has a (name, installed, in_world) tuple for each
+    valid package, so all the parent has to do is wrap them"""
+    try:
+        records = []
+        in_world = PMS_LIB.settings.in_world
+        for entry in PMS_LIB.get_category_nodes(category):
+            name = entry.split('/')[1]
+            if valid_node(category, name):
+                records.append((name, entry in _worker_installed, in_world(entry)))
+        signatures = PMS_LIB.get_cache_signatures([category])
+    except OSError, e:
+        return (category, (), {}, str(e))
+    return (category, tuple(records), signatures, '')
+
+
 class DatabaseReader(threading.Thread):
     """Builds the database in a separate thread."""
 
-    def __init__(self, callback):
+    def __init__(self, callback, use_snapshot = True, workers = 0):
         threading.Thread.__init__(self)
         self.setDaemon(1)     # quit even if this thread is still running
         self.id = datetime.datetime.now().microsecond
@@ -61,8 +105,15 @@ class DatabaseReader(threading.Thread):
         self.cancelled = False
         #self.new_installed_Semaphore = threading.Semaphore()
         self.installed_list = None
+        self.installed_set = set()
         self.allnodes_length = 0  # used for calculating the progress bar
         self.world = PMS_LIB.settings.get_world()
+        # load the index from the saved snapshot if it is still valid
+        self.use_snapshot = use_snapshot
+        # number of processes to scan the tree with, 0 or 1 scans
+        # it in this thread
+        self.workers = workers
+        self.pool = None
 
     def please_die(self):
         """ Tell the thread to die """
@@ -76,32 +127,19 @@ class DatabaseReader(threading.Thread):
         """Read portage's database and store it nicely"""
         debug.dprint("DBREADER: read_db(); process id = %d *****************" %(os.getpid()))
 
+        key = get_snapshot_key()
+        if self.use_snapshot and self.read_snapshot(key):
+            return
         self.get_installed()
-        try:
-            debug.dprint("DBREADER: read_db(); getting allnodes package list")
-            allnodes = PMS_LIB.get_allnodes()
-            debug.dprint("DBREADER: read_db(); Done getting allnodes package list")
-        except OSError, e:
-            # I once forgot to give read permissions
-            # to an ebuild I created in the portage overlay.
-            self.error = str(e)
+        if self.workers > 1 and HAS_MULTIPROCESSING:
+            tree = self.scan_parallel()
+        else:
+            tree = self.scan()
+        if tree is None:
             return
-        self.allnodes_length = len(allnodes)
-        debug.dprint("DBREADER: read_db() create internal porthole list; length=%d" %self.allnodes_length)
-        #dsave("db_allnodes_cache", allnodes)
-        debug.dprint("DBREADER: read_db(); Threading info: %s" %str(threading.enumerate()) )
         count = 0
-        for entry in allnodes:
-            if self.cancelled: self.done = True; return
-            if count == 250:  # update the statusbar
-                self.nodecount += count
-                #debug.dprint("DBREADER: read_db(); count = %d" %count)
-                self.callback({"nodecount": self.nodecount, "allnodes_length": self.allnodes_length,
-                                "done": self.done, 'db_thread_error': self.error})
-                count = 0
-            count += self.add_pkg(entry)
         # now time to add any remaining installed packages not in the portage tree
-        self.db.deprecated_list = self.installed_list[:]
+        self.db.deprecated_list = sorted(self.installed_set.difference(tree))
         #debug.dprint("DBREADER: read_db(); deprecated installed packages = " + str(self.db.deprecated_list))
         for entry in self.db.deprecated_list:  # remaining installed packages no longer in the tree
             if self.cancelled: self.done = True; return
@@ -122,20 +160,126 @@ class DatabaseReader(threading.Thread):
         self.db.list = self.sort(self.db.list)
         #debug.dprint(self.db)
         debug.dprint("DBREADER: read_db(); end of sort, finished")
+        save_snapshot(self.db, key)
+
+    def scan(self):
+        """Read the tree in this thread and add its packages.
+        Returns the allnodes list or None on error or cancel"""
+        try:
+            debug.dprint("DBREADER: scan(); getting allnodes package list")
+            allnodes = PMS_LIB.get_allnodes()
+            debug.dprint("DBREADER: scan(); Done getting allnodes package list")
+        except OSError, e:
+            # I once forgot to give read permissions
+            # to an ebuild I created in the portage overlay.
+            self.error = str(e)
+            return None
+        self.allnodes_length = len(allnodes)
+        debug.dprint("DBREADER: scan() create internal porthole list; length=%d" %self.allnodes_length)
+        #dsave("db_allnodes_cache", allnodes)
+        debug.dprint("DBREADER: scan(); Threading info: %s" %str(threading.enumerate()) )
+        count = 0
+        for entry in allnodes:
+            if self.cancelled: self.done = True; return None
+            if count == 250:  # update the statusbar
+                self.nodecount += count
+                #debug.dprint("DBREADER: scan(); count = %d" %count)
+                self.callback({"nodecount": self.nodecount, "allnodes_length": self.allnodes_length,
+                                "done": self.done, 'db_thread_error': self.error})
+                count = 0
+            count += self.add_pkg(entry)
+        self.nodecount += count
+        self.db.cache_signatures = PMS_LIB.get_cache_signatures()
+        return allnodes
+
+    def scan_parallel(self):
+        """Read the tree with a pool of worker processes, one category
+        at a time, and add the packages as the categories come back.
+        The workers don't share the GIL with the gui.
+        Returns the set of tree nodes or None on error or cancel"""
+        categories = PMS_LIB.get_tree_categories()
+        debug.dprint("DBREADER: scan_parallel(); scanning %d categories with %d workers"
+                %(len(categories), self.workers))
+        tree = set()
+        self.db.cache_signatures = {}
+        try:
+            self.pool = multiprocessing.Pool(self.workers, init_worker,
+                (frozenset(self.installed_set),))
+            results = self.pool.imap_unordered(scan_category, categories)
+            done = 0
+            for category, records, signatures, error in results:
+                if self.cancelled: break
+                if error:
+                    self.error = error
+                    break
+                self.db.cache_signatures.update(signatures)
+                self.nodecount += self.add_category(category, records, tree)
+                done += 1
+                # the total is not known until all categories are in
+                self.allnodes_length = self.nodecount * len(categories) // done
+                self.callback({"nodecount": self.nodecount, "allnodes_length": self.allnodes_length,
+                                "done": self.done, 'db_thread_error': self.error})
+        finally:
+            if self.pool:
+                if self.cancelled or self.error:
+                    self.pool.terminate()
+                else:
+                    self.pool.close()
+                self.pool.join()
+                self.pool = None
+        if self.cancelled: self.done = True; return None
+        if self.error:
+            return None
+        return tree
+
+    def read_snapshot(self, key):
+        """Rebuild the database from a saved snapshot.
+        Returns False if there is no valid snapshot for key"""
+        snapshot = load_snapshot(key)
+        if snapshot is None:
+            return False
+        nodes, installed, self.db.cache_signatures = snapshot
+        debug.dprint("DBREADER: read_snapshot(); loading %d nodes" %len(nodes))
+        installed = set(installed)
+        self.installed_count = len(installed)
+        self.allnodes_length = len(nodes)
+        count = 0
+        for full_name, deprecated in nodes:
+            if self.cancelled: self.done = True; return True
+            if count == 250:  # update the statusbar
+                self.nodecount += count
+                self.callback({"nodecount": self.nodecount, "allnodes_length": self.allnodes_length,
+                                "done": self.done, 'db_thread_error': self.error})
+                count = 0
+            category, name = full_name.split('/')
+            data = self.add_node(full_name, category, name, deprecated,
+                    full_name in installed)
+            self.db.list.append((data.name, data))
+            count += 1
+        self.nodecount += count
+        self.db.deprecated_list = [full_name for full_name, deprecated in nodes if deprecated]
+        # the snapshot list is saved in sorted order, no need to sort again
+        debug.dprint("DBREADER: read_snapshot(); finished, nodecount = %d" %self.nodecount)
+        return True
 
     def add_pkg(self, entry, deprecated = False):
             #debug.dprint("DBREADER: add_pkg(); entry = %s" %entry)
             category, name = entry.split('/')
-            if category in ["metadata", "distfiles", "eclass"]:
-                return 0
-            # why does getallnodes() return timestamps?
-            if (name.endswith('tbz2') or \
-                    name.startswith('.') or \
-                    name in ['timestamp.x', 'metadata.xml', 'CVS'] ):
+            if not valid_node(category, name):
                 return 0
+            if self.cancelled: self.done = True; return 0
+            data = self.add_node(entry, category, name, deprecated,
+                    entry in self.installed_set)
+            self.db.list.append((data.name, data))
+            return 1
+
+    def add_node(self, entry, category, name, deprecated, installed):
+            """create the Package for entry and add it to the
+            categories, installed and count structures"""
             data = Package(entry)
             data.deprecated = deprecated
-            if self.cancelled: self.done = True; return 0
+            # share the package's interned strings
+            category, name = data.category, data.name
             #self.db.categories.setdefault(category, {})[name] = data;
             # look out for segfaults
             if category not in self.db.categories:
@@ -143,7 +287,7 @@ class DatabaseReader(threading.Thread):
                 self.db.pkg_count[category] = 0
                 #debug.dprint("DBREADER: add_pkg(); added category %s" % str(category))
             self.db.categories[category][name] = data
-            if entry in self.installed_list:
+            if installed:
                 if category not in self.db.installed:
                     self.db.installed[category] = {}
                     self.db.installed_pkg_count[category] = 0
@@ -151,18 +295,44 @@ class DatabaseReader(threading.Thread):
                 self.db.installed[category][name] = data
                 self.db.installed_pkg_count[category] += 1
                 self.db.installed_count += 1
-                #debug.dprint("DBREADER: add_pkg(); adding %s to db.list" %name)
-                # remove entry from installed list since it has been added to the db
-                self.installed_list.remove(entry)
-            self.db.list.append((name, data))
             self.db.pkg_count[category] += 1
-            return 1
+            return data
+
+    def add_category(self, category, records, tree):
+            """wrap the scan_category() records of category in Packages,
+            add them like add_node() does and their names to tree.
+            Returns the number added"""
+            if not records:
+                return 0
+            category = intern(category)
+            packages = self.db.categories.setdefault(category, {})
+            installed = self.db.installed.get(category)
+            installed_count = 0
+            db_list = self.db.list
+            for name, is_installed, in_world in records:
+                data = Package(category + '/' + name, in_world)
+                packages[data.name] = data
+                db_list.append((data.name, data))
+                tree.add(data.full_name)
+                if is_installed:
+                    if installed is None:
+                        installed = self.db.installed[category] = {}
+                        self.db.installed_pkg_count[category] = 0
+                    installed[data.name] = data
+                    installed_count += 1
+            self.db.pkg_count[category] = self.db.pkg_count.get(category, 0) + len(records)
+            if installed_count:
+                self.db.installed_pkg_count[category] += installed_count
+                self.db.installed_count += installed_count
+            return len(records)
 
     def get_installed(self):
         """get a new installed list"""
         debug.dprint("DBREADER: get_installed();")
         self.installed_list = PMS_LIB.get_installed_list()
-        self.installed_count = len(self.installed_list)
+        # hashed index for the per node lookups in add_pkg()
+        self.installed_set = set(self.installed_list)
+        self.installed_count = len(self.installed_set)
 
     def run(self):
         """The thread function."""
@@ -181,3 +351,77 @@ class DatabaseReader(threading.Thread):
 
 
 
+
+
+class DatabaseRefresher(DatabaseReader):
+    """Compares the current tree against an existing database
+    and works out which packages were added, removed or changed,
+    instead of building a whole new database."""
+
+    def __init__(self, callback, old_db):
+        DatabaseReader.__init__(self, callback, use_snapshot = False)
+        self.old_db = old_db
+        # the snapshot key of the tree we compared against
+        self.key = None
+        # filled in by read_db(), applied by Database.apply_delta()
+        self.delta = None
+
+    def read_db(self):
+        """Diff the current tree and installed list against old_db"""
+        debug.dprint("DBREADER: DatabaseRefresher.read_db(); process id = %d *****************" %(os.getpid()))
+        self.key = get_snapshot_key()
+        self.get_installed()
+        try:
+            allnodes = PMS_LIB.get_allnodes()
+        except OSError, e:
+            self.error = str(e)
+            return
+        if self.cancelled: self.done = True; return
+        self.allnodes_length = len(allnodes)
+        tree = set()
+        for entry in allnodes:
+            category, name = entry.split('/')
+            if valid_node(category, name):
+                tree.add(entry)
+        installed = self.installed_set
+        signatures = PMS_LIB.get_cache_signatures()
+        if self.cancelled: self.done = True; return
+        old_installed = set()
+        for category in self.old_db.installed:
+            for name in self.old_db.installed[category]:
+                old_installed.add(category + '/' + name)
+        old_nodes = {}
+        for name, data in self.old_db.list:
+            old_nodes[data.full_name] = data
+        old_signatures = self.old_db.cache_signatures
+        current = tree | installed
+        added = {}
+        for full_name in current.difference(old_nodes):
+            data = Package(full_name)
+            data.deprecated = full_name not in tree
+            added[full_name] = data
+        removed = list(set(old_nodes).difference(current))
+        changed = []
+        for full_name in current.intersection(old_nodes):
+            if self.cancelled: self.done = True; return
+            data = old_nodes[full_name]
+            if (signatures.get(full_name) != old_signatures.get(full_name) or
+                    data.deprecated != (full_name not in tree) or
+                    (full_name in installed) != (full_name in old_installed)):
+                changed.append(full_name)
+        self.nodecount = len(current)
+        self.delta = {'added': added, 'removed': removed, 'changed': changed,
+            'installed': installed, 'tree': tree, 'signatures': signatures}
+        debug.dprint("DBREADER: DatabaseRefresher.read_db(); %d added, %d removed, %d changed"
+            %(len(added), len(removed), len(changed)))
+
+    def run(self):
+        """The thread function."""
+        self.read_db()
+        self.done = True
+        args = {"nodecount": self.nodecount, "done": True, 'db_thread_error': self.error}
+        if self.delta:
+            args['delta'] = {'added': self.delta['added'].keys(),
+                'removed': self.delta['removed'], 'changed': self.delta['changed']}
+        self.callback(args)
+        debug.dprint("DBREADER: DatabaseRefresher.run(); finished")
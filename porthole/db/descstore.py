@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+    Package description store
+    An indexed, memory mapped file of package name: description,
+    read lazily so loading it costs next to nothing.  The search index
+    uses the same format for its posting lists.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+    File layout, all integers are little endian unsigned 32 bit:
+        magic, version, count, length of the sync date, sync date
+        count index entries of (key offset, key length, value length),
+            sorted by key, offsets are from the start of the blob
+        the blob, each key followed by its value
+"""
+
+import os, mmap, struct
+
+from porthole.utils import debug
+
+MAGIC = "PHDESC\0\0"
+# bump this whenever the file layout changes
+VERSION = 1
+
+_HEADER = struct.Struct("<8sIII")
+_ENTRY = struct.Struct("<III")
+
+
+def encode(string):
+    """the store holds utf-8 encoded str's"""
+    if isinstance(string, unicode):
+        return string.encode('utf_8', 'replace')
+    return string or ''
+
+
+class MappedStore(object):
+    """Read only dictionary like access to a saved store file.
+    Nothing is read until a key is looked up."""
+
+    def __init__(self, filename):
+        _file = open(filename, "rb")
+        try:
+            self._map = mmap.mmap(_file.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            _file.close()
+        magic, version, self._count, date_len = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError("not a version %d store file: %s"
+                %(VERSION, filename))
+        start = _HEADER.size
+        self.sync_date = self._map[start:start + date_len]
+        self._index = start + date_len
+        self._blob = self._index + self._count * _ENTRY.size
+
+    def _entry(self, i):
+        """returns (key offset, key length, value length) of entry i"""
+        return _ENTRY.unpack_from(self._map, self._index + i * _ENTRY.size)
+
+    def _key(self, i):
+        offset, key_len, val_len = self._entry(i)
+        offset += self._blob
+        return self._map[offset:offset + key_len]
+
+    def _find(self, name):
+        """binary search of the index, returns the entry or None"""
+        name = encode(name)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            entry = self._entry(low)
+            offset = self._blob + entry[0]
+            if self._map[offset:offset + entry[1]] == name:
+                return entry
+        return None
+
+    def __getitem__(self, name):
+        entry = self._find(name)
+        if entry is None:
+            raise KeyError(name)
+        offset = self._blob + entry[0] + entry[1]
+        return self._map[offset:offset + entry[2]]
+
+    def get(self, name, default = None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    has_key = __contains__
+
+    def __len__(self):
+        return self._count
+
+    def keys(self):
+        return [self._key(i) for i in range(self._count)]
+
+    def __iter__(self):
+        for i in xrange(self._count):
+            yield self._key(i)
+
+    def close(self):
+        self._map.close()
+
+
+def save_store(table, sync_date, filename):
+    """Writes the table dictionary of str: str to filename.
+    The file is replaced atomically.  Returns True on success."""
+    items = sorted([(encode(name), encode(desc))
+        for name, desc in table.iteritems()])
+    sync_date = encode(sync_date)
+    index = []
+    blob = []
+    offset = 0
+    for name, desc in items:
+        index.append(_ENTRY.pack(offset, len(name), len(desc)))
+        blob.append(name)
+        blob.append(desc)
+        offset += len(name) + len(desc)
+    debug.dprint("DESCSTORE: save_store(); saving %d entries to file: %s"
+        %(len(items), filename))
+    tmpname = filename + ".tmp"
+    try:
+        _file = open(tmpname, "wb")
+        _file.write(_HEADER.pack(MAGIC, VERSION, len(items), len(sync_date)))
+        _file.write(sync_date)
+        _file.write(''.join(index))
+        _file.write(''.join(blob))
+        _file.close()
+        # atomic replace, a reader never sees a partial file
+        os.rename(tmpname, filename)
+    except (IOError, OSError), e:
+        debug.dprint("DESCSTORE: save_store(); failed to save: " + str(e))
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        return False
+    return True
+
+def load_store(filename):
+    """Returns a MappedStore for filename,
+    or None if it does not exist or is not valid"""
+    if not os.access(filename, os.R_OK):
+        debug.dprint("DESCSTORE: load_store(); file does not exist: " + filename)
+        return None
+    try:
+        return MappedStore(filename)
+    except (IOError, OSError, ValueError, struct.error, mmap.error), e:
+        debug.dprint("DESCSTORE: load_store(); failed to load: " + str(e))
+        return None
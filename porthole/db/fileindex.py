@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""
+    Installed file index
+    A path: owner index of the files installed by every package,
+    built from the vdb CONTENTS files, saved between runs and kept
+    up to date one vdb entry at a time.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os, re
+from bisect import bisect_left
+from fnmatch import translate
+
+from porthole.utils import debug
+from porthole.readers.commonreader import CommonReader
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.db.snapshot import save_pickle, load_pickle
+from porthole import config
+
+# Set EPREFIX
+EPREFIX = config.Prefs.EPREFIX
+
+# bump this whenever the layout of the saved data changes
+FILEINDEX_VERSION = 1
+
+FILEINDEX_FILE = EPREFIX + "/var/db/porthole/files.db"
+
+WILDCARDS = "*?["
+
+
+def _contents_mtime(cpv):
+    """returns the mtime of the vdb CONTENTS of cpv or 0"""
+    try:
+        return os.stat(os.path.join(PMS_LIB.get_vdb_path(), cpv,
+            "CONTENTS")).st_mtime
+    except OSError:
+        return 0
+
+def _vdb_cpvs():
+    """returns the list of cpv's in the vdb"""
+    path = PMS_LIB.get_vdb_path()
+    cpvs = []
+    try:
+        categories = os.listdir(path)
+    except OSError:
+        return cpvs
+    for category in categories:
+        try:
+            entries = os.listdir(os.path.join(path, category))
+        except OSError:
+            continue
+        # skip portage's -MERGING- and other temporary entries
+        cpvs.extend([category + '/' + pvr for pvr in entries
+            if not (pvr.startswith('-') or pvr.startswith('.'))])
+    return cpvs
+
+def _owner_list(owner):
+    """returns an owners entry as a list of cpv's"""
+    if owner is None:
+        return []
+    if isinstance(owner, tuple):
+        return list(owner)
+    return [owner]
+
+
+class FileIndex(object):
+    """Answers which installed package(s) own a path"""
+
+    def __init__(self):
+        # cpv: (CONTENTS mtime, tuple of paths)
+        self.entries = {}
+        # path: cpv, or a tuple of cpv's if more than one owns it
+        self.owners = {}
+        # the sorted paths for the prefix lookups, made on first use
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.owners)
+
+    def _add(self, cpv, mtime, paths):
+        self.entries[cpv] = (mtime, paths)
+        owners = self.owners
+        for path in paths:
+            owner = owners.get(path)
+            if owner is None:
+                owners[path] = cpv
+            elif isinstance(owner, tuple):
+                owners[path] = owner + (cpv,)
+            elif owner != cpv:
+                owners[path] = (owner, cpv)
+        self._sorted = None
+
+    def _remove(self, cpv):
+        mtime, paths = self.entries.pop(cpv, (0, ()))
+        owners = self.owners
+        for path in paths:
+            owner = owners.get(path)
+            if owner == cpv:
+                del owners[path]
+            elif isinstance(owner, tuple) and cpv in owner:
+                owner = tuple([x for x in owner if x != cpv])
+                if len(owner) == 1:
+                    owner = owner[0]
+                owners[path] = owner
+        self._sorted = None
+
+    def read(self, cpv):
+        """(re)reads the CONTENTS of cpv"""
+        self._remove(cpv)
+        mtime = _contents_mtime(cpv)
+        if mtime:
+            paths = PMS_LIB.get_installed_contents(cpv)
+            self._add(intern(cpv), mtime, tuple(paths))
+
+    def update(self, added, removed):
+        """VdbWatcher callback lists, cpv's that were merged or unmerged"""
+        for cpv in removed:
+            self._remove(cpv)
+        for cpv in added:
+            self.read(cpv)
+
+    def refresh(self, please_die = None):
+        """brings the index up to date with the vdb, only the entries
+        whose CONTENTS changed are read again.  Returns the number of
+        entries added, changed or removed."""
+        cpvs = _vdb_cpvs()
+        changed = 0
+        for cpv in set(self.entries).difference(cpvs):
+            self._remove(cpv)
+            changed += 1
+        for cpv in cpvs:
+            if please_die and please_die():
+                break
+            entry = self.entries.get(cpv)
+            if entry is None or entry[0] != _contents_mtime(cpv):
+                self.read(cpv)
+                changed += 1
+        return changed
+
+    def get_owners(self, path):
+        """Returns the list of cpv's that installed path"""
+        return _owner_list(self.owners.get(os.path.normpath(path)))
+
+    def find(self, pattern):
+        """Returns a sorted list of (path, [cpv's]) for the installed
+        paths that start with pattern, or match it if it has shell
+        wildcards, like '/usr/lib/python3.*'"""
+        if self._sorted is None:
+            self._sorted = sorted(self.owners)
+        paths = self._sorted
+        # only the paths starting with the part before the first
+        # wildcard need to be checked
+        prefix = pattern
+        for char in WILDCARDS:
+            prefix = prefix.split(char, 1)[0]
+        wild = prefix != pattern
+        if wild and not pattern.endswith('*'):
+            # '/usr/lib/python3.*' also means everything under them
+            pattern += '*'
+        matches = paths[bisect_left(paths, prefix):
+            bisect_left(paths, prefix + '\xff')]
+        # a trailing '*' matches everything with the prefix
+        if pattern[len(prefix):].strip('*'):
+            match = re.compile(translate(pattern)).match
+            matches = [path for path in matches if match(path)]
+        owners = self.owners
+        return [(path, _owner_list(owners[path])) for path in matches]
+
+    def get_collisions(self, paths = None):
+        """Returns a dictionary of path: [cpv's] of the paths installed
+        by more than one package, or of those among paths that are
+        already installed"""
+        collisions = {}
+        if paths is None:
+            for path, owner in self.owners.iteritems():
+                if isinstance(owner, tuple):
+                    collisions[path] = list(owner)
+        else:
+            for path in paths:
+                owners = self.get_owners(path)
+                if owners:
+                    collisions[path] = owners
+        return collisions
+
+    def save(self, filename = FILEINDEX_FILE, entries = None):
+        """saves the per cpv entries, or entries, a copy of them taken
+        while the index is not changing.  The owners are rebuilt on load"""
+        if entries is None:
+            entries = self.entries
+        debug.dprint("FILEINDEX: save(); saving %d entries to file: %s"
+            %(len(entries), filename))
+        return save_pickle(filename, {'vdb': PMS_LIB.get_vdb_path(),
+            'entries': entries}, FILEINDEX_VERSION)
+
+    def load(self, filename = FILEINDEX_FILE):
+        """loads the saved entries, returns False if there are none"""
+        _db = load_pickle(filename, FILEINDEX_VERSION)
+        if _db is None:
+            return False
+        if _db.get('vdb') != PMS_LIB.get_vdb_path():
+            debug.dprint("FILEINDEX: load(); index of another vdb, ignoring")
+            return False
+        for cpv, (mtime, paths) in _db['entries'].iteritems():
+            self._add(intern(cpv), mtime, paths)
+        return True
+
+
+class FileIndexReader(CommonReader):
+    """Loads the saved FileIndex, or builds a new one, and brings it
+    up to date with the vdb.  dispatcher(self) is called when done."""
+
+    def __init__(self, dispatcher, filename = FILEINDEX_FILE):
+        CommonReader.__init__(self)
+        self.dispatcher = dispatcher
+        self.filename = filename
+        self.index = FileIndex()
+
+    def run(self):
+        debug.dprint("FILEINDEX: FileIndexReader(); process id = %d *****************"
+            %os.getpid())
+        self.index.load(self.filename)
+        changed = self.index.refresh(lambda: self.cancelled)
+        self.count = len(self.index.entries)
+        if changed and not self.cancelled:
+            self.index.save(self.filename)
+        debug.dprint("FILEINDEX: FileIndexReader(); %d entries, %d changed, %d paths"
+            %(self.count, changed, len(self.index)))
+        self.done = True
+        self.dispatcher(self)
+
+
+class IndexSaver(CommonReader):
+    """Saves indexes (a FileIndex or RevDepIndex) in a thread.  Their
+    entries are copied when it is made, the gtk thread may change the
+    indexes while they are pickled."""
+
+    def __init__(self, indexes):
+        CommonReader.__init__(self)
+        # (index, copy of its entries)
+        self.saves = [(index, dict(index.entries)) for index in indexes]
+
+    def run(self):
+        for index, entries in self.saves:
+            index.save(entries = entries)
+            self.count += 1
+        self.done = True
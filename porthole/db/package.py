@@ -38,29 +38,77 @@ portage_lib = backends.portage_lib
 REFRESH = True
 USERCONFIGS = None
 
-class Package:
+def _intern(string):
+    """intern the str names shared by many packages and views"""
+    if type(string) is str:
+        return intern(string)
+    return string
+
+class Package(object):
     """An entry in the package database"""
 
-    def __init__(self, full_name):
-        self.full_name = full_name
+    # there is one of these for every package in the tree,
+    # slots keep them small
+    __slots__ = ('full_name', 'name', 'category', 'latest_ebuild',
+        'hard_masked', 'hard_masked_nocheck', 'best_ebuild',
+        'installed_ebuilds', 'properties', 'upgradable', 'dep_upgradable',
+        'latest_installed', 'size', 'digest_file', 'in_world',
+        'is_checked', 'deprecated', 'unavailable')
+
+    def __init__(self, full_name, in_world = None):
+        """in_world is looked up unless the caller already knows it"""
+        self.full_name = _intern(full_name)
         self.latest_ebuild = None
         self.hard_masked = None
         self.hard_masked_nocheck = None
         self.best_ebuild = None
         self.installed_ebuilds = None
-        self.name = None
-        self.category = None
-        self.properties = {}
+        if '/' in full_name:
+            category, name = full_name.split('/', 1)
+            self.category = _intern(category)
+            self.name = _intern(name)
+        else:
+            self.name = None
+            self.category = None
+        # created on first use, most packages are never looked at
+        self.properties = None
         self.upgradable = None
         self.dep_upgradable = None
 
         self.latest_installed = None
         self.size = None
         self.digest_file = None
-        self.in_world = full_name in portage_lib.settings.get_world()
+        if in_world is None:
+            in_world = portage_lib.settings.in_world(full_name)
+        self.in_world = in_world
         self.is_checked = False
         self.deprecated = False
-        self.unavailable = []
+        self.unavailable = None
+
+    def reset(self):
+        """Clear all cached ebuild info so it is read again on demand"""
+        self.latest_ebuild = None
+        self.hard_masked = None
+        self.hard_masked_nocheck = None
+        self.best_ebuild = None
+        self.installed_ebuilds = None
+        self.properties = None
+        self.upgradable = None
+        self.dep_upgradable = None
+        self.latest_installed = None
+        self.size = None
+        self.digest_file = None
+        self.unavailable = None
+
+    def reset_installed(self):
+        """Clear only the cached info that depends on the installed
+        versions, after a merge or unmerge of this package"""
+        self.installed_ebuilds = None
+        self.latest_installed = None
+        self.upgradable = None
+        self.dep_upgradable = None
+        self.unavailable = None
+        self.in_world = portage_lib.settings.in_world(self.full_name)
 
     def in_list(self, _list=None):
         """returns True/False if the package is listed in the list"""
@@ -84,8 +132,8 @@ class Package:
         """Update the package info"""
         if self.full_name == _("None"):
             return
-        self.is_upgradeable(REFRESH)
-        self.in_world = full_name in portage_lib.settings.get_world()
+        self.reset()
+        self.in_world = portage_lib.settings.in_world(self.full_name)
 
     def get_installed(self, refresh = False):
         """Returns a list of all installed ebuilds."""
@@ -119,12 +167,12 @@ class Package:
         # taking into account keywords and masking, use get_best_ebuild().
         if self.full_name == _("None"):
             return ''
-        vers = self.get_versions()[:] # make a copy in case it is a pointer
-        #debug.dprint("PACKAGE: get_latest_ebuild(); versions: " + str(vers))
         if include_masked:
             #debug.dprint("PACKAGE: get_latest_ebuild(); trying portage_lib.best() of versions: " + str(vers))
-            return portage_lib.best(vers)
+            return portage_lib.best(self.get_versions())
         if self.latest_ebuild == None:
+            vers = self.get_versions()[:] # make a copy in case it is a pointer
+            #debug.dprint("PACKAGE: get_latest_ebuild(); versions: " + str(vers))
             #debug.dprint("PACKAGE: get_latest_ebuild(); checking hard masked vers = " + str(vers))
             for m in self.get_hard_masked(check_unmask = True):
                 while m in vers:
@@ -192,16 +240,15 @@ class Package:
         if self.latest_installed == None or refresh:
             installed_ebuilds = self.get_installed(refresh )
             if len(installed_ebuilds) == 1:
-                return installed_ebuilds[0]
+                self.latest_installed = installed_ebuilds[0]
             elif len(installed_ebuilds) == 0:
-                return ""
-            installed_ebuilds = ver_sort( installed_ebuilds )
-            self.latest_installed = installed_ebuilds[-1]
+                self.latest_installed = ""
+            else:
+                installed_ebuilds = ver_sort( installed_ebuilds )
+                self.latest_installed = installed_ebuilds[-1]
         return self.latest_installed
 
     def get_description(self):
-        if self.properties:
-            return self.properties[self.get_default_ebuild()].description
         return self.get_properties().description
 
     def get_metadata(self, cpv=None):
@@ -226,6 +273,10 @@ class Package:
         else:
             #debug.dprint("PACKAGE: get_properties(); Using specific ebuild")
             ebuild = specific_ebuild
+        if self.properties is None:
+            # read all the ebuilds from the md5-cache at once,
+            # the summary and the views use several of them
+            self.properties = portage_lib.get_package_properties(self.full_name)
         if not ebuild in self.properties:
             #debug.dprint("PACKAGE: geting properties for '%s'" % str(ebuild))
             self.properties[ebuild] = portage_lib.get_properties(ebuild)
@@ -314,8 +365,9 @@ class Package:
     def get_unavailable(self):
         """check for deprecated ebuilds and return a list of ebuilds
         """
-        if self.unavailable:
+        if self.unavailable is not None:
             return self.unavailable
+        self.unavailable = []
         ebuilds = self.get_installed()
         for ebuild in ebuilds:
             overlay = portage_lib.get_overlay(ebuild)
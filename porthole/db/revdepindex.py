@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+"""
+    Reverse dependency index
+    A cat/pkg: dependents index of the installed packages, built from
+    the DEPEND, RDEPEND and PDEPEND each one was merged with, saved
+    between runs and kept up to date one vdb entry at a time.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os
+
+from porthole.utils import debug
+from porthole.readers.commonreader import CommonReader
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.db.fileindex import _vdb_cpvs
+from porthole.db.snapshot import save_pickle, load_pickle
+from porthole import config
+
+# Set EPREFIX
+EPREFIX = config.Prefs.EPREFIX
+
+# bump this whenever the layout of the saved data changes
+REVDEPINDEX_VERSION = 1
+
+REVDEPINDEX_FILE = EPREFIX + "/var/db/porthole/revdeps.db"
+
+DEPEND_KINDS = ["DEPEND", "RDEPEND", "PDEPEND"]
+
+
+def _entry_mtime(cpv):
+    """returns the mtime of the vdb entry of cpv or 0"""
+    try:
+        return os.stat(os.path.join(PMS_LIB.get_vdb_path(), cpv)).st_mtime
+    except OSError:
+        return 0
+
+def _add_atoms(atoms, use_flags, kind, deps):
+    """adds (kind, atom, cat/pkg) to deps for every package DependAtom
+    of atoms that applies with use_flags.  Blockers are left out and
+    all the alternatives of an || group are kept, any of them may be
+    the one in use."""
+    for atom in atoms:
+        if atom.mytype in ('DEP', 'REVISIONABLE'):
+            # atom.name still has the version of a versioned atom
+            deps.add((kind, atom.get_depname(), PMS_LIB.get_full_name(atom.name)))
+        elif atom.mytype == 'USING':
+            if atom.useflag in use_flags:
+                _add_atoms(atom.children, use_flags, kind, deps)
+        elif atom.mytype == 'NOTUSING':
+            if atom.useflag not in use_flags:
+                _add_atoms(atom.children, use_flags, kind, deps)
+        elif atom.mytype in ('OPTION', 'GROUP'):
+            _add_atoms(atom.children, use_flags, kind, deps)
+
+def get_installed_deps(cpv, parser):
+    """Returns a tuple of (kind, atom, cat/pkg) of the packages the
+    installed cpv depends on, parser is a Depends instance"""
+    use_flags, depends = PMS_LIB.get_installed_depends(cpv)
+    use_flags = set(use_flags)
+    deps = set()
+    for kind in DEPEND_KINDS:
+        parser.cache.reset()
+        atoms = parser.parse(depends.get(kind, '').split())
+        _add_atoms(atoms, use_flags, kind, deps)
+    return tuple(sorted(deps))
+
+
+class RevDepIndex(object):
+    """Answers which installed packages depend on a package"""
+
+    def __init__(self):
+        # cpv: (vdb entry mtime, tuple of (kind, atom, cat/pkg))
+        self.entries = {}
+        # cat/pkg: list of (dependent cpv, kind, atom)
+        self.dependents = {}
+        self._parser = None
+
+    def __len__(self):
+        return len(self.dependents)
+
+    def _add(self, cpv, mtime, deps):
+        self.entries[cpv] = (mtime, deps)
+        dependents = self.dependents
+        for kind, atom, full_name in deps:
+            dependents.setdefault(full_name, []).append((cpv, kind, atom))
+
+    def _remove(self, cpv):
+        mtime, deps = self.entries.pop(cpv, (0, ()))
+        dependents = self.dependents
+        for full_name in set([dep[2] for dep in deps]):
+            entries = [x for x in dependents.get(full_name, []) if x[0] != cpv]
+            if entries:
+                dependents[full_name] = entries
+            else:
+                dependents.pop(full_name, None)
+
+    def read(self, cpv):
+        """(re)reads the dependencies of cpv"""
+        if self._parser is None:
+            # imported here, the views import porthole.db
+            from porthole.views.packagebook.depends import Depends
+            self._parser = Depends()
+        self._remove(cpv)
+        mtime = _entry_mtime(cpv)
+        if mtime:
+            self._add(intern(cpv), mtime, get_installed_deps(cpv, self._parser))
+
+    def update(self, added, removed):
+        """VdbWatcher callback lists, cpv's that were merged or unmerged"""
+        for cpv in removed:
+            self._remove(cpv)
+        for cpv in added:
+            self.read(cpv)
+
+    def refresh(self, please_die = None):
+        """brings the index up to date with the vdb, only the entries
+        that changed are read again.  Returns the number of entries
+        added, changed or removed."""
+        cpvs = _vdb_cpvs()
+        changed = 0
+        for cpv in set(self.entries).difference(cpvs):
+            self._remove(cpv)
+            changed += 1
+        for cpv in cpvs:
+            if please_die and please_die():
+                break
+            entry = self.entries.get(cpv)
+            if entry is None or entry[0] != _entry_mtime(cpv):
+                self.read(cpv)
+                changed += 1
+        return changed
+
+    def get_dependents(self, name):
+        """Returns a sorted list of (installed cpv, kind, atom) of the
+        dependencies on name.  name is a cat/pkg, or a cpv to only get
+        the atoms that match that version."""
+        full_name = PMS_LIB.extract_package(name)
+        if full_name is None:
+            return sorted(self.dependents.get(name, []))
+        return sorted([entry for entry in self.dependents.get(full_name, [])
+            if PMS_LIB.match_from_list(entry[2], [name])])
+
+    def save(self, filename = REVDEPINDEX_FILE, entries = None):
+        """saves the per cpv entries, or entries, a copy of them taken
+        while the index is not changing.  The dependents are rebuilt on load"""
+        if entries is None:
+            entries = self.entries
+        debug.dprint("REVDEPINDEX: save(); saving %d entries to file: %s"
+            %(len(entries), filename))
+        return save_pickle(filename, {'vdb': PMS_LIB.get_vdb_path(),
+            'entries': entries}, REVDEPINDEX_VERSION)
+
+    def load(self, filename = REVDEPINDEX_FILE):
+        """loads the saved entries, returns False if there are none"""
+        _db = load_pickle(filename, REVDEPINDEX_VERSION)
+        if _db is None:
+            return False
+        if _db.get('vdb') != PMS_LIB.get_vdb_path():
+            debug.dprint("REVDEPINDEX: load(); index of another vdb, ignoring")
+            return False
+        for cpv, (mtime, deps) in _db['entries'].iteritems():
+            self._add(intern(cpv), mtime, deps)
+        return True
+
+
+class RevDepIndexReader(CommonReader):
+    """Loads the saved RevDepIndex, or builds a new one, and brings it
+    up to date with the vdb.  dispatcher(self) is called when done."""
+
+    def __init__(self, dispatcher, filename = REVDEPINDEX_FILE):
+        CommonReader.__init__(self)
+        self.dispatcher = dispatcher
+        self.filename = filename
+        self.index = RevDepIndex()
+
+    def run(self):
+        debug.dprint("REVDEPINDEX: RevDepIndexReader(); process id = %d *****************"
+            %os.getpid())
+        self.index.load(self.filename)
+        changed = self.index.refresh(lambda: self.cancelled)
+        self.count = len(self.index.entries)
+        if changed and not self.cancelled:
+            self.index.save(self.filename)
+        debug.dprint("REVDEPINDEX: RevDepIndexReader(); %d entries, %d changed, %d packages"
+            %(self.count, changed, len(self.index)))
+        self.done = True
+        self.dispatcher(self)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""
+    Package search index
+    A trigram index of the package names and descriptions, so a
+    substring search only has to check the packages that contain
+    every trigram of the search term.  It also indexes the USE flags,
+    herds, maintainers and homepages for field qualified searches
+    like "use:gtk" or "maint:foo@gentoo.org".
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+from array import array
+
+from porthole.utils import debug
+from porthole.db.descstore import encode, save_store, load_store
+
+GRAM = 3
+
+# bump this whenever the indexed keys change
+INDEX_VERSION = 2
+
+# store keys, the posting lists are keyed by field prefix + trigram
+VERSION_KEY = "\0version"
+NAMES_KEY = "\0names"
+NAME_FIELD = "n"
+DESC_FIELD = "d"
+
+# search field: posting list prefix for the field qualified searches
+FIELDS = {'use': 'u', 'herd': 'h', 'maint': 'm', 'homepage': 'w'}
+# these are matched a whole word at a time, keyed by prefix + "=" + word,
+# the others by substring, with trigram posting lists
+WORD_FIELDS = ('use', 'herd')
+# + field, the lower case texts of a substring field, a line per package
+TEXT_KEY = "\0text:"
+
+
+def grams(text):
+    """returns the set of lower case trigrams in text"""
+    text = encode(text).lower()
+    return set([text[i:i + GRAM] for i in range(len(text) - GRAM + 1)])
+
+
+def build_index(packages, descriptions, fields = None):
+    """Returns the index table for the db list packages, the
+    name: description dictionary and the full_name: {field: text}
+    dictionary of the FIELDS, ready for save_index().
+    A package's id is its position in packages."""
+    postings = {}
+    full_names = []
+    texts = dict([(field, []) for field in FIELDS if field not in WORD_FIELDS])
+    fields = fields or {}
+    for i, (name, package) in enumerate(packages):
+        full_names.append(package.full_name)
+        for gram in grams(name):
+            postings.setdefault(NAME_FIELD + gram, []).append(i)
+        for gram in grams(descriptions.get(name, '')):
+            postings.setdefault(DESC_FIELD + gram, []).append(i)
+        values = fields.get(package.full_name, {})
+        for field in WORD_FIELDS:
+            for word in set(encode(values.get(field, '')).lower().split()):
+                postings.setdefault(FIELDS[field] + '=' + word, []).append(i)
+        for field in texts:
+            text = ' '.join(encode(values.get(field, '')).lower().split())
+            texts[field].append(text)
+            for gram in grams(text):
+                postings.setdefault(FIELDS[field] + gram, []).append(i)
+    table = {VERSION_KEY: str(INDEX_VERSION), NAMES_KEY: '\n'.join(full_names)}
+    for field in texts:
+        table[TEXT_KEY + field] = '\n'.join(texts[field])
+    for key, ids in postings.iteritems():
+        table[key] = array('I', ids).tostring()
+    debug.dprint("SEARCHINDEX: build_index(); %d packages, %d posting lists"
+        %(len(full_names), len(postings)))
+    return table
+
+def save_index(table, sync_date, filename):
+    """Writes an index table built by build_index() to filename"""
+    return save_store(table, sync_date, filename)
+
+def load_index(filename):
+    """Returns the SearchIndex saved in filename or None"""
+    store = load_store(filename)
+    if store is None:
+        return None
+    if NAMES_KEY not in store or store.get(VERSION_KEY) != str(INDEX_VERSION):
+        debug.dprint("SEARCHINDEX: load_index(); old index version, ignoring")
+        store.close()
+        return None
+    return SearchIndex(store)
+
+
+class SearchIndex(object):
+    """Looks up the packages that may contain a search term"""
+
+    def __init__(self, store):
+        self.store = store
+        self.sync_date = store.sync_date
+        self.full_names = store[NAMES_KEY].split('\n')
+        # field: texts, split on first use
+        self._texts = {}
+        self._name_set = None
+        # the length of each package name, without the category
+        self._name_lengths = None
+
+    def __len__(self):
+        return len(self.full_names)
+
+    def __contains__(self, full_name):
+        return full_name in self.get_name_set()
+
+    def get_name_set(self):
+        """Returns the set of the indexed full_names"""
+        if self._name_set is None:
+            self._name_set = set(self.full_names)
+        return self._name_set
+
+    def _postings(self, field, term_grams):
+        """returns the set of ids that have all of term_grams in field"""
+        lists = []
+        for gram in term_grams:
+            data = self.store.get(field + gram)
+            if not data:
+                return set()
+            ids = array('I')
+            ids.fromstring(data)
+            lists.append(ids)
+        # start with the shortest list, the result only shrinks
+        lists.sort(key = len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            result.intersection_update(ids)
+            if not result:
+                break
+        return result
+
+    def candidates(self, term, search_desc):
+        """Returns a sorted list of the ids of the packages whose name
+        (or description if search_desc) may contain term, or None if
+        term is too short to use the index.  The matches still need to
+        be verified, a package can have all the trigrams in a different
+        order."""
+        term_grams = grams(term)
+        if not term_grams:
+            return None
+        ids = self._postings(NAME_FIELD, term_grams)
+        if search_desc:
+            ids.update(self._postings(DESC_FIELD, term_grams))
+        return sorted(ids)
+
+    def near_candidates(self, term, limit):
+        """Returns the set of ids of the packages whose name may be
+        within edit distance limit of term: the names that many
+        characters longer or shorter at most, and that have all but
+        GRAM * limit of its trigrams, an edit changes no more than
+        that many of them."""
+        if self._name_lengths is None:
+            self._name_lengths = array('I', [len(x) - x.find('/') - 1
+                for x in self.full_names])
+        lengths = self._name_lengths
+        low, high = len(term) - limit, len(term) + limit
+        term_grams = grams(term)
+        need = len(term_grams) - GRAM * limit
+        if need <= 0:
+            return set([i for i in xrange(len(lengths))
+                if low <= lengths[i] <= high])
+        counts = {}
+        for gram in term_grams:
+            data = self.store.get(NAME_FIELD + gram)
+            if not data:
+                continue
+            ids = array('I')
+            ids.fromstring(data)
+            for i in ids:
+                counts[i] = counts.get(i, 0) + 1
+        return set([i for i, count in counts.iteritems()
+            if count >= need and low <= lengths[i] <= high])
+
+    def _field_matches(self, field, value):
+        """returns the set of ids whose field matches value"""
+        value = encode(value).lower()
+        prefix = FIELDS[field]
+        if field in WORD_FIELDS:
+            data = self.store.get(prefix + '=' + value)
+            if not data:
+                return set()
+            ids = array('I')
+            ids.fromstring(data)
+            return set(ids)
+        if field not in self._texts:
+            self._texts[field] = self.store.get(TEXT_KEY + field, '').split('\n')
+        texts = self._texts[field]
+        value_grams = grams(value)
+        if value_grams:
+            ids = self._postings(prefix, value_grams)
+        else:
+            ids = xrange(len(texts))
+        # the trigrams may be in a different order, check the text
+        return set([i for i in ids if value in texts[i]])
+
+    def field_matches(self, queries):
+        """Returns a sorted list of the ids of the packages that match
+        all of queries, a list of (field, value) with the field one
+        of FIELDS"""
+        result = None
+        for field, value in queries:
+            ids = self._field_matches(field, value)
+            if result is None:
+                result = ids
+            else:
+                result.intersection_update(ids)
+            if not result:
+                break
+        return sorted(result or [])
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""
+    Package Database snapshot
+    Saves and restores the package index built by the DatabaseReader
+    so an unchanged tree does not need to be rescanned on every start.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os, cPickle
+
+from porthole.utils import debug
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.backends.utilities import get_sync_info
+from porthole import config
+
+# Set EPREFIX
+EPREFIX = config.Prefs.EPREFIX
+
+# bump this whenever the layout of the saved data changes
+SNAPSHOT_VERSION = 2
+
+SNAPSHOT_FILE = EPREFIX + "/var/db/porthole/packages.db"
+
+
+def _mtime(path):
+    """returns the mtime of path or 0 if it does not exist"""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+def _dir_state(path):
+    """returns a tuple of (name, mtime) for every sub directory of path.
+    A directory's mtime changes when entries are added to or removed
+    from it, so this catches new/removed categories and packages."""
+    state = []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return ()
+    names.sort()
+    for name in names:
+        mtime = _mtime(os.path.join(path, name))
+        state.append((name, mtime))
+    return tuple(state)
+
+def _path_state(path):
+    """returns the state of a config file, or of all files in
+    a config directory"""
+    if os.path.isdir(path):
+        return (_mtime(path), _dir_state(path))
+    return _mtime(path)
+
+def get_tree_state():
+    """Returns (sync time, state of the tree and overlays),
+    it changes with every sync"""
+    sync_time, valid_sync = get_sync_info()
+    repos = []
+    for path in PMS_LIB.get_repo_paths():
+        repos.append((path,
+            _mtime(os.path.join(path, "metadata", "timestamp.chk")),
+            _mtime(os.path.join(path, "metadata", "timestamp")),
+            _dir_state(path)))
+    return sync_time, tuple(repos)
+
+def get_config_state():
+    """Returns the state of the user config files and dirs"""
+    return tuple([(path, _path_state(path))
+        for path in PMS_LIB.get_config_paths()])
+
+def get_vdb_state():
+    """Returns the state of the vdb, it changes with every merge
+    and unmerge"""
+    vdb_path = PMS_LIB.get_vdb_path()
+    return (_mtime(vdb_path), _dir_state(vdb_path))
+
+def get_snapshot_key():
+    """Returns a key describing the current tree, vdb and
+    user config state.  The saved index is only valid while
+    this key is unchanged."""
+    sync_time, repos = get_tree_state()
+    return (sync_time, repos, get_vdb_state(), get_config_state())
+
+def save_pickle(filename, data, version):
+    """Pickles the dictionary data to filename, tagged with version.
+    It is written to a temp file that is renamed over filename,
+    so a reader never sees a partial file.  Returns True on success."""
+    data['version'] = version
+    tmpname = filename + ".tmp"
+    try:
+        _file = open(tmpname, "wb")
+        cPickle.dump(data, _file, cPickle.HIGHEST_PROTOCOL)
+        _file.close()
+        os.rename(tmpname, filename)
+    except (IOError, OSError), e:
+        debug.dprint("SNAPSHOT: save_pickle(); failed to save %s: %s"
+            %(filename, str(e)))
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        return False
+    return True
+
+def load_pickle(filename, version):
+    """Returns the dictionary save_pickle() saved to filename,
+    or None if there is none, it can not be read or it was saved
+    with another version"""
+    if not os.access(filename, os.R_OK):
+        debug.dprint("SNAPSHOT: load_pickle(); file does not exist: " + filename)
+        return None
+    try:
+        _file = open(filename, "rb")
+        data = cPickle.load(_file)
+        _file.close()
+    except Exception, e:
+        debug.dprint("SNAPSHOT: load_pickle(); failed to load %s: %s"
+            %(filename, str(e)))
+        return None
+    if not isinstance(data, dict) or data.get('version') != version:
+        debug.dprint("SNAPSHOT: load_pickle(); old version of %s, ignoring"
+            %filename)
+        return None
+    return data
+
+def save_snapshot(db, key, filename = SNAPSHOT_FILE):
+    """Saves a compact description of the DBBase db under key.
+    Only the package names and their installed/deprecated state
+    are stored, Package objects are rebuilt on load"""
+    installed = []
+    for category in db.installed:
+        for name in db.installed[category]:
+            installed.append(category + '/' + name)
+    nodes = [(data.full_name, data.deprecated) for name, data in db.list]
+    debug.dprint("SNAPSHOT: save_snapshot(); saving %d nodes to file: %s"
+        %(len(nodes), filename))
+    return save_pickle(filename, {'key': key, 'nodes': nodes,
+        'installed': installed, 'signatures': db.cache_signatures},
+        SNAPSHOT_VERSION)
+
+def load_snapshot(key, filename = SNAPSHOT_FILE):
+    """Returns (nodes, installed, signatures) from the saved snapshot
+    if it matches key, else None"""
+    _db = load_pickle(filename, SNAPSHOT_VERSION)
+    if _db is None:
+        return None
+    if _db['key'] != key:
+        debug.dprint("SNAPSHOT: load_snapshot(); snapshot is out of date")
+        return None
+    return _db['nodes'], _db['installed'], _db['signatures']
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""
+    System set resolver
+    Expands the profile's system set with the dependencies of its
+    packages, the list 'emerge -ep system' would show, without running
+    emerge.  The result is saved and reused while the tree, the user
+    config and the profile are unchanged.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+from collections import deque
+
+from porthole.utils import debug
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.backends.utilities import reduce_depends, get_merge_flags
+from porthole.db.snapshot import get_tree_state, get_config_state, get_vdb_state, \
+    _path_state, save_pickle, load_pickle
+from porthole import config
+
+# Set EPREFIX
+EPREFIX = config.Prefs.EPREFIX
+
+# bump this whenever the layout of the saved data changes
+SYSTEMSET_VERSION = 2
+
+SYSTEMSET_FILE = EPREFIX + "/var/db/porthole/system.db"
+
+
+def get_system_key():
+    """Returns a key describing everything the expanded system set
+    depends on: the tree, the user config, the profile and the vdb,
+    the || ( ) alternatives are chosen by what is installed"""
+    profiles = [(path, _path_state(path)) for path in PMS_LIB.get_profile_paths()]
+    return (get_tree_state(), get_config_state(), tuple(profiles),
+        get_vdb_state())
+
+def choose_alternative(alternatives):
+    """Picks the || ( ) alternative emerge would: the first one that
+    is already installed, else the first one that can be"""
+    for atoms in alternatives:
+        if not [atom for atom in atoms if not PMS_LIB.get_installed(atom)]:
+            return atoms
+    for atoms in alternatives:
+        if not [atom for atom in atoms if not PMS_LIB.get_best_ebuild(atom)]:
+            return atoms
+    return alternatives[0]
+
+def get_ebuild_depends(cpv):
+    """Returns the atoms of the DEPEND, RDEPEND, PDEPEND, BDEPEND and
+    IDEPEND of cpv that apply with the USE flags it is merged with"""
+    props = PMS_LIB.get_properties(cpv)
+    return reduce_depends(props.get_all_depends(), get_merge_flags(cpv),
+        choose_alternative)
+
+def resolve_system_set(please_die = None):
+    """Walks the dependencies of the system set breadth first,
+    returns (the list of cpv's it pulls in, the atoms no visible
+    or installed ebuild matches)"""
+    queue = deque(PMS_LIB.get_system_atoms())
+    seen = set()
+    cpvs = set()
+    unresolved = []
+    while queue:
+        if please_die and please_die():
+            break
+        atom = queue.popleft()
+        if atom in seen:
+            continue
+        seen.add(atom)
+        cpv = PMS_LIB.get_best_ebuild(atom)
+        if not cpv:
+            # only masked ebuilds or package.provided, emerge keeps
+            # the installed version
+            cpv = PMS_LIB.find_best_match(atom)
+            if not cpv:
+                unresolved.append(atom)
+                continue
+        if cpv in cpvs:
+            continue
+        cpvs.add(cpv)
+        queue.extend([dep for dep in get_ebuild_depends(cpv) if dep not in seen])
+    debug.dprint("SYSTEMSET: resolve_system_set(); %d ebuilds from %d atoms, %d unresolved"
+        %(len(cpvs), len(seen), len(unresolved)))
+    return sorted(cpvs), unresolved
+
+def save_system_set(cpvs, unresolved, key, filename = SYSTEMSET_FILE):
+    """Saves a resolve_system_set() result under key"""
+    debug.dprint("SYSTEMSET: save_system_set(); saving %d ebuilds to file: %s"
+        %(len(cpvs), filename))
+    return save_pickle(filename, {'key': key, 'cpvs': cpvs,
+        'unresolved': unresolved}, SYSTEMSET_VERSION)
+
+def load_system_set(key, filename = SYSTEMSET_FILE):
+    """Returns the saved (cpvs, unresolved) if they match key, else None"""
+    _db = load_pickle(filename, SYSTEMSET_VERSION)
+    if _db is None:
+        return None
+    if _db['key'] != key:
+        debug.dprint("SYSTEMSET: load_system_set(); system set is out of date")
+        return None
+    return _db['cpvs'], _db['unresolved']
+
+def get_system_cpvs(use_cache = True, please_die = None):
+    """Returns (cpvs, unresolved atoms) of the expanded system set,
+    from the saved one while it is up to date"""
+    key = get_system_key()
+    if use_cache:
+        cached = load_system_set(key)
+        if cached is not None:
+            return cached
+    cpvs, unresolved = resolve_system_set(please_die)
+    if use_cache and not (please_die and please_die()):
+        save_system_set(cpvs, unresolved, key)
+    return cpvs, unresolved
+
+def get_system_set(use_cache = True, please_die = None):
+    """Returns the frozenset of the cat/pkg names in the expanded
+    system set, the unresolved ones included"""
+    cpvs, unresolved = get_system_cpvs(use_cache, please_die)
+    return frozenset([PMS_LIB.get_full_name(x) for x in cpvs + unresolved])
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+    Upgrade list cache
+    Saves the lists built by the UpgradableListReader, so they can be
+    shown straight away while the tree, vdb and config are unchanged.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+from gettext import gettext as _
+
+from porthole.utils import debug
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.db.snapshot import get_snapshot_key, _path_state, save_pickle, load_pickle
+from porthole import config
+
+# Set EPREFIX
+EPREFIX = config.Prefs.EPREFIX
+
+# bump this whenever the layout of the saved data changes
+UPGRADES_VERSION = 1
+
+UPGRADES_FILE = EPREFIX + "/var/db/porthole/upgrades.db"
+
+
+def get_upgrades_key():
+    """Returns a key describing everything the upgrade lists depend on:
+    the tree, the vdb and its merge counter, the world file, sets and
+    package.* config (see snapshot.get_snapshot_key()) and the profile"""
+    profiles = [(path, _path_state(path)) for path in PMS_LIB.get_profile_paths()]
+    return (get_snapshot_key(), PMS_LIB.get_vdb_counter(), tuple(profiles))
+
+def save_upgrades(cat_order, pkg_dict, key, filename = UPGRADES_FILE):
+    """Saves the upgrade lists pkg_dict, in cat_order, under key with
+    the versions each package's upgrade was found from"""
+    lists = {}
+    versions = {}
+    for list_name in cat_order:
+        lists[list_name] = []
+        for full_name, package in pkg_dict.get(list_name, {}).iteritems():
+            if full_name == _("None"):
+                continue
+            lists[list_name].append(full_name)
+            versions[full_name] = (package.best_ebuild,
+                package.latest_installed, package.upgradable)
+    debug.dprint("UPGRADECACHE: save_upgrades(); saving %d upgrades to file: %s"
+        %(len(versions), filename))
+    return save_pickle(filename, {'key': key, 'cat_order': cat_order,
+        'lists': lists, 'versions': versions}, UPGRADES_VERSION)
+
+def load_upgrades(filename = UPGRADES_FILE):
+    """Returns (key, cat_order, {list name: [full_name, ...]},
+    {full_name: (best, latest installed, upgradable)}) of the last
+    saved upgrade lists, or None"""
+    _db = load_pickle(filename, UPGRADES_VERSION)
+    if _db is None:
+        return None
+    return _db['key'], _db['cat_order'], _db['lists'], _db['versions']
@@ -132,6 +132,8 @@ class UserConfigs:
         # main index files
         self.db = {}
         self.sources = {}
+        # set file: frozenset of its cp's, see get_set_members()
+        self._set_members = None
         for mytype in CONFIG_TYPES:
             self.db[mytype] = {}
             self.sources[mytype] = {}
@@ -418,6 +420,8 @@ class UserConfigs:
         debug.dprint(" * USER_CONFIGS: reload_file(): mytype = " + mytype +
             ", file = " + file )
         #return # for now
+        if mytype == "SETS":
+            self._set_members = None
         # load the file to a temp_db
         temp_db = {}
         temp_sources = {}
@@ -467,3 +471,12 @@ class UserConfigs:
         for atom in self.sources[mytype][key]:
             newlist.append(atom.name)
         return newlist[:]
+
+    def get_set_members(self):
+        """Returns a dictionary of set file: frozenset of the cp's in it,
+        built once and kept until a set file is reloaded"""
+        if self._set_members is None:
+            self._set_members = {}
+            for key in self.get_source_keys("SETS"):
+                self._set_members[key] = frozenset(self.get_source_cplist("SETS", key))
+        return self._set_members
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+    VdbWatcher, watches the installed package database (vdb)
+    for merges and unmerges and reports the changed packages
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os
+import gobject
+
+from porthole.utils import debug
+from porthole.backends import portage_lib as PMS_LIB
+
+try:
+    import pyinotify
+    HAS_INOTIFY = True
+except ImportError:
+    HAS_INOTIFY = False
+
+# ms between checks of the vdb when inotify is not available
+POLL_INTERVAL = 2000
+# ms to wait for more events before reporting, portage touches
+# a vdb entry several times during a merge
+SETTLE_DELAY = 500
+
+
+class VdbWatcher(object):
+    """Watches the vdb category dirs and calls callback(added, removed)
+    in the gtk main loop with the lists of cpv's that were merged or
+    unmerged.  Uses inotify if pyinotify is installed, otherwise it
+    polls the category dir mtimes."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.path = PMS_LIB.get_vdb_path()
+        # category: (mtime, {installed pvr: mtime})
+        self.state = {}
+        self.dirty = set()
+        self.settle_id = None
+        self.source_id = None
+        self.wm = None
+        self.mask = 0
+        self.notifier = None
+        for category in self._categories():
+            self.state[category] = self._read_category(category)
+
+    def _categories(self):
+        try:
+            return [x for x in os.listdir(self.path)
+                if os.path.isdir(os.path.join(self.path, x))]
+        except OSError:
+            return []
+
+    def _read_category(self, category):
+        """returns (mtime, {pvr: mtime}) for a vdb category dir"""
+        path = os.path.join(self.path, category)
+        entries = {}
+        try:
+            mtime = os.stat(path).st_mtime
+            for pvr in os.listdir(path):
+                # skip portage's -MERGING- and other temporary entries
+                if pvr.startswith('-') or pvr.startswith('.'):
+                    continue
+                entries[pvr] = os.stat(os.path.join(path, pvr)).st_mtime
+        except OSError:
+            return (0, {})
+        return (mtime, entries)
+
+    def start(self):
+        """start watching the vdb"""
+        if self.source_id:
+            return
+        if HAS_INOTIFY:
+            try:
+                self.wm = pyinotify.WatchManager()
+                mask = (pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                    pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM)
+                self.mask = mask
+                # only the vdb and its category dirs, not every entry dir
+                self.wm.add_watch([self.path] + [os.path.join(self.path, x)
+                    for x in self.state], mask)
+                self.notifier = pyinotify.Notifier(self.wm, self._on_event,
+                    timeout=0)
+                self.source_id = gobject.io_add_watch(self.wm.get_fd(),
+                    gobject.IO_IN, self._on_inotify)
+                debug.dprint("VDBWATCHER: start(); watching %s with inotify" %self.path)
+                return
+            except Exception, e:
+                debug.dprint("VDBWATCHER: start(); inotify failed, polling instead: " + str(e))
+                self.wm = self.notifier = None
+        self.source_id = gobject.timeout_add(POLL_INTERVAL, self._poll)
+        debug.dprint("VDBWATCHER: start(); polling %s" %self.path)
+
+    def stop(self):
+        """stop watching the vdb"""
+        if self.source_id:
+            gobject.source_remove(self.source_id)
+            self.source_id = None
+        if self.settle_id:
+            gobject.source_remove(self.settle_id)
+            self.settle_id = None
+        if self.notifier:
+            self.notifier.stop()
+            self.notifier = self.wm = None
+
+    def _on_inotify(self, source, condition):
+        """gobject io watch callback for the inotify fd"""
+        self.notifier.read_events()
+        self.notifier.process_events()
+        return True
+
+    def _on_event(self, event):
+        """pyinotify event callback, mark the category as changed"""
+        relpath = os.path.relpath(event.path, self.path)
+        if relpath == '.':
+            category = event.name
+            if event.dir and event.mask & (pyinotify.IN_CREATE |
+                    pyinotify.IN_MOVED_TO):
+                # a new category
+                self.wm.add_watch(event.pathname, self.mask)
+        else:
+            category = relpath.split(os.sep)[0]
+        if category:
+            self.dirty.add(category)
+            self._schedule()
+
+    def _poll(self):
+        """timeout callback, checks the category dir mtimes"""
+        for category in self._categories():
+            try:
+                mtime = os.stat(os.path.join(self.path, category)).st_mtime
+            except OSError:
+                continue
+            if category not in self.state or self.state[category][0] != mtime:
+                self.dirty.add(category)
+        for category in self.state:
+            if not os.path.isdir(os.path.join(self.path, category)):
+                self.dirty.add(category)
+        if self.dirty:
+            self._schedule()
+        return True
+
+    def _schedule(self):
+        """wait for the merge to settle before reporting"""
+        if self.settle_id:
+            gobject.source_remove(self.settle_id)
+        self.settle_id = gobject.timeout_add(SETTLE_DELAY, self._report)
+
+    def _report(self):
+        """diff the changed categories and pass the results on"""
+        self.settle_id = None
+        added = []
+        removed = []
+        dirty, self.dirty = self.dirty, set()
+        for category in dirty:
+            old = self.state.get(category, (0, {}))[1]
+            mtime, new = self._read_category(category)
+            if mtime:
+                # an emptied category dir is kept with its mtime,
+                # else every _poll() would find it changed again
+                self.state[category] = (mtime, new)
+            elif category in self.state:
+                del self.state[category]
+            # a re-merge of the same version replaces the entry dir,
+            # so it shows up as a new mtime
+            added.extend([category + '/' + x for x in new
+                if old.get(x) != new[x]])
+            removed.extend([category + '/' + x for x in old if x not in new])
+        if added or removed:
+            debug.dprint("VDBWATCHER: _report(); added: %s, removed: %s"
+                %(str(added), str(removed)))
+            self.callback(added, removed)
+        return False
@@ -29,6 +29,7 @@ from gettext import gettext as _
 
 from porthole.utils import debug
 from porthole import backends
+from porthole import db
 portage_lib = backends.portage_lib
 from porthole import config
 
@@ -168,7 +169,26 @@ def load_installed_files(window, view, package = None, ebuild = None):
             return
         d= {"installed_count" : len(installed_files), "ebuild" : ebuild}
         view.set_text((_("%(installed_count)i installed files for: %(ebuild)s \n\n") % d) 
-                            + "\n".join(installed_files))
+                            + "\n".join(installed_files) + get_collisions_text(installed_files, ebuild))
+
+def get_collisions_text(installed_files, ebuild):
+        """Returns the lines listing the installed_files of ebuild
+        other installed packages also own, if there are any and the
+        installed file index is loaded"""
+        collisions = db.db.get_file_collisions(installed_files)
+        if not collisions:
+            return ''
+        lines = []
+        for path in sorted(collisions):
+            others = [cpv for cpv in collisions[path] if cpv != ebuild]
+            if others:
+                lines.append("%s  (%s)" %(path, ", ".join(others)))
+        if not lines:
+            return ''
+        debug.dprint("LOADERS: get_collisions_text(); %d files of %s collide"
+            %(len(lines), ebuild))
+        return (_("\n\n%i files also installed by other packages:\n\n") % len(lines)
+            + "\n".join(lines))
 
 
 def load_web_page(name):
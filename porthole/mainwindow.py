@@ -148,6 +148,7 @@ class MainWindow(PluginHandler):
         # initialize our data
         self.init_data()
         self.search_dispatcher = Dispatcher(self.search_done)
+        self.search_batch_dispatcher = Dispatcher(self.search_batch)
         debug.dprint("MAINWINDOW: Showing main window")
         self.mainwindow.show_all()
         if self.is_root:
@@ -167,6 +168,7 @@ class MainWindow(PluginHandler):
         self.status.set_statusbar2(_("Initializing database. Please wait..."))
         self.set_cancel_btn(OFF)
         db.db.set_callback(self.update_db_read)
+        db.db.set_installed_callback(self.update_installed)
         # init some dictionaries
         self.loaded_callback = {}
         self.current_cat_name = {}
@@ -194,6 +196,9 @@ class MainWindow(PluginHandler):
         # next add any index names that need to be reset on a reload
         self.loaded_resets = ["Search", "Deprecated", "Binpkgs"]
         self.current_search = None
+        self.search_order = {}
+        # the search whose matches are being added to the package view
+        self.streaming_search = None
         # descriptions loaded?
         #self.desc_loaded = False
         # view filter setting
@@ -267,6 +272,10 @@ class MainWindow(PluginHandler):
         """Set whether or not to search descriptions"""
         config.Prefs.main.search_desc = widget.get_active()
 
+    def search_ranked_set(self, widget):
+        """Set whether or not to rank the search results"""
+        config.Prefs.main.search_ranked = widget.get_active()
+
     def emerge_btn(self, widget, sudo=False):
         """callback for the emerge toolbutton and menu entries"""
         if not self.process_selection("emerge"):
@@ -367,20 +376,59 @@ class MainWindow(PluginHandler):
         return True
 
     # start of search callback
-    def search_done( self ):
+    def search_batch( self, reader, names ):
+        """show the progress and the matches found so far
+        of the search thread"""
+        if (reader is not self.search_thread or reader.cancelled or
+                reader is self.last_search):
+            # superseded, or already shown by search_done()
+            return
+        if reader.total:
+            fraction = min(1.0, reader.count / float(reader.total))
+            self.status.progress(str(int(fraction * 100)) + "%", fraction)
+        self.status.set_statusbar2(_("Searching for %(term)s: %(count)d found")
+            % {'term': reader.tmp_search_term, 'count': reader.pkg_count})
+        if reader.ranked:
+            # the rows are only known, in order, at the end
+            return
+        if self.streaming_search is not reader:
+            self.streaming_search = reader
+            self.package_view.start_stream(reader.package_list)
+        # does nothing if the view has been changed since
+        self.package_view.append(reader.package_list, names)
+
+    def search_done( self, reader ):
         """show the search results from the search thread"""
-        #if self.search_thread.done:
-        if not self.search_thread.cancelled:
-            # grab the list
-            package_list = self.search_thread.package_list
-            count = self.search_thread.pkg_count
-            search_term = self.search_thread.search_term
-            # kill off the thread
-            self.search_thread.join()
+        # kill off the thread
+        reader.join()
+        if reader is not self.search_thread or reader.cancelled:
+            # superseded by a newer search
+            return
+        # grab the list
+        package_list = reader.package_list
+        count = reader.pkg_count
+        search_term = reader.search_term
+        self.last_search = reader
+        self.last_search_list = db.db.list
+        self.streaming_search = None
         # in case the search view was already active
         self.status.update_statusbar(SHOW_SEARCH)
+        self.status.progress()
+        # search as you type replaces its last result
+        typed = self.typed_search_term
+        if (reader.incremental and typed and typed != search_term and
+                typed in self.pkg_list["Search"]):
+            del self.pkg_list["Search"][typed]
+            del self.pkg_count["Search"][typed]
+            self.search_order.pop(typed, None)
+        if reader.incremental:
+            self.typed_search_term = search_term
+        else:
+            self.typed_search_term = None
         self.pkg_list["Search"][search_term] = package_list
         self.pkg_count["Search"][search_term] = count
+        # the ranked order, None for the usual alphabetic one
+        self.search_order[search_term] = reader.order
         #Add the current search item & select it
         self.category_view.populate(self.pkg_list["Search"].keys(), True,
             self.pkg_count["Search"])
@@ -391,7 +439,7 @@ class MainWindow(PluginHandler):
                 selection.select_iter(_iter)
                 break
             _iter = self.category_view.model.iter_next(_iter)
-        self.package_view.populate(package_list)
+        self.package_view.populate(package_list, order = reader.order)
         if count == 1: # then select it
             self.current_pkg_name["Search"] = package_list.keys()[0]
         self.category_view.last_category = search_term
@@ -479,11 +527,17 @@ class MainWindow(PluginHandler):
                     "') reader_running = %s ********************************"
                     %self.reader_running)
                 self.load_reader_list(INDEX_TYPES[myview])
-                self.package_view.clear()
-                self.category_view.clear()
+                # the last upgrade lists are shown while the reader runs
+                stale = (INDEX_TYPES[myview] == "Upgradable" and
+                    self.pkg_list[INDEX_TYPES[myview]] != {})
+                if not stale:
+                    self.package_view.clear()
+                    self.category_view.clear()
                 debug.dprint("MAINWINDOW: view_filter_changed(); " +
                     "back from load_reader_list('" + INDEX_TYPES[myview] + "')")
             else:
+                stale = False
+            if self.loaded[INDEX_TYPES[myview]] or stale:
                 debug.dprint("MAINWINDOW: view_filter_changed(); " +
                     "calling category_view.populate() with categories:" +
                     str(self.pkg_list[INDEX_TYPES[myview]].keys()))
@@ -536,7 +590,11 @@ class MainWindow(PluginHandler):
         if reader == "Deprecated":
             self.reader = DeprecatedReader(db.db.installed.items())
         elif reader == "Upgradable":
-            self.reader = UpgradableListReader(db.db.installed.items())
+            # the lists in memory are shown while they are checked,
+            # without any the reader loads the last saved ones
+            self.reader = UpgradableListReader(db.db.installed.items(),
+                workers = db.db.scan_workers(),
+                show_saved = not self.pkg_list[reader])
         elif reader == "Sets":
             self.reader = SetListReader()
 
@@ -566,7 +624,9 @@ class MainWindow(PluginHandler):
             debug.dprint("MAINWINDOW: update_reader_thread(): " +
                 "self.reader.done detected")
             return self._reader_done(reader_type)
-        elif self.reader.progress < 2:
+        if reader_type == "Upgradable" and self.reader.saved_lists:
+            self._show_saved_lists(reader_type)
+        if self.reader.progress < 2:
             # Still building system package list nothing to do
             pass
         else:
@@ -611,11 +671,30 @@ class MainWindow(PluginHandler):
                     'replace'))
             return False  # disconnect from timeout
         else: # args["done"] == True - db_thread is done
+            if 'delta' in args:
+                debug.dprint("MAINWINDOW: update_db_read(); refreshed db: " +
+                    "%d added, %d removed, %d changed"
+                    %(len(args['delta']['added']), len(args['delta']['removed']),
+                    len(args['delta']['changed'])))
             self._update_db_done()
         #debug.dprint("StatusHandler: returning from update_db_read() " +
             #"count=%d dbtime=%d"  %(count, self.dbtime))
         return True
 
+    def update_installed(self, packages):
+        """db callback, the vdb watcher detected merges or unmerges
+        of packages and the db has been patched, update the views"""
+        debug.dprint("MAINWINDOW: update_installed(); packages = " +
+            str(packages))
+        mode = self.widget["view_filter"].get_active()
+        self.loaded["Deprecated"] = False
+        if mode != SHOW_UPGRADE:
+            # reset the upgrades list if it is loaded and not being viewed
+            self.loaded["Upgradable"] = False
+        if mode in [SHOW_ALL, SHOW_INSTALLED]:
+            self.refresh()
+        self.status.update_statusbar(mode, self.reader)
+
     def _update_db_statusbar(self, args):
         """update the statusbar on progress"""
         count = args["nodecount"]
@@ -727,6 +806,18 @@ class MainWindow(PluginHandler):
         self.reload = False
         return False  # disconnect from timeout
 
+    def _show_saved_lists(self, reader_type):
+        """show the lists the reader loaded from its cache until
+        it has made the new ones"""
+        self.pkg_list[reader_type], self.pkg_count[reader_type] = \
+            self.reader.saved_lists
+        self.reader.saved_lists = None
+        debug.dprint("MAINWINDOW: _show_saved_lists(): " +
+            "showing the saved '%s' lists" %reader_type)
+        if self.last_view_setting == SHOW_UPGRADE:
+            self.category_view.populate(self.pkg_list[reader_type].keys(),
+                True, self.pkg_count[reader_type])
+
     def _reader_done(self, reader_type):
         """perform the cleanup"""
         self.reader.join()
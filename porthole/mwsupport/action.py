@@ -191,6 +191,11 @@ class ActionHandler(CategoryHandler):
                 callback = self.sync_callback #self.init_data
                 debug.dprint("MAINWINDOW: setup_command(); " +
                     "callback set to self.sync_callback")
+            elif db.db.vdb_watcher:
+                # the vdb watcher updates the installed packages
+                callback = lambda: None
+                debug.dprint("MAINWINDOW: setup_command(); " +
+                    "vdb watcher running, callback set to lambda: None")
             else:
                 #debug.dprint("MAINWINDOW: setup_command(); " +
                     #"setting callback()")
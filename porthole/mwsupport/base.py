@@ -100,10 +100,12 @@ class MainBase(object):
             "on_upgrade_packages" : self.upgrade_packages,
             "on_package_search" : self.package_search,
             "on_search_entry_activate": self.package_search,
+            "on_search_entry_changed": self.search_entry_changed,
             "on_help_contents" : self.help_contents,
             "on_about" : self.about,
             "view_filter_changed" : self.view_filter_changed,
             "on_search_descriptions1_activate" : self.search_set,
+            "on_search_ranked1_activate" : self.search_ranked_set,
             "on_open_log" : self.open_log,
             "on_run_custom" : self.custom_run,
             "on_reload_db" : self.reload_db,
@@ -116,6 +118,8 @@ class MainBase(object):
             "on_configure_porthole" : self.configure_porthole,
         }
         self.wtree.signal_autoconnect(self.callbacks)
+        self.wtree.get_widget("search_ranked1").set_active(
+            config.Prefs.main.search_ranked)
 
         # how should we setup our saved menus?
         settings = ["pretend", "fetch", "update", "verbose", "noreplace",
@@ -103,7 +103,8 @@ class CategoryHandler(PackageHandler):
         packages = self.pkg_list["Search"][category]
         # if search was a package name, select that one
         # (searching for 'python' for example would benefit)
-        self.package_view.populate(packages, category)
+        self.package_view.populate(packages, category,
+            self.search_order.get(category))
 
     def _mode_readers_(self, category, mode):
         packages = self.pkg_list[INDEX_TYPES[mode]][category]
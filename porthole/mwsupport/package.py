@@ -24,11 +24,12 @@
 '''
 
 from gettext import gettext as _
+import gobject
 
 from porthole import config
 from porthole import db
 from porthole.utils import utils, debug
-from porthole.readers.search import SearchReader
+from porthole.readers.search import SearchReader, parse_query
 from porthole.views.packagebook.notebook import PackageNotebook
 from porthole.views.package import PackageView
 from porthole.views.models import MODEL_ITEM as PACKAGE_MODEL_ITEM
@@ -37,6 +38,9 @@ from porthole.mwsupport.base import MainBase
 from porthole.mwsupport.constants import (INDEX_TYPES, SHOW_SEARCH,
     SHOW_DEPRECATED, GROUP_SELECTABLE)
 
+# ms to wait after the last keypress before searching
+SEARCH_DELAY = 300
+
 
 class PackageHandler(MainBase):
     '''Support functions for the maindow interface'''
@@ -51,6 +55,13 @@ class PackageHandler(MainBase):
         self.current_pkgview = None
         self.package_view = PackageView()
         self.search_thread = None
+        # the last finished search and the db list it searched,
+        # typed searches that extend it only look at its results
+        self.last_search = None
+        self.last_search_list = None
+        # the term of the last search as you type result
+        self.typed_search_term = None
+        self.search_timeout = None
         self.loaded = False
         # setup the package treeview
         #self.package_view.register_callbacks(self.package_changed,
@@ -99,13 +110,16 @@ class PackageHandler(MainBase):
         self.packagebook.set_package(package)
 
 
-    def package_search(self, widget=None):
+    def package_search(self, widget=None, incremental = False):
         """Search package db with a string and display results."""
         self.clear_package_detail()
-        if not db.db.desc_loaded and config.Prefs.main.search_desc:
+        tmp_search_term = self.wtree.get_widget("search_entry").get_text()
+        # the field queries are answered by the search index,
+        # which is built with the descriptions
+        if not db.db.desc_loaded and (config.Prefs.main.search_desc or
+                parse_query(tmp_search_term)[1]):
             self.load_descriptions_list()
             return
-        tmp_search_term = self.wtree.get_widget("search_entry").get_text()
         #debug.dprint(tmp_search_term)
         if tmp_search_term:
             # change view and statusbar so user knows it's searching.
@@ -118,13 +132,60 @@ class PackageHandler(MainBase):
                     % tmp_search_term)
             else:
                 self.set_statusbar2(_("Searching for %s") % tmp_search_term)
+            if self.search_thread and not self.search_thread.done:
+                # superseded, search_done() ignores it
+                self.search_thread.please_die()
+            db_list, index = self.get_search_list(tmp_search_term)
             # call the thread
-            self.search_thread = SearchReader(db.db.list,
+            self.search_thread = SearchReader(db_list,
                 config.Prefs.main.search_desc, tmp_search_term,
-                db.db.descriptions, self.search_dispatcher)
+                db.db.descriptions, self.search_dispatcher, index,
+                config.Prefs.main.search_ranked, config.Prefs.main.search_top_k,
+                self.search_batch_dispatcher)
+            self.search_thread.incremental = incremental
             self.search_thread.start()
         return
 
+    def get_search_list(self, search_term):
+        """Returns the (db list, search index) to search for search_term.
+        A term that contains the last search's term can only match
+        packages the last search found, so only those are searched."""
+        last = self.last_search
+        # the field queries match whole words, "use:gt" finds
+        # nothing "use:gtk" does, and they need the index
+        if parse_query(search_term)[1]:
+            return db.db.list, db.db.search_index
+        # a ranked search keeps only the top results and matches
+        # near misses, the next term's matches may not be among them
+        if (last and not last.ranked and not config.Prefs.main.search_ranked and
+                self.last_search_list is db.db.list and
+                last.search_desc == config.Prefs.main.search_desc and
+                last.tmp_search_term.lower() in search_term.lower()):
+            debug.dprint("PackageHandler: get_search_list(); narrowing the " +
+                "%d results for '%s'" %(last.pkg_count, last.tmp_search_term))
+            return [(data.name, data) for data in
+                last.package_list.itervalues()], None
+        return db.db.list, db.db.search_index
+
+    def search_entry_changed(self, widget):
+        """search as you type, once the typing pauses"""
+        if self.search_timeout:
+            gobject.source_remove(self.search_timeout)
+        self.search_timeout = gobject.timeout_add(SEARCH_DELAY,
+            self.search_typed)
+
+    def search_typed(self):
+        """search_entry_changed() timeout callback"""
+        self.search_timeout = None
+        if not db.db.desc_loaded and (config.Prefs.main.search_desc or
+                parse_query(self.wtree.get_widget("search_entry").get_text())[1]):
+            # don't pop up the descriptions dialog while typing,
+            # that waits for enter or the search button
+            return False
+        if self.wtree.get_widget("search_entry").get_text():
+            self.package_search(None, incremental = True)
+        return False
+
     def clear_package_detail(self):
         """tells packagebook to clear itself
         sets the package actions options off"""
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+'''
+    Porthole Reader Class: Dependency Closure
+    Finds everything an emerge of an ebuild would pull in that is not
+    installed yet and how much it would download, without running
+    emerge -p.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+'''
+
+import os
+from collections import deque
+
+from porthole.utils import debug
+from porthole.readers.commonreader import CommonReader
+from porthole.readers.depresolver import DepEbuildCache, dep_string
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.backends.utilities import get_merge_flags
+
+
+class Closure(object):
+    """The not yet installed ebuilds an emerge of cpv pulls in"""
+
+    def __init__(self, cpv, use_flags):
+        self.cpv = cpv
+        self.use_flags = use_flags
+        # sorted, cpv itself included if it is not installed
+        self.cpvs = []
+        # the dependencies no ebuild matches
+        self.unresolved = []
+        # the cpvs only found keyworded or masked
+        self.unmask = []
+        # distfile: size in bytes, of all the cpvs
+        self.distfiles = {}
+        # cpv: bytes of its own distfiles
+        self.sizes = {}
+        # bytes of all the distfiles and of the ones not in DISTDIR yet
+        self.size = 0
+        self.fetch_size = 0
+
+
+class DepClosure(object):
+    """Computes Closures.  The dependencies and distfiles of every
+    ebuild are kept, so the closures of ebuilds sharing dependencies
+    only resolve the new ones.  The results go stale when the tree or
+    the installed packages change, use a new instance then."""
+
+    def __init__(self):
+        # (cpv, frozenset of USE flags): (dependency cpvs, unresolved
+        # deps, the cpvs only found keyworded or masked, distfiles)
+        self.nodes = {}
+        self.flags = {}
+        self.installed = {}
+        self.ebuilds = DepEbuildCache()
+        self.hits = 0
+        self.misses = 0
+
+    def get_flags(self, cpv):
+        """Returns the frozenset of USE flags cpv would be merged with"""
+        try:
+            return self.flags[cpv]
+        except KeyError:
+            flags = self.flags[cpv] = frozenset(get_merge_flags(cpv))
+            return flags
+
+    def is_installed(self, atom, use_flags):
+        """Returns True if an installed package satisfies DependAtom atom"""
+        dep = atom.get_depname() + atom.get_required_use()
+        try:
+            return self.installed[dep]
+        except KeyError:
+            installed = self.installed[dep] = bool(atom.is_satisfied(use_flags))
+            return installed
+
+    def _resolvable(self, atom):
+        """True if visible ebuilds satisfy the package atoms of atom"""
+        if atom.mytype in ('DEP', 'REVISIONABLE'):
+            return bool(self.ebuilds.resolve(dep_string(atom))[0])
+        if atom.mytype == 'GROUP':
+            return not [x for x in atom.children if not self._resolvable(x)]
+        return True
+
+    def _choose(self, alternatives, use_flags):
+        """Picks the || ( ) alternative emerge would: the first one
+        that is already installed, else the first one that can be"""
+        for atom in alternatives:
+            if atom.mytype in ('DEP', 'REVISIONABLE'):
+                if self.is_installed(atom, use_flags):
+                    return atom
+            else:
+                satisfied = atom.is_satisfied(use_flags)
+                if satisfied and satisfied != -1:
+                    return atom
+        for atom in alternatives:
+            if self._resolvable(atom):
+                return atom
+        return alternatives[0]
+
+    def _add_deps(self, atoms, use_flags, node):
+        """adds the ebuilds of the unsatisfied package atoms of atoms
+        that apply with use_flags to node"""
+        deps, unresolved, unmask = node
+        for atom in atoms:
+            mytype = atom.mytype
+            if mytype in ('DEP', 'REVISIONABLE'):
+                if self.is_installed(atom, use_flags):
+                    continue
+                best, keyworded, masked = self.ebuilds.resolve(dep_string(atom))
+                ebuild = best or keyworded or masked
+                if not ebuild:
+                    unresolved.append(atom.get_depname())
+                    continue
+                deps.append(ebuild)
+                if not best:
+                    unmask.append(ebuild)
+            elif mytype == 'USING':
+                if atom.useflag in use_flags:
+                    self._add_deps(atom.children, use_flags, node)
+            elif mytype == 'NOTUSING':
+                if atom.useflag not in use_flags:
+                    self._add_deps(atom.children, use_flags, node)
+            elif mytype == 'GROUP':
+                self._add_deps(atom.children, use_flags, node)
+            elif mytype == 'OPTION' and atom.children:
+                self._add_deps([self._choose(atom.children, use_flags)], use_flags, node)
+
+    def get_node(self, cpv, use_flags, parser):
+        """Returns the (dependency cpvs, unresolved deps, cpvs to
+        unmask, distfiles) of cpv merged with use_flags"""
+        key = (cpv, use_flags)
+        try:
+            node = self.nodes[key]
+            self.hits += 1
+            return node
+        except KeyError:
+            self.misses += 1
+        props = PMS_LIB.get_properties(cpv)
+        parser.cache.reset()
+        atoms = parser.parse(props.get_all_depends().split())
+        deps, unresolved, unmask = [], [], []
+        self._add_deps(atoms, use_flags, (deps, unresolved, unmask))
+        node = (tuple(deps), tuple(unresolved), tuple(unmask),
+            PMS_LIB.get_distfiles(cpv, use_flags))
+        self.nodes[key] = node
+        return node
+
+    def get(self, cpv, use_flags = None, please_die = None):
+        """Returns the Closure of cpv, merged with use_flags or with
+        the USE flags from the user's config if it is None"""
+        # imported here, the views import porthole.db
+        from porthole.views.packagebook.depends import Depends
+        parser = Depends()
+        if use_flags is None:
+            use_flags = self.get_flags(cpv)
+        closure = Closure(cpv, frozenset(use_flags))
+        cpvs = set()
+        unresolved = set()
+        unmask = set()
+        if not PMS_LIB.get_installed('=' + cpv):
+            cpvs.add(cpv)
+        # the ebuilds are walked once each, whatever cycles the
+        # dependencies have
+        seen = set([cpv])
+        queue = deque([(cpv, closure.use_flags)])
+        while queue:
+            if please_die and please_die():
+                break
+            ebuild, flags = queue.popleft()
+            try:
+                deps, node_unresolved, node_unmask, distfiles = \
+                    self.get_node(ebuild, flags, parser)
+            except Exception, e:
+                debug.dprint("READERS: DepClosure(); failed for %s: %s" %(ebuild, str(e)))
+                continue
+            unresolved.update(node_unresolved)
+            unmask.update(node_unmask)
+            if ebuild in cpvs:
+                closure.distfiles.update(distfiles)
+                closure.sizes[ebuild] = sum(distfiles.values())
+            for dep in deps:
+                if dep not in seen:
+                    seen.add(dep)
+                    cpvs.add(dep)
+                    queue.append((dep, self.get_flags(dep)))
+        closure.cpvs = sorted(cpvs)
+        closure.unresolved = sorted(unresolved)
+        closure.unmask = sorted(unmask)
+        distdir = PMS_LIB.get_distdir()
+        for name, size in closure.distfiles.iteritems():
+            closure.size += size
+            try:
+                if os.stat(os.path.join(distdir, name)).st_size == size:
+                    continue
+            except OSError:
+                pass
+            closure.fetch_size += size
+        debug.dprint("READERS: DepClosure(); %s: %d ebuilds, %d bytes to fetch, nodes %d hits, %d misses"
+            %(cpv, len(closure.cpvs), closure.fetch_size, self.hits, self.misses))
+        return closure
+
+
+class ClosureReader(CommonReader):
+    """ Compute the Closure of an ebuild in a thread.  The result is
+    passed back to the gtk thread through dispatcher(self). """
+    def __init__( self, dep_closure, cpv, use_flags = None, callback = None,
+                dispatcher = None ):
+        """ Initialize """
+        CommonReader.__init__(self)
+        self.dep_closure = dep_closure
+        self.cpv = cpv
+        self.use_flags = use_flags
+        # callback(closure) for the caller
+        self.callback = callback
+        self.dispatcher = dispatcher
+        self.closure = None
+
+    def run( self ):
+        """ Compute the closure """
+        debug.dprint("READERS: ClosureReader(); process id = %d, cpv = %s"
+            %(os.getpid(), self.cpv))
+        misses = self.dep_closure.misses
+        self.closure = self.dep_closure.get(self.cpv, self.use_flags,
+            lambda: self.cancelled)
+        self.count = self.dep_closure.misses - misses
+        self.done = True
+        if self.dispatcher:
+            self.dispatcher(self)
@@ -36,6 +36,9 @@ class CommonReader(threading.Thread):
         self.done = False
         # cancelled will be set when the thread should stop
         self.cancelled = False
+        # True while the results held are out of date ones,
+        # shown until the thread has made new ones
+        self.stale = False
         # quit even if thread is still running
         self.setDaemon(1)
         print >>stderr,  "threading.enumerate() = ",threading.enumerate()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+'''
+    Porthole Reader Class: Dependency Resolver
+    Resolves the dependencies of an ebuild a few levels ahead of what
+    the dependency tree shows, so expanding a row is a cache lookup.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+'''
+
+import os
+from collections import deque
+from thread import allocate_lock
+
+from porthole.utils import debug
+from porthole.readers.commonreader import CommonReader
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.views.packagebook.depends import tokenize
+
+# how many levels below a shown row are resolved in advance
+RESOLVE_AHEAD = 3
+
+
+def dep_string(atom):
+    """Returns the string a DependAtom is resolved with, the same
+    one the resolver reads from the ebuild's dependencies"""
+    if atom.mytype == 'REVISIONABLE':
+        return '~' + atom.atom
+    if atom.mytype == 'BLOCKER':
+        return '!' + atom.atom
+    return atom.atom
+
+def get_dep_strings(ebuild):
+    """Returns the package atoms of the DEPEND, RDEPEND and PDEPEND
+    of ebuild, under any USE flag, blockers left out"""
+    props = PMS_LIB.get_properties(ebuild)
+    tokens = tokenize(' '.join([props.depend, props.rdepend, props.pdepend]).split())
+    deps = []
+    seen = set()
+    for token in tokens:
+        if (token in ('(', ')', '||') or token.endswith('?')
+                or token.startswith('!') or token in seen):
+            continue
+        seen.add(token)
+        deps.append(token)
+    return deps
+
+
+class DepEbuildCache(object):
+    """dep string: (best, keyworded, masked) ebuilds, as returned by
+    get_dep_ebuild(), filled by the DepResolver and the gui thread"""
+
+    def __init__(self):
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, dep):
+        return dep in self._results
+
+    def resolve(self, dep):
+        """Returns the cached ebuilds for dep, resolving it now if
+        it is not cached yet"""
+        try:
+            result = self._results[dep]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            result = PMS_LIB.get_dep_ebuild(dep)
+            self._results[dep] = result
+        return result
+
+
+class DepResolver(CommonReader):
+    """ Walk the dependencies of some ebuilds breadth first, filling a
+    DepEbuildCache.  Only the unsatisfied dependencies are followed,
+    as the dependency tree only adds kids for those. """
+    def __init__( self, cache ):
+        """ Initialize """
+        CommonReader.__init__(self)
+        self.cache = cache
+        # (ebuild, levels left to resolve below it)
+        self.queue = deque()
+        # ebuild: the most levels resolved below it so far, a push
+        # asking for more walks it again
+        self.seen = {}
+        self.lock = allocate_lock()
+
+    def push( self, ebuilds, levels = RESOLVE_AHEAD ):
+        """ Queue ebuilds ahead of the earlier ones.  Returns False if
+        the thread has already finished, a new one is needed then. """
+        self.lock.acquire()
+        try:
+            if self.done:
+                return False
+            for ebuild in ebuilds:
+                self.queue.appendleft((ebuild, levels))
+            return True
+        finally:
+            self.lock.release()
+
+    def run( self ):
+        """ Resolve until the queue is empty """
+        debug.dprint("READERS: DepResolver(); process id = %d" %os.getpid())
+        while not self.cancelled:
+            self.lock.acquire()
+            try:
+                if not self.queue:
+                    self.done = True
+                    break
+                ebuild, levels = self.queue.popleft()
+            finally:
+                self.lock.release()
+            if self.seen.get(ebuild, 0) >= levels:
+                continue
+            self.seen[ebuild] = levels
+            try:
+                self.resolve(ebuild, levels)
+            except Exception, e:
+                debug.dprint("READERS: DepResolver(); failed for %s: %s"
+                    %(ebuild, str(e)))
+        self.done = True
+        debug.dprint("READERS: DepResolver(); done, %d atoms resolved" %self.count)
+
+    def resolve( self, ebuild, levels ):
+        """ Resolve the dependencies of ebuild and queue the ebuilds
+        of the unsatisfied ones """
+        for dep in get_dep_strings(ebuild):
+            if self.cancelled:
+                return
+            if dep not in self.cache:
+                self.count += 1
+            best, keyworded, masked = self.cache.resolve(dep)
+            if levels > 1 and not PMS_LIB.get_installed(dep):
+                dep_ebuild = best or keyworded or masked
+                if dep_ebuild and self.seen.get(dep_ebuild, 0) < levels - 1:
+                    self.queue.append((dep_ebuild, levels - 1))
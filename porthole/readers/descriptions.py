@@ -23,27 +23,105 @@
 
 import os
 
+try:
+    import multiprocessing
+    HAS_MULTIPROCESSING = True
+except ImportError:
+    HAS_MULTIPROCESSING = False
+
 from porthole.utils import debug
 from porthole.readers.commonreader import CommonReader
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.db.searchindex import build_index
+
+def read_descriptions(category):
+    """Worker process function, returns (category, {cat/pkg: {field: text}})
+    read from the md5-cache and metadata.xml, see
+    portagelib.get_category_search_fields()"""
+    try:
+        return category, PMS_LIB.get_category_search_fields(category)
+    except Exception, e:
+        debug.dprint("READERS: read_descriptions(); failed for %s: %s" %(category, str(e)))
+        return category, {}
+
 
 class DescriptionReader( CommonReader ):
     """ Read and store package descriptions for searching """
-    def __init__( self, packages ):
+    def __init__( self, packages, workers = 0 ):
         """ Initialize """
         CommonReader.__init__(self)
         self.packages = packages
+        # number of processes to read with, 0 or 1 reads them
+        # in this thread
+        self.workers = workers
+        self.descriptions = {}
+        # full_name: {field: text} of the searchable fields
+        self.fields = {}
+        # the search index table, built from the descriptions and fields
+        self.index_table = None
 
     def run( self ):
         """ Load all descriptions """
         debug.dprint("READERS: DescriptionReader(); process id = %d *****************" %os.getpid())
         self.descriptions = {}
+        self.fields = {}
+        # the packages are read a whole category at a time
+        self.categories = {}
         for name, package in self.packages:
-            if self.cancelled: self.done = True; return
-            self.descriptions[name] = package.get_description()
+            self.categories.setdefault(package.get_category(), []).append((name, package))
+        if self.workers > 1 and HAS_MULTIPROCESSING:
+            try:
+                self.read_parallel()
+            except Exception, e:
+                debug.dprint("READERS: DescriptionReader(); worker pool failed, " +
+                    "reading them here: " + str(e))
+                self.count = 0
+                self.read()
+        else:
+            self.read()
+        if not self.cancelled:
+            self.index_table = build_index(self.packages, self.descriptions,
+                self.fields)
+            # only the index keeps them
+            self.fields = {}
+        self.done = True
+        debug.dprint("READERS: DescriptionReader(); Done")
+
+    def add_category( self, category, fields ):
+        """ store the descriptions and search fields read for category,
+        the descriptions of packages not in the md5-cache, like installed
+        ones gone from the tree, are read the slow way """
+        for name, package in self.categories.get(category, []):
+            if package.full_name in fields:
+                self.fields[package.full_name] = fields[package.full_name]
+                self.descriptions[name] = fields[package.full_name]['description']
+            else:
+                self.descriptions[name] = PMS_LIB.get_package_description(package.full_name)
             if not self.descriptions[name]:
                 debug.dprint("READERS: DescriptionReader(); No description for " + name)
             self.count += 1
-        self.done = True
-        debug.dprint("READERS: DescriptionReader(); Done")
 
+    def read( self ):
+        """ read them one category at a time in this thread """
+        for category in self.categories:
+            if self.cancelled: return
+            self.add_category(category, PMS_LIB.get_category_search_fields(category))
 
+    def read_parallel( self ):
+        """ fan the categories out to a pool of worker processes,
+        which only read the search fields, and collect them as they
+        come back """
+        debug.dprint("READERS: DescriptionReader(); reading %d categories with %d workers"
+            %(len(self.categories), self.workers))
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for category, fields in pool.imap_unordered(read_descriptions,
+                    self.categories.keys()):
+                if self.cancelled: break
+                self.add_category(category, fields)
+        finally:
+            if self.cancelled:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
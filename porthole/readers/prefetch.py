@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+'''
+    Porthole Reader Class: Prefetch Reader
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+'''
+
+import os
+
+from porthole.utils import debug
+from porthole.readers.commonreader import CommonReader
+from porthole.backends import portage_lib as PMS_LIB
+
+# the fields that can be prefetched and the Package getter that fills
+# each one's cache.  They are run in this order, the later ones reuse
+# the earlier results.
+FIELDS = [
+    ('installed', lambda package: package.get_installed()),
+    ('latest_installed', lambda package: package.get_latest_installed()),
+    ('best', lambda package: package.get_best_ebuild()),
+    ('best_dep', lambda package: package.get_best_dep_ebuild()),
+    ('latest', lambda package: package.get_latest_ebuild(include_masked = False)),
+    ('upgradable', lambda package: package.is_upgradable()),
+    ('dep_upgradable', lambda package: package.is_dep_upgradable()),
+    ('size', lambda package: package.get_size()),
+    ('properties', lambda package: package.get_properties()),
+]
+
+# the packages filled between the batch_callback calls
+BATCH_SIZE = 100
+
+# the fields that need the installed versions
+INSTALLED_FIELDS = ['installed', 'latest_installed', 'upgradable', 'dep_upgradable']
+
+# the fields filled from the category md5-cache reads
+METADATA_FIELDS = ['best', 'best_dep', 'latest', 'upgradable', 'size', 'properties']
+
+# a category is read whole when at least this many of its packages
+# are prefetched, fewer are cheaper to read one package at a time
+CATEGORY_READ_MIN = 10
+
+
+class PrefetchReader( CommonReader ):
+    """ Fill the Package caches of many packages in one pass, so the
+    getters later called from the gui are memory lookups """
+    def __init__( self, packages, fields, callback = None, dispatcher = None,
+                batch_callback = None ):
+        """ Initialize """
+        CommonReader.__init__(self)
+        self.packages = packages
+        self.fields = fields
+        # callback(reader) for the caller, passed back to the gtk
+        # thread through dispatcher(self) when done
+        self.callback = callback
+        # batch_callback(reader, count) for the caller, passed back
+        # through dispatcher(self, count) every BATCH_SIZE packages
+        self.batch_callback = batch_callback
+        self.dispatcher = dispatcher
+        # category: (props, repos, {cat/pkg: [cpv,]}) of the read categories
+        self.categories = {}
+
+    def read_category( self, category ):
+        """ Read the md5-cache metadata of every ebuild of category once """
+        repos = {}
+        props = PMS_LIB.get_category_properties(category, repos)
+        self.categories[category] = (props, repos, PMS_LIB.group_versions(props))
+
+    def fill_metadata( self, package ):
+        """ Fill the metadata caches of package from its category's read,
+        the getters then find them set """
+        if package.category not in self.categories:
+            self.read_category(package.category)
+        props, repos, versions = self.categories[package.category]
+        cpvs = versions.get(package.full_name, [])
+        if package.properties is None:
+            package.properties = dict([(cpv, props[cpv]) for cpv in cpvs
+                if props[cpv] is not None])
+        # best_dep shares best_ebuild, leave a set dep atom to its getter
+        if (package.best_ebuild is None and ('best_dep' not in self.fields
+                or package.get_dep_atom() == package.full_name)):
+            package.best_ebuild = PMS_LIB.get_visible_best(package.full_name,
+                cpvs, props, repos)
+        if package.latest_ebuild is None:
+            masked = package.get_hard_masked(check_unmask = True)
+            package.latest_ebuild = PMS_LIB.best([cpv for cpv in cpvs
+                if cpv not in masked])
+
+    def run( self ):
+        """ Fill the caches """
+        debug.dprint("READERS: PrefetchReader(); process id = %d, %d packages, fields = %s"
+            %(os.getpid(), len(self.packages), str(self.fields)))
+        if [x for x in self.fields if x in INSTALLED_FIELDS]:
+            # one pass over the vdb instead of a dep_match per package
+            installed = PMS_LIB.get_installed_cpvs()
+            for package in self.packages:
+                if package.installed_ebuilds is None:
+                    package.installed_ebuilds = installed.get(package.full_name, [])
+        batched = {}
+        if [x for x in self.fields if x in METADATA_FIELDS]:
+            counts = {}
+            for package in self.packages:
+                if package.category:
+                    counts[package.category] = counts.get(package.category, 0) + 1
+            for category, count in counts.iteritems():
+                batched[category] = count >= CATEGORY_READ_MIN
+        getters = [getter for field, getter in FIELDS if field in self.fields]
+        for package in self.packages:
+            if self.cancelled: self.done = True; return
+            if batched.get(package.category):
+                try:
+                    self.fill_metadata(package)
+                except Exception, e:
+                    debug.dprint("READERS: PrefetchReader(); category read failed for %s: %s"
+                        %(package.full_name, str(e)))
+            for getter in getters:
+                try:
+                    getter(package)
+                except Exception, e:
+                    debug.dprint("READERS: PrefetchReader(); failed for %s: %s"
+                        %(package.full_name, str(e)))
+            self.count += 1
+            if (self.batch_callback and self.dispatcher
+                    and not self.count % BATCH_SIZE):
+                self.dispatcher(self, self.count)
+        self.done = True
+        debug.dprint("READERS: PrefetchReader(); Done")
+        if self.dispatcher:
+            self.dispatcher(self)
@@ -21,65 +21,326 @@
     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 '''
 
-import re, os
+import re, os, heapq, time
 
 from porthole.utils import debug
 from porthole.readers.commonreader import CommonReader
+from porthole.backends import portage_lib as PMS_LIB
+from porthole.db.searchindex import FIELDS, WORD_FIELDS, GRAM, grams
 
 EXCEPTION_LIST = ['.','^','$','*','+','?','(',')','\\','[',']','|','{','}']
 
+# ranked search tiers, higher is better
+EXACT, PREFIX, SUBSTRING, DESCRIPTION, FUZZY = 4, 3, 2, 1, 0
+# shortest search term that is matched fuzzily
+FUZZY_MIN_LENGTH = 4
+# matches are passed to batch_callback this many at a time,
+# or after BATCH_INTERVAL seconds, whichever comes first
+BATCH_SIZE = 200
+BATCH_INTERVAL = 0.25
+
+
+def edit_distance(a, b, limit):
+    """Returns the Levenshtein distance between a and b,
+    or None if it is more than limit"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    # every character one has and the other has not takes an edit,
+    # which rules out most names before the full table is made
+    counts = {}
+    for char in a:
+        counts[char] = counts.get(char, 0) + 1
+    unmatched = 0
+    for char in b:
+        if counts.get(char):
+            counts[char] -= 1
+        else:
+            unmatched += 1
+    if max(unmatched, len(a) - len(b) + unmatched) > limit:
+        return None
+    previous = range(len(b) + 1)
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]))
+        if min(current) > limit:
+            return None
+        previous = current
+    if previous[-1] > limit:
+        return None
+    return previous[-1]
+
+def parse_query(search_term):
+    """Splits the field qualified words like "use:gtk" or "herd:python"
+    out of search_term.  Returns (the rest of the term,
+    [(field, value), ...]) with the fields those of searchindex.FIELDS"""
+    words = []
+    queries = []
+    for word in search_term.split(' '):
+        field, sep, value = word.partition(':')
+        if sep and value and field.lower() in FIELDS:
+            queries.append((field.lower(), value))
+        else:
+            words.append(word)
+    return ' '.join(words).strip(), queries
+
+def escape_term(term):
+    """escapes the regular expression characters in term"""
+    escaped = ''
+    for char in term:
+        #debug.dprint(char)
+        if char in EXCEPTION_LIST:# =="+":
+            debug.dprint("READERS: SearchReader();  '%s' exception found" %char)
+            char = "\\" + char
+        escaped += char
+    return escaped
+
+
 
 class SearchReader( CommonReader ):
     """Create a list of matching packages to search term"""
     
-    def __init__( self, db_list, search_desc, tmp_search_term, desc_db = None, callback = None ):
+    def __init__( self, db_list, search_desc, tmp_search_term, desc_db = None, callback = None,
+            index = None, ranked = False, top_k = 200, batch_callback = None ):
         """ Initialize """
         CommonReader.__init__(self)
         self.db_list = db_list
         self.search_desc = search_desc
         self.tmp_search_term = tmp_search_term
+        # the plain search term and the (field, value) queries
+        self.term, self.field_queries = parse_query(tmp_search_term)
         self.desc_db = desc_db
         self.callback = callback
+        # batch_callback(self, [full_name, ...]) is passed the new matches
+        # as the search goes, a ranked search only reports its progress
+        self.batch_callback = batch_callback
+        self.batch = []
+        self.batch_time = 0
+        # the number of entries to check, once they are known
+        self.total = 0
+        # the db.searchindex.SearchIndex, if there is one
+        self.index = index
+        # True for a search as you type
+        self.incremental = False
+        # rank the matches and only keep the top_k best
+        self.ranked = ranked
+        self.top_k = top_k
+        # the package_list keys, best first, for a ranked search
+        self.order = None
+        # number of matches, before the ranked search's top_k cut
+        self.match_count = 0
         # hack for statusbar updates
         self.progress = 1
         self.package_list = {}
         self.pkg_count = 0
         self.count = 0
         self.search_term = ''
+        # descriptions missing from desc_db, read per category
+        self.cache_descriptions = {}
+        # the search fields of the packages the index does not have
+        self.cache_fields = {}
     
     
     def run( self ):
             debug.dprint("READERS: SearchReader(); process id = %d *****************" %os.getpid())
-            Plus_exeption_count = 0
-            for char in self.tmp_search_term:
-                #debug.dprint(char)
-                if char in EXCEPTION_LIST:# =="+":
-                    debug.dprint("READERS: SearchReader();  '%s' exception found" %char)
-                    char = "\\" + char
-                self.search_term += char 
+            self.search_term = escape_term(self.tmp_search_term)
             debug.dprint("READERS: SearchReader(); ===> escaped search_term = :%s" %self.search_term)
-            re_object = re.compile(self.search_term, re.I)
+            if self.ranked:
+                self.run_ranked()
+                return
+            re_object = re.compile(escape_term(self.term), re.I)
             # no need to sort self.db_list; it is already sorted
-            for name, data in self.db_list:
+            entries = self.get_candidates()
+            self.total = len(entries)
+            for name, data in entries:
                 if self.cancelled: self.done = True; return
                 self.count += 1
+                self.send_batch()
                 searchstrings = [name]
                 if self.search_desc:
-                    try:
-                        desc = self.desc_db[name]
-                    except KeyError: # perhaps the description db is stale?
-                        desc = ''
-                    searchstrings.append(desc)
+                    searchstrings.append(self.lookup_description(name, data))
                     #debug.dprint("searchstrings type = " + str(type(searchstrings)))
                     #debug.dprint(searchstrings)
                 if True in map(lambda s: bool(re_object.search(s)), searchstrings):
                     self.pkg_count += 1
                     #package_list[name] = data
                     self.package_list[data.full_name] = data
+                    self.batch.append(data.full_name)
+            self.match_count = self.pkg_count
+            self.send_batch(True)
             debug.dprint("READERS: SearchReader(); found %s entries for search_term: %s" %(self.pkg_count,self.search_term))
             self.do_callback()
 
+    def run_ranked( self ):
+        """score every match: exact name > name prefix > name substring >
+        description > name within a small edit distance, and keep the
+        top_k best in a heap"""
+        term = self.term.lower()
+        fuzzy = len(term) >= FUZZY_MIN_LENGTH
+        limit = len(term) > 5 and 2 or 1
+        if fuzzy:
+            entries = self.get_candidates(limit)
+            # the names not near enough to the term for edit_distance()
+            # to be worth running are skipped, see
+            # SearchIndex.near_candidates()
+            term_grams = grams(term)
+            need = len(term_grams) - GRAM * limit
+        else:
+            entries = self.get_candidates()
+        self.total = len(entries)
+        heap = []
+        for name, data in entries:
+            if self.cancelled: self.done = True; return
+            self.count += 1
+            self.send_batch()
+            lname = name.lower()
+            distance = 0
+            if lname == term:
+                tier = EXACT
+            elif lname.startswith(term):
+                tier = PREFIX
+            elif term in lname:
+                tier = SUBSTRING
+            elif self.search_desc and term in self.lookup_description(name, data).lower():
+                tier = DESCRIPTION
+            else:
+                distance = None
+                if fuzzy and abs(len(lname) - len(term)) <= limit and (need <= 0 or
+                        len([x for x in term_grams if x in lname]) >= need):
+                    distance = edit_distance(term, lname, limit)
+                if distance is None:
+                    continue
+                tier = FUZZY
+            self.match_count += 1
+            # shorter names are closer to the term, the ties are kept
+            # in the db_list order
+            item = ((tier, -distance, -len(name)), -self.count, data)
+            if len(heap) < self.top_k:
+                heapq.heappush(heap, item)
+            else:
+                heapq.heappushpop(heap, item)
+        heap.sort(reverse = True)
+        self.order = []
+        for key, count, data in heap:
+            self.order.append(data.full_name)
+            self.package_list[data.full_name] = data
+        self.pkg_count = len(self.order)
+        debug.dprint("READERS: SearchReader(); ranked %d of %d matches for search_term: %s"
+            %(self.pkg_count, self.match_count, self.search_term))
+        self.do_callback()
+
+    def send_batch(self, force = False):
+        """pass the matches found since the last batch to batch_callback,
+        if there are enough of them or it has been a while"""
+        if not self.batch_callback:
+            return
+        now = time.time()
+        if (force or len(self.batch) >= BATCH_SIZE or
+                now - self.batch_time >= BATCH_INTERVAL):
+            batch, self.batch = self.batch, []
+            self.batch_time = now
+            self.batch_callback(self, batch)
+
+    def lookup_description(self, name, package):
+        """returns the description to search for the package"""
+        try:
+            return self.desc_db[name]
+        except (KeyError, TypeError): # perhaps the description db is stale?
+            return self.get_description(package)
+
+    def get_candidates(self, fuzzy_limit = None):
+        """returns the db_list entries that may match, only those with
+        all of the search term's trigrams if there is a usable index,
+        and with fuzzy_limit those whose name may be within that edit
+        distance of it.
+        The index ids are matched to the db_list by full_name, so an
+        index from before a merge or unmerge is still of use, the
+        packages it does not have are checked one by one."""
+        if self.index is None:
+            return self.get_fallback()
+        ids = self.index.candidates(self.term, self.search_desc)
+        if ids is not None and fuzzy_limit:
+            ids = set(ids)
+            ids.update(self.index.near_candidates(self.term.lower(), fuzzy_limit))
+            ids = sorted(ids)
+        if self.field_queries:
+            field_ids = self.index.field_matches(self.field_queries)
+            if ids is None:
+                ids = field_ids
+            else:
+                ids = sorted(set(ids).intersection(field_ids))
+        if ids is None:
+            return self.db_list
+        full_names = self.index.full_names
+        matched = set([full_names[i] for i in ids])
+        indexed = self.index.get_name_set()
+        entries = []
+        unindexed = 0
+        for name, data in self.db_list:
+            full_name = data.full_name
+            if full_name in matched:
+                entries.append((name, data))
+            elif full_name not in indexed:
+                unindexed += 1
+                if self.fields_match(data):
+                    entries.append((name, data))
+        debug.dprint("READERS: SearchReader(); index gave %d candidates, %d packages not indexed"
+            %(len(entries), unindexed))
+        return entries
+
+    def get_fallback(self):
+        """the entries to search without an index, the field queries
+        are checked against the metadata one package at a time"""
+        if self.field_queries:
+            debug.dprint("READERS: SearchReader(); no search index, scanning for the " +
+                "field queries: " + str(self.field_queries))
+            return [(name, data) for name, data in self.db_list
+                if not self.cancelled and self.fields_match(data)]
+        return self.db_list
+
+    def fields_match(self, package):
+        """returns True if package matches all of the field queries,
+        read from the metadata instead of the index"""
+        if not self.field_queries:
+            return True
+        fields = self.get_search_fields(package)
+        for field, value in self.field_queries:
+            text = ' '.join(fields.get(field, '').lower().split())
+            if field in WORD_FIELDS:
+                if value.lower() not in text.split():
+                    return False
+            elif value.lower() not in text:
+                return False
+        return True
+
+    def get_search_fields(self, package):
+        """read the search fields of package from the metadata,
+        a whole category at a time"""
+        category = package.get_category()
+        if category not in self.cache_fields:
+            try:
+                self.cache_fields[category] = \
+                    PMS_LIB.get_category_search_fields(category)
+            except Exception, e:
+                debug.dprint("READERS: SearchReader(); failed to read %s: %s" %(category, str(e)))
+                self.cache_fields[category] = {}
+        return self.cache_fields[category].get(package.full_name, {})
+
+    def get_description(self, package):
+        """read a description that is not in desc_db straight
+        from the md5-cache, a whole category at a time"""
+        category = package.get_category()
+        if category not in self.cache_descriptions:
+            try:
+                self.cache_descriptions[category] = \
+                    PMS_LIB.get_category_descriptions(category)
+            except Exception, e:
+                debug.dprint("READERS: SearchReader(); failed to read %s: %s" %(category, str(e)))
+                self.cache_descriptions[category] = {}
+        return self.cache_descriptions[category].get(package.full_name, '')
+
     def do_callback(self):
         if self.callback:
             self.done = True
-            self.callback()
+            self.callback(self)
@@ -21,29 +21,79 @@
     Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 '''
 
-import os, time, thread, threading
+import os, thread, threading
 from sys import stderr
 from gettext import gettext as _
 
+try:
+    import multiprocessing
+    HAS_MULTIPROCESSING = True
+except ImportError:
+    HAS_MULTIPROCESSING = False
+
 from porthole.utils import debug
-from porthole.sterminal import SimpleTerminal
 from porthole import backends
 portage_lib = backends.portage_lib
 from porthole import db
 from porthole.db.package import Package
 from porthole.readers.commonreader import CommonReader
 from porthole.utils.utils import get_set_name
+from porthole.backends.version_sort import ver_sort
+from porthole.db.upgradecache import get_upgrades_key, save_upgrades, load_upgrades
+from porthole.db.systemset import get_system_set
 
 
 PRIORITIES = {_("System"): 0, _("Sets"):1, _("World"):2, _("Dependencies"):3}
 
+# the installed set is split into about this many chunks per worker,
+# so a slow chunk does not keep the others waiting
+CHUNKS_PER_WORKER = 4
+
+
+def upgrade_direction(best, installed):
+    """Returns 1 if best is an upgrade of installed, -1 for a downgrade,
+    else 0, as Package.is_upgradable()"""
+    if not best or not installed or best == installed:
+        return 0
+    if portage_lib.best([best, installed]) == best:
+        return 1
+    return -1
+
+def check_upgrades(chunk):
+    """Worker process function, chunk is a list of
+    (full_name, [installed cpv's]).  Returns a list of
+    (full_name, best visible, latest installed, direction)"""
+    results = []
+    for full_name, installed in chunk:
+        try:
+            best = portage_lib.get_best_ebuild(full_name)
+        except Exception, e:
+            debug.dprint("READERS: check_upgrades(); failed for %s: %s"
+                %(full_name, str(e)))
+            best = ''
+        latest = installed and ver_sort(installed)[-1] or ''
+        results.append((full_name, best, latest,
+            upgrade_direction(best, latest)))
+    return results
+
 
 class UpgradableListReader(CommonReader):
     """ Read available upgrades and store them in a tuple """
-    def __init__( self, installed, sets = None ):
+    def __init__( self, installed, sets = None, workers = 0, use_cache = True,
+                show_saved = False ):
         """ Initialize """
         CommonReader.__init__(self)
         self.installed_items = installed
+        # number of processes to check the packages with, 0 or 1
+        # checks them in this thread
+        self.workers = workers
+        # use and save the upgrades cache
+        self.use_cache = use_cache
+        # when the upgrades cache is out of date, load the lists it has
+        # into saved_lists, (pkg_dict, pkg_count), to show while the
+        # new ones are made
+        self.show_saved = show_saved
+        self.saved_lists = None
         ##self.upgrade_only = upgradeonly
         self.sets = sets
         self.reader_type = "Upgradable"
@@ -55,12 +105,13 @@ class UpgradableListReader(CommonReader):
         # eg self.categories = ["Tool Chain", _("System"), _("Sets"), _("World"), _("Dependencies")]
         self.cat_order = [_("System"), _("World"), _("Dependencies")]
         self.categories = {_("System"):None, _("World"):"World", _("Dependencies"):"Dependencies"}
+        # full_name: the first list of cat_order before World and
+        # Dependencies the package is in, see build_list_map()
+        self.list_map = {}
         self.pkg_dict = {}
         self.pkg_count = {}
         self.count = 0
         self.pkg_dict_total = 0
-        # command lifted fom emwrap and emwrap.sh
-        self.system_cmd = "emerge -ep --nocolor --nospinner system | cut -s -f2 -d ']'| cut -f1 -d '[' | sed 's/^[ ]\+//' | sed 's/[ ].*$//'"
         #self.start = self.run
  
     def run( self ):
@@ -68,25 +119,55 @@ class UpgradableListReader(CommonReader):
         debug.dprint("READERS: UpgradableListReader(); process id = %d *******************" %os.getpid())
         print >>stderr,  "READERS: UpgradableListReader(); threading.enumerate() = ",threading.enumerate()
         print >>stderr, "READERS: UpgradableListReader(); this thread is :", thread.get_ident(), ' current thread ', threading.currentThread()
+        cache_key = None
+        if self.use_cache:
+            cache_key = get_upgrades_key()
+            cached = load_upgrades()
+            if cached is not None and cached[0] == cache_key:
+                debug.dprint("READERS: UpgradableListReader(); nothing changed, " +
+                    "using the saved upgrades")
+                self.load_cached(cached[1:], True)
+                self.progress = 2
+                self.done = True
+                return
+            if cached is not None and self.show_saved:
+                self.load_cached(cached[1:], False)
+                self.saved_lists = (self.pkg_dict, self.pkg_count)
         self.get_system_list()
         self.get_sets()
+        self.build_list_map()
+        # new dicts, the stale ones may still be shown
+        self.pkg_dict = {}
+        self.pkg_count = {}
         for key in self.cat_order:
             self.pkg_dict[key] = {}
             self.pkg_count[key] = 0
         ##upgradeflag = self.upgrade_only and True or False
         # find upgradable packages
-        for cat, packages in self.installed_items:
-            for name, package in packages.items():
-                self.count += 1
-                if self.cancelled: self.done = True; return
-                upgradable = package.is_upgradable()
-                # if upgradable: # is_upgradable() = 1 for upgrade, -1 for downgrade
-                if upgradable == 1 or upgradable == -1:
-                    for key in self.cat_order:
-                        if package.in_list(self.categories[key]):
-                            self.pkg_dict[key][package.full_name] = package
-                            self.pkg_count[key] += 1
-                            break
+        if self.workers > 1 and HAS_MULTIPROCESSING:
+            try:
+                self.check_parallel()
+            except Exception, e:
+                debug.dprint("READERS: UpgradableListReader(); worker pool failed, " +
+                    "checking them here: " + str(e))
+                for key in self.cat_order:
+                    self.pkg_dict[key] = {}
+                    self.pkg_count[key] = 0
+                self.count = 0
+                self.check()
+        else:
+            self.check()
+        if self.cancelled: self.done = True; return
+        if self.use_cache:
+            save_upgrades(self.cat_order, self.pkg_dict, cache_key)
+        self.finish()
+        self.stale = False
+        # set the thread as finished
+        self.done = True
+        return
+
+    def finish( self ):
+        """ total the lists and put a "None" in the empty ones """
         self.pkg_dict_total = 0
         for key in self.pkg_count:
             self.pkg_dict_total += self.pkg_count[key]
@@ -96,41 +177,130 @@ class UpgradableListReader(CommonReader):
                 self.pkg_count[key] = 0
         debug.dprint("READERS: UpgradableListReader(); new pkg_dict = " + str(self.pkg_dict))
         debug.dprint("READERS: UpgradableListReader(); new pkg_counts = " + str(self.pkg_count))
-        # set the thread as finished
-        self.done = True
-        return
 
+    def load_cached( self, cached, current ):
+        """ fill the lists from the upgrades cache lists cached, see
+        load_upgrades().  If they are not current they are marked
+        stale, to show until run() has made the new lists """
+        cat_order, lists, versions = cached
+        packages = {}
+        for cat, _packages in self.installed_items:
+            for package in _packages.itervalues():
+                packages[package.full_name] = package
+        pkg_dict = {}
+        pkg_count = {}
+        for list_name in cat_order:
+            pkg_dict[list_name] = {}
+            pkg_count[list_name] = 0
+            for full_name in lists.get(list_name, []):
+                package = packages.get(full_name)
+                if package is None:
+                    # unmerged since, only possible for a stale list
+                    continue
+                if current:
+                    best, latest, upgradable = versions[full_name]
+                    package.best_ebuild = best
+                    package.latest_installed = latest
+                    package.upgradable = upgradable
+                pkg_dict[list_name][full_name] = package
+                pkg_count[list_name] += 1
+        self.cat_order = cat_order
+        self.pkg_dict = pkg_dict
+        self.pkg_count = pkg_count
+        self.finish()
+        self.stale = not current
+        if current:
+            self.count = len(packages)
 
 
+
+    def check( self ):
+        """ check the installed packages one at a time in this thread """
+        for cat, packages in self.installed_items:
+            for name, package in packages.items():
+                self.count += 1
+                if self.cancelled: return
+                self.add_package(package, package.is_upgradable())
+
+    def check_parallel( self ):
+        """ split the installed packages between a pool of worker
+        processes, which find the best visible and latest installed
+        versions, and sort the results as they come back """
+        packages = {}
+        for cat, _packages in self.installed_items:
+            for package in _packages.itervalues():
+                packages[package.full_name] = package
+        # one pass over the vdb instead of a dep_match per package
+        installed = portage_lib.get_installed_cpvs()
+        items = [(full_name, installed.get(full_name, []))
+            for full_name in packages]
+        size = max(1, len(items) // (self.workers * CHUNKS_PER_WORKER))
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        debug.dprint("READERS: UpgradableListReader(); checking %d packages in %d chunks with %d workers"
+            %(len(items), len(chunks), self.workers))
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for results in pool.imap_unordered(check_upgrades, chunks):
+                if self.cancelled: break
+                for full_name, best, latest, upgradable in results:
+                    package = packages[full_name]
+                    # fill the caches is_upgradable() would have
+                    package.installed_ebuilds = installed.get(full_name, [])
+                    package.best_ebuild = best
+                    package.latest_installed = latest
+                    package.upgradable = upgradable
+                    self.add_package(package, upgradable)
+                    self.count += 1
+        finally:
+            if self.cancelled:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+    def add_package( self, package, upgradable ):
+        """ file an upgradable package under the first list it is in """
+        # if upgradable: # is_upgradable() = 1 for upgrade, -1 for downgrade
+        if upgradable == 1 or upgradable == -1:
+            key = self.list_map.get(package.full_name)
+            if key is None:
+                if package.in_world:
+                    key = _("World")
+                else:
+                    key = _("Dependencies")
+            self.pkg_dict[key][package.full_name] = package
+            self.pkg_count[key] += 1
+
+    def build_list_map( self ):
+        """ map every package of the System list and the sets to the
+        first of them in cat_order it is in, so filing a package is one
+        lookup instead of a search of each list """
+        self.list_map = {}
+        # the earlier lists overwrite the later ones
+        for key in reversed(self.cat_order):
+            if key in (_("World"), _("Dependencies")):
+                continue
+            for full_name in self.categories[key] or []:
+                self.list_map[full_name] = key
+
     def get_system_list( self, emptytree = False ):
         debug.dprint("READERS: UpgradableListReader; getting system package list")
         if emptytree:
-            self.terminal = SimpleTerminal(self.system_cmd, need_output=True,  dprint_output='', callback=None)
-            self.terminal._run()
-            debug.dprint("READERS: UpgradableListReader; waiting for an 'emerge -ep system'...")
-            while self.terminal.reader.process_running:
-                time.sleep(0.10)
-            self.categories[_("System")] = self.make_list(self.terminal.reader.string)
+            # the system set with all its dependencies, as 'emerge -ep system'
+            self.categories[_("System")] = get_system_set(please_die = lambda: self.cancelled)
         else:
-            self.categories[_("System")] = portage_lib.get_system_pkgs()
+            self.categories[_("System")] = frozenset(portage_lib.get_system_pkgs())
         self.progress = 2
         debug.dprint("READERS: UpgradableListReader; new system pkg list %s" %str(self.categories[_("System")]))
 
-    def make_list(self, from_string):
-        """parse terminal output and return a list"""
-        list1 = from_string.split('\n')
-        list2 = []
-        for pkg in list1:
-            list2.append(portage_lib.get_full_name(pkg.rstrip("\r")))
-        return list2
-
     def get_sets( self):
         """Get any package lists stored in the /etc/portage/sets directory
            and add them to the categories list"""
         sets_list = []
+        members = db.userconfigs.get_set_members()
         for key in db.userconfigs.get_source_keys("SETS"):
             name = get_set_name(key)
-            self.categories[_("Sets")+"-"+name] = db.userconfigs.get_source_cplist("SETS", key)
+            self.categories[_("Sets")+"-"+name] = members[key]
             sets_list.append(_("Sets")+"-"+name)
         self.cat_order = [_("System")] + sets_list + [_("World"), _("Dependencies")]
         return #sets_lists
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+'''
+    Porthole Dependency Closure View
+    Lists the not yet installed ebuilds an emerge of an ebuild would
+    pull in and how much it would download
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+'''
+
+import pygtk; pygtk.require("2.0") # make sure we have the right version
+import gtk, gobject
+from gettext import gettext as _
+
+from porthole.utils import debug
+from porthole.views.commontreeview import CommonTreeView
+from porthole import db
+
+
+def format_size(size):
+    """Returns size in bytes as a string of kB, the way emerge shows it"""
+    mystr = str(size / 1024)
+    mycount = len(mystr)
+    while (mycount > 3):
+        mycount -= 3
+        mystr = mystr[:mycount] + "," + mystr[mycount:]
+    return mystr + " kB"
+
+
+class ClosureView(CommonTreeView):
+    """ List the ebuilds an emerge of an ebuild would pull in """
+    def __init__(self):
+        """ Initialize """
+        CommonTreeView.__init__(self)
+        self.model = gtk.ListStore(
+                gobject.TYPE_STRING,       # cpv, or a dependency nothing matches
+                gobject.TYPE_STRING,       # size of its distfiles
+                gobject.TYPE_STRING        # needs unmasking or unresolved
+        )
+        self.column = {"cpv": 0, "size": 1, "status": 2}
+        for title, key in [(_("Pulls in"), "cpv"), (_("Download"), "size"),
+                (_("Status"), "status")]:
+            text = gtk.CellRendererText()
+            column = gtk.TreeViewColumn(title, text, text = self.column[key])
+            column.set_resizable(True)
+            self.append_column(column)
+        self.set_model(self.model)
+        self.set_rules_hint(True)
+        self.ebuild = None
+        self.reader = None
+        debug.dprint("ClosureView: initialized")
+
+    def fill(self, ebuild):
+        """ Compute the closure of ebuild in a thread, the view is
+        filled when it is done """
+        self.cancel()
+        self.model.clear()
+        self.ebuild = ebuild
+        self.get_column(0).set_title(_("Pulls in"))
+        if not ebuild:
+            return
+        self.model.append([_("Resolving the dependencies of %s...") % ebuild, '', ''])
+        self.reader = db.db.get_closure(ebuild, callback = self.closure_done)
+
+    def closure_done(self, closure):
+        """ Database.get_closure() callback, show the result """
+        if closure.cpv != self.ebuild:
+            # an older one, the view moved on
+            return
+        self.reader = None
+        self.model.clear()
+        debug.dprint("ClosureView: closure_done(); %d ebuilds for %s"
+            %(len(closure.cpvs), closure.cpv))
+        self.get_column(0).set_title(_("Pulls in %(count)d ebuilds, %(fetch)s to download (%(total)s in all)")
+            % {'count': len(closure.cpvs), 'fetch': format_size(closure.fetch_size),
+            'total': format_size(closure.size)})
+        unmask = set(closure.unmask)
+        for cpv in closure.cpvs:
+            status = ''
+            if cpv in unmask:
+                status = _("needs unmasking")
+            self.model.append([cpv, format_size(closure.sizes.get(cpv, 0)), status])
+        for dep in closure.unresolved:
+            self.model.append([dep, '', _("no ebuild matches")])
+        if not closure.cpvs and not closure.unresolved:
+            self.model.append([_("Nothing, it is installed"), '', ''])
+
+    def cancel(self):
+        """ Stop a running closure reader """
+        if self.reader:
+            self.reader.please_die()
+            self.reader = None
+
+    def clear(self):
+        """ Clear the view """
+        self.cancel()
+        self.ebuild = None
+        CommonTreeView.clear(self)
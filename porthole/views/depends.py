@@ -184,7 +184,8 @@ class DependsView(CommonTreeView):
                     debug.dprint("DependsView: populate_info(); found package: " + name)
                     latest_installed = package.get_latest_installed()
                     debug.dprint("DependsView: populate_info(); latest_installed: %s, getting best_ebuild" %str(latest_installed))
-                    best_ebuild, keyworded_ebuild, masked_ebuild = portage_lib.get_dep_ebuild(model.get_value(iter,model.column["depend"]))
+                    atom = model.dep_parser.cache.get(model.get_value(iter, model.column["atom_key"]))
+                    best_ebuild, keyworded_ebuild, masked_ebuild = model.get_dep_ebuild(atom)
                     debug.dprint("DependsView: populate_info(); best_ebuild: %s, getting latest_ebuild" %str(best_ebuild))
                     #latest_ebuild = package.get_latest_ebuild(False) # include_masked = False
                     #debug.dprint("DependsView: populate_info(); latest_ebuild: %s" %str(latest_ebuild))
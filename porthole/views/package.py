@@ -39,6 +39,9 @@ from porthole.utils import debug
 from porthole.views.helpers import *
 from porthole.views.models import PackageModel, MODEL_ITEM
 
+# gtk's GTK_TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID
+UNSORTED = -2
+
 PACKAGES = 0
 INSTALLED = 1
 SEARCH = 2
@@ -55,9 +58,17 @@ class PackageView(CommonTreeView):
     def __init__(self):
         """ Initialize """
         self.info_thread = None
+        self.prefetch_reader = None
+        # the rows populate_info() can fill, the prefetched ones, and
+        # the ones it has filled
+        self.prefetched = 0
+        self.info_count = 0
+        self.info_scheduled = False
         self.iter = None
         self.model = None
         self.current_view = None
+        # the packages dictionary a search is appending rows for
+        self.streamed = None
         # initialize the treeview
         CommonTreeView.__init__(self)
 
@@ -402,15 +413,23 @@ class PackageView(CommonTreeView):
             self.event = None
             return True
 
-    def populate(self, packages, locate_name = None):
-        """ Populate the current view with packages """
+    def populate(self, packages, locate_name = None, order = None):
+        """ Populate the current view with packages,
+        in the order of the names in order if given """
         debug.dprint("VIEWS: Populating package view")
         debug.dprint("VIEWS: PackageView.populate(); process_id = %s" %str(os.getpid()))
         self._installed_column.set_visible(True)
+        streamed, self.streamed = self.streamed, None
         if not packages:
             debug.dprint("VIEWS: clearing package view model")
             self.get_model().clear()
             return
+        if (packages is streamed and not order and
+                self.get_model().iter_n_children(None) == len(packages)):
+            # the search already appended all of the rows
+            debug.dprint("VIEWS: populate(); %d rows were streamed" %len(packages))
+            self._populate_done(packages, locate_name)
+            return
         # ask info_thread to die, if alive
         self.infothread_die = "Please"
         self.model = None
@@ -424,49 +443,95 @@ class PackageView(CommonTreeView):
             return
         self.disable_column_sort()
         model.clear()
-        names = utilities.sort(packages.keys())
-        path = None
-        locate_count = 0
+        if order:
+            names = order
+            # keep the rows in the given order
+            model.set_sort_column_id(UNSORTED, gtk.SORT_ASCENDING)
+        else:
+            names = utilities.sort(packages.keys())
         for name in names:
             #debug.dprint("VIEWS: PackageView.populate(); name = %s" %name)
             # go through each package
-            iter = model.insert_before(None, None)
-            model.set_value(iter,MODEL_ITEM["name"], name)
-            upgradable = 0
-            if name != _("None"):
-                model.set_value(iter, MODEL_ITEM["package"], packages[name])
-                model.set_value(iter, MODEL_ITEM["checkbox"], (packages[name].is_checked))
-                model.set_value(iter, MODEL_ITEM["world"], (packages[name].in_world))
-                upgradable = packages[name].is_dep_upgradable()
-                if upgradable == MODEL_ITEM["checkbox"]: # portage wants to upgrade
-                    model.set_value(iter, MODEL_ITEM["text_colour"], config.Prefs.views.upgradable_fg)
-                elif upgradable == -1: # portage wants to downgrade
-                    model.set_value(iter, MODEL_ITEM["text_colour"], config.Prefs.views.downgradable_fg)
-                else:
-                    model.set_value(iter, MODEL_ITEM["text_colour"], '')
-                # get an icon for the package
-                icon = utils.get_icon_for_package(packages[name])
-                model.set_value(iter, MODEL_ITEM["icon"],
-                                self.render_icon(icon,
-                                size = gtk.ICON_SIZE_MENU,
-                                detail = None))
-            if locate_name:
+            self._add_row(model, name, packages)
+        self._populate_done(packages, locate_name, order)
+
+    def _add_row(self, model, name, packages):
+        """ Add the row for packages[name] to the end of model """
+        iter = model.insert_before(None, None)
+        model.set_value(iter,MODEL_ITEM["name"], name)
+        upgradable = 0
+        if name != _("None"):
+            model.set_value(iter, MODEL_ITEM["package"], packages[name])
+            model.set_value(iter, MODEL_ITEM["checkbox"], (packages[name].is_checked))
+            model.set_value(iter, MODEL_ITEM["world"], (packages[name].in_world))
+            upgradable = packages[name].is_dep_upgradable()
+            if upgradable == MODEL_ITEM["checkbox"]: # portage wants to upgrade
+                model.set_value(iter, MODEL_ITEM["text_colour"], config.Prefs.views.upgradable_fg)
+            elif upgradable == -1: # portage wants to downgrade
+                model.set_value(iter, MODEL_ITEM["text_colour"], config.Prefs.views.downgradable_fg)
+            else:
+                model.set_value(iter, MODEL_ITEM["text_colour"], '')
+            # get an icon for the package
+            icon = utils.get_icon_for_package(packages[name])
+            model.set_value(iter, MODEL_ITEM["icon"],
+                            self.render_icon(icon,
+                            size = gtk.ICON_SIZE_MENU,
+                            detail = None))
+        return iter
+
+    def _populate_done(self, packages, locate_name, order = None):
+        """ Select locate_name, sort the rows and start reading
+        the package info """
+        model = self.get_model()
+        if locate_name:
+            path = None
+            locate_count = 0
+            iter = model.get_iter_first()
+            while iter:
+                name = model.get_value(iter, MODEL_ITEM["name"])
                 if name.split('/')[-1] == locate_name:
                     locate_count += 1
                     path = model.get_path(iter)
                     #if path:
                         # use callback function to store the path
                         #self.mainwindow_callback("set path", path)
-        if locate_count == 1: # found unique exact result - select it
-            self.set_cursor(path)
+                iter = model.iter_next(iter)
+            if locate_count == 1: # found unique exact result - select it
+                self.set_cursor(path)
         debug.dprint("VIEWS: starting info_thread")
         self.infothread_die = False
-        self.get_model().set_sort_column_id(MODEL_ITEM["name"], gtk.SORT_ASCENDING)
+        if not order:
+            self.get_model().set_sort_column_id(MODEL_ITEM["name"], gtk.SORT_ASCENDING)
         #self.disable_column_sort()
         self.model = self.get_model()
         self.iter = model.get_iter_first()
         self.deprecated_info = False
-        gobject.idle_add(self.populate_info)
+        self.prefetch_info(packages, ['latest_installed', 'best_dep', 'latest',
+            'size', 'properties'])
+
+    def start_stream(self, packages):
+        """ Clear the view for the rows of packages, a dictionary a
+        search is still adding to.  The rows are added by append() and
+        a populate() with the finished dictionary completes them. """
+        debug.dprint("VIEWS: PackageView.start_stream()")
+        self._installed_column.set_visible(True)
+        # ask info_thread to die, if alive
+        self.infothread_die = "Please"
+        self.model = None
+        self.iter = None
+        model = self.get_model()
+        self.disable_column_sort()
+        model.clear()
+        self.streamed = packages
+
+    def append(self, packages, names):
+        """ Append the rows for names, new matches in the packages of
+        start_stream() """
+        if packages is not self.streamed:
+            return
+        model = self.get_model()
+        for name in names:
+            self._add_row(model, name, packages)
 
     def populate_cpv(self, packages, locate_name = None, ):
         """ Populate the current view with packages """
@@ -532,10 +597,61 @@ class PackageView(CommonTreeView):
         self.model = self.get_model()
         self.iter = model.get_iter_first()
         self.deprecated_info = True
-        gobject.idle_add(self.populate_info)
+        self.prefetch_info(packages, ['latest', 'size', 'properties'])
+
+    def prefetch_info(self, packages, fields):
+        """ Read the info column data in a thread, in the row order,
+        populate_info() fills the rows as the batches are read """
+        if self.prefetch_reader:
+            self.prefetch_reader.please_die()
+        package_list = []
+        iter = self.iter
+        while iter:
+            package = self.model.get_value(iter, MODEL_ITEM["package"])
+            if package and self.model.get_value(iter, MODEL_ITEM["name"]) != _("None"):
+                package_list.append(package)
+            iter = self.model.iter_next(iter)
+        self.prefetched = 0
+        self.info_count = 0
+        self.prefetch_reader = db.db.prefetch(package_list, fields,
+            self.prefetch_done, self.prefetch_batch)
+
+    def prefetch_batch(self, reader, count):
+        """ db prefetch batch callback, the first count rows can be filled """
+        if reader is not self.prefetch_reader:
+            return # an older one, the view moved on
+        self.prefetched = count
+        self.schedule_info()
+
+    def prefetch_done(self, reader):
+        """ db prefetch callback """
+        if reader is not self.prefetch_reader:
+            return # an older one, the view moved on
+        self.prefetch_reader = None
+        self.prefetched = len(reader.packages)
+        self.schedule_info()
+
+    def schedule_info(self):
+        """ start populate_info() unless it is running """
+        if not self.infothread_die and not self.info_scheduled:
+            self.info_scheduled = True
+            gobject.idle_add(self.populate_info)
 
     def populate_info(self):
-        """ Populate the current view with package info"""
+        """ Populate the current view with package info, as far as
+        it is prefetched """
+        if (self.iter and self.prefetch_reader and not self.infothread_die
+                and self.info_count >= self.prefetched):
+            # wait for the next batch
+            self.info_scheduled = False
+            return False
+        again = self.populate_row()
+        if not again:
+            self.info_scheduled = False
+        return again
+
+    def populate_row(self):
+        """ Populate the info of the next row """
         if self.infothread_die:
             return False # will not be called again
         #gtk.threads_enter()
@@ -591,6 +707,7 @@ class PackageView(CommonTreeView):
                 except:
                     debug.dprint("VIEWS populate_info(): Failed to get item description for '%s'" % package.full_name)
                 self.iter = model.iter_next(iter)
+                self.info_count += 1
                 #gtk.threads_leave()
             except Exception, e:
                 debug.dprint("VIEWS: populate_info(): Stopping due to exception '%s'" % e)
@@ -32,12 +32,16 @@ from porthole.backends.utilities import get_reduced_flags, dep_split, get_sync_i
 from porthole.db.package import Package
 from porthole import db
 import datetime
+from hashlib import md5
 
 #from exceptions import Exception
 
 
 LAZYNAME = "Loading dependencies..."
 
+# number of parsed dependency lists kept by the ParseCache
+PARSE_CACHE_SIZE = 200
+
 class DuplicateAtom(Exception):
     """Exception type definition. Duplicate Atom"""
     def __init__(self):
@@ -316,7 +320,8 @@ class DepCache(DependKey):
                 if children:
                     #debug.dprint("DepCache: re-using atom, adding more children " +
                     #                        "to %s, %s" % (mytype,useflag))
-                    atom.children = list(set(atom.children).union(set(children)))
+                    atom.children = atom.children + [child for child in children
+                        if child not in atom.children]
             elif atom.mytype in ['OPTION', 'GROUP', 'LAZY']:
                 # force a new atom.
                 #raise DuplicateAtom
@@ -370,6 +375,17 @@ class DepCache(DependKey):
         self._cache[key] = atom
         return
 
+    def add_atoms(self, atoms):
+        """(Re)adds already parsed DependAtoms and their children,
+        so the keys of a list from the ParseCache can be looked up
+
+        @param atoms: list of DependAtom instances
+        """
+        for atom in atoms:
+            self._cache[atom.key] = atom
+            if atom.children:
+                self.add_atoms(atom.children)
+
     def get(self, key):
         """Returns the cached DependAtom associated with 'key'
         
@@ -398,6 +414,101 @@ class DepCache(DependKey):
         self._cache = {}
 
 
+def tokenize(depends_list):
+    """Splits the '||' and parentheses stuck to other tokens of a
+    DEPEND list, like '||(' or 'foo/bar)', into tokens of their own
+
+    @param depends_list: list of DEPEND tokens
+    @rtype list of tokens
+    """
+    tokens = []
+    for item in depends_list:
+        if item in ("(", ")", "||") or not (item[0] in "(|" or item[-1] == ")"):
+            tokens.append(item)
+            continue
+        while item.startswith("||") or item.startswith("("):
+            if item[0] == "(":
+                tokens.append("(")
+                item = item[1:]
+            else:
+                tokens.append("||")
+                item = item[2:]
+        closing = 0
+        while item.endswith(")"):
+            closing += 1
+            item = item[:-1]
+        if item:
+            tokens.append(item)
+        tokens.extend([")"] * closing)
+    return tokens
+
+
+class ParseCache(object):
+    """Least recently used cache of parsed dependency lists, shared by
+    the Depends instances.  Ebuilds often have identical dependencies,
+    the revisions of a package most of all, so they are parsed once.
+
+    Important methods/functions:
+        get_key(), get(), add(), info()
+    """
+
+    def __init__(self, maxsize = PARSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        # key: (last use, atoms)
+        self._cache = {}
+        # counts the uses, orders the entries by their last one
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, depends_list, flags):
+        """Returns the cache key for a dependency list parsed
+        with the flags filter
+
+        @param depends_list: list of DEPEND atom strings
+        @param flags: the Depends.flags filter
+        @rtype key: string, a hash of both
+        """
+        return md5(' '.join(depends_list) + '\0' + ' '.join(flags)).digest()
+
+    def get(self, key):
+        """Returns the parsed DependAtom list stored under key,
+        or None, and counts the hit or miss"""
+        try:
+            used, atoms = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        # mark it as the most recently used
+        self._clock += 1
+        self._cache[key] = (self._clock, atoms)
+        self.hits += 1
+        return atoms
+
+    def add(self, key, atoms):
+        """Stores a parsed DependAtom list.  When the cache is full the
+        least recently used quarter is dropped, so the entries are not
+        sorted on every add"""
+        self._clock += 1
+        self._cache[key] = (self._clock, atoms)
+        if len(self._cache) > self.maxsize:
+            entries = sorted([(entry[0], k) for k, entry
+                in self._cache.iteritems()])
+            for used, k in entries[:len(entries) - self.maxsize * 3 // 4]:
+                del self._cache[k]
+
+    def info(self):
+        """@rtype (hits, misses, maxsize, current size)"""
+        return self.hits, self.misses, self.maxsize, len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+        self._clock = 0
+        self.hits = self.misses = 0
+
+parse_cache = ParseCache()
+
+
 class Depends(object):
     """Depends class for reading and parsing DEPEND atom strings as
     supplied by the package manager for any package and ebuild.
@@ -407,85 +518,97 @@ class Depends(object):
 
     Important 
         @variable:flags: a list of USE flags to be filtered out and not parsed.
-        @methods/functions: get_depends(), parse()
+        @methods/functions: get_depends(), get_parsed(), parse()
     """
 
     def __init__(self):
         # classwide atom cache
         self.cache = DepCache()
         self.flags = []
+        self.parse_cache = parse_cache
+
+    def get_parsed(self, depends_list):
+        """Returns parse(depends_list), taken from the ParseCache if the
+        same dependency list was parsed before with the same flags filter.
+        The atoms of a cached list are added to this instance's DepCache.
+
+        @param depends_list: list of DEPEND atom strings as returned by
+                get_depends(), it is not modified
+        @rtype a list of DependAtom instances, do not modify it
+        """
+        key = self.parse_cache.get_key(depends_list, self.flags)
+        atoms = self.parse_cache.get(key)
+        if atoms is None:
+            atoms = self.parse(depends_list)
+            self.parse_cache.add(key, atoms)
+        else:
+            self.cache.add_atoms(atoms)
+        return atoms
 
     def parse(self, depends_list, parent=''):
         """DEPENDS string parsing function. Takes a list of the form:
         portage.portdb.aux_get(<ebuild>, ["DEPEND"]).split()
         and arranges it into a list of nested list-like DependAtom()s.
-        if more closing brackets are encountered than opening ones then it
-        will return, meaning we can recursively pass the unparsed part of the
-        list back to ourselves...
-        
+        The list is read once, front to back, and is not modified.
+
         @param depends_list: of the form:
                 portage.portdb.aux_get(<ebuild>, ["DEPEND"]).split()
         @param parent: string if a unique parent DependAtom ID that any DependAtoms
                 created from this code instance belong to.
         @rtype a nested list of DependAtom instances ready for use.
         """
-        atomized_set = set()
+        atoms, pos = self._parse(tokenize(depends_list), 0, parent)
+        return atoms
+
+    def _parse(self, tokens, pos, parent):
+        """Parses tokens from pos up to the ')' closing this group, or
+        the end of the list.  Called recursively for each ( ) group.
+
+        @param tokens: list of tokens as returned by tokenize()
+        @param pos: index of the first token to parse
+        @param parent: unique parent DependAtom ID, see parse()
+        @rtype (list of DependAtom instances, index after the closing ')')
+        """
+        # the atom keys in source order, || ( ) picks the first
+        # alternative that fits, repeated atoms are kept once
+        atomized = []
+        seen = set()
         I_am = None
-        while depends_list:
+        count = len(tokens)
+        while pos < count:
+            item = tokens[pos]
+            pos += 1
+            if item == ")":
+                break
             item_type = useflag = ''
-            children = []
-            a_key = None
-            item = depends_list[0]
-            if item.startswith("||"):
+            if item == "||":
                 item_type = 'OPTION'
-                if item != "||":
-                    depends_list[0] = item[2:]
-                else:
-                    depends_list.pop(0)
-                item = depends_list[0]
             elif item.endswith("?"):
                 if item.startswith("!"):
                     item_type = 'NOTUSING'
-                    useflag=item[1:-1]
+                    useflag = item[1:-1]
                 else:
                     item_type = 'USING'
-                    useflag=item[:-1]
-                depends_list.pop(0)
-                item = depends_list[0]
-            if item.startswith("("):
-                if item_type == '': # two '(' in a row. Need to create a new atom?
+                    useflag = item[:-1]
+            if item_type:
+                if pos == count:
+                    break
+                item = tokens[pos]
+                pos += 1
+            if item == "(":
+                if item_type == '':
                     item_type = 'GROUP'
-                if item != "(":
-                    depends_list[0] = item[1:]
-                else:
-                    if not I_am:
-                        I_am = tuple((parent, datetime.datetime.now()))
-                    group, depends_list = self.split_group(depends_list)
-                    children = self.parse(group, I_am)
-                    a_key = self.cache.add(mytype=item_type, parent=I_am,
-                                            useflag=useflag, children=children)
-                    atomized_set.add(a_key)
-                    a_key = None
-                    continue
                 if not I_am:
                     I_am = tuple((parent, datetime.datetime.now()))
-                children = self.parse(depends_list, I_am)
-                a_key = cache.add(mytype=item_type, parent=I_am,
+                children, pos = self._parse(tokens, pos, I_am)
+                key = self.cache.add(mytype=item_type, parent=I_am,
                                         useflag=useflag, children=children)
-                atomized_set.add(a_key)
-                a_key = None
-                continue
-            elif item.startswith(")"):
-                if item != ")":
-                    depends_list[0] = item[1:]
-                else:
-                    depends_list.pop(0)
-                return self._atomized_list(atomized_set)
+                if key not in seen:
+                    seen.add(key)
+                    atomized.append(key)
+            elif item == ")":
+                break
             else: # hopefully a nicely formatted dependency
-                #if filter(lambda a: a in item, ['(', '|', ')']):<== EAPI 3 will kill this [flag1(+), flag2(-)]
-                    #  removed '?' from the list due to required USE flags that may have it. 
-                    #~ debug.dprint(" *** DEPENDS: atomize_depends_list: DEPENDS PARSE ERROR!!! " + \
-                        #~ "Please report this to the authorities. (item = %s)" % item)
                 if item.startswith("!"):
                     item_type = "BLOCKER"
                     item = item[1:]
@@ -494,66 +617,26 @@ class Depends(object):
                     item = item[1:]
                 else:
                     item_type = "DEP"
-                
-                a_key = self.cache.add(mydep=item, mytype=item_type)
-                atomized_set.add(a_key)
-                a_key = None
-                depends_list.pop(0)
-        #~ debug.dprint("Depends: atomize_depends_list(); finished recursion level," + \
-            #~ "returning atomized list")
-        return self._atomized_list(atomized_set)
-
-    def _atomized_list(self, a_set):
-        """Converts a set of atom keys into a list of DependAtom instances
-
-        @param a_set: set of DependKey keys for conversion
-        @rtype a_list: the list of DependAtom instances referenced by the keys
+                key = self.cache.add(mydep=item, mytype=item_type)
+                if key not in seen:
+                    seen.add(key)
+                    atomized.append(key)
+        return self._atomized_list(atomized), pos
+
+    def _atomized_list(self, keys):
+        """Converts a list of atom keys into a list of DependAtom instances
+
+        @param keys: list of DependKey keys for conversion
+        @rtype a_list: the list of DependAtom instances referenced by the
+                keys, in the same order
         """
         a_list = []
-        while a_set:
-            key = a_set.pop()
+        for key in keys:
             atom = self.cache.get(key)
             if atom:
                 a_list.append(atom)
-        #if a_list:
-        #    a_list.reverse()
         return a_list
 
-    def split_group(self, dep_list):
-        """Separate out the ( ) grouped dependencies from a dependency list
-
-        @param dep_list: the list of dependencies to split
-        @rtype group: list of dependency members contained within the group
-        @rtype dep_list: the remainder of the dendency list supplied for splitting
-        """
-        #debug.dprint("Depends: split_group(); starting")
-        group = []
-        remainder = []
-        if dep_list[0] != '(':
-            debug.dprint("Depends: split_group();dep_list passed does not " + \
-                "start with a '(', returning")
-            return group, dep_list
-        dep_list.pop(0)
-        nest_level = 0
-        while dep_list:
-            x = dep_list[0]
-            #debug.dprint("Depends: split_group(); x = " + x)
-            if x in '(':
-                    nest_level += 1
-                    #debug.dprint("Depends: split_group(); nest_level = " + str(nest_level))
-            elif x in ')':
-                if nest_level == 0:
-                    dep_list.pop(0)
-                    break
-                else:
-                    nest_level -= 1
-                    #debug.dprint("Depends: split_group(); nest_level = " + str(nest_level))
-            group.append(x)
-            dep_list.pop(0)
-        #debug.dprint("Depends: split_group(); dep_list parsed, group = " + str(group))
-        #debug.dprint("Depends: split_group(); dep_list parsed, remainder = " + str(dep_list))
-        return group, dep_list
-
     def get_depends(self, package, ebuild):
         """Returns a list of DEPEND atoms for a given package and ebuild
         
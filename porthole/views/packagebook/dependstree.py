@@ -32,6 +32,8 @@ from porthole.backends.utilities import get_reduced_flags, slot_split, \
     use_required_split, get_sync_info
 from porthole import db
 from porthole.views.packagebook.depends import  Depends, LAZYNAME
+from porthole.readers.depresolver import DepEbuildCache, DepResolver, \
+    dep_string, RESOLVE_AHEAD
 
 # used for timing some sections of code
 #import datetime
@@ -75,6 +77,9 @@ class DependsTree(gtk.TreeStore):
         self.parent_use_flags = {}
         self.dep_parser = Depends()
         self.dep_parser.flags.append("!bootstrap?")
+        # the ebuilds matching each dep, resolved ahead by self.resolver
+        self.dep_ebuilds = DepEbuildCache()
+        self.resolver = None
 
 
     def parse_depends_list(self, depends_list, parent = None):
@@ -205,7 +210,7 @@ class DependsTree(gtk.TreeStore):
         # be carefull of depth
         if dep_ebuild:
             dep_deps = self.dep_parser.get_depends(pack, dep_ebuild)
-            dep_atomized_list = self.dep_parser.parse(dep_deps)
+            dep_atomized_list = self.dep_parser.get_parsed(dep_deps)
             if dep_atomized_list == None: dep_atomized_list = []
             #debug.dprint("DependsTree: _add_kids(): new atomized_list for: "
             #    +atom.get_depname()+' = '+str(dep_atomized_list)+' '+str(dep_ebuild))
@@ -251,7 +256,7 @@ class DependsTree(gtk.TreeStore):
             debug.dprint("DependsTree:  _get_ebuild(): atom.atom = Null for atom:%s"
                 %atom.__repr__())
             return None
-        best, keyworded, masked  = portage_lib.get_dep_ebuild(atom.atom) #__repr__())
+        best, keyworded, masked  = self.get_dep_ebuild(atom)
         #debug.dprint("DependsTree:  _get_ebuild(): results = " + \
             #', '.join([best,keyworded,masked]))
         #
@@ -264,6 +269,30 @@ class DependsTree(gtk.TreeStore):
         return dep_ebuild
 
 
+    def get_dep_ebuild(self, atom):
+        """Returns the (best, keyworded, masked) ebuilds matching a
+        DependAtom, usually already found by the resolver"""
+        return self.dep_ebuilds.resolve(dep_string(atom))
+
+    def resolve_ahead(self, ebuilds, levels = RESOLVE_AHEAD):
+        """Resolves the dependencies of ebuilds, levels deep, in the
+        resolver thread, ahead of those already queued"""
+        if self.resolver and self.resolver.push(ebuilds, levels):
+            return
+        self.resolver = DepResolver(self.dep_ebuilds)
+        self.resolver.push(ebuilds, levels)
+        self.resolver.start()
+
+    def stop_resolver(self):
+        """Stops the resolver and starts over with an empty cache, so
+        tree or config changes are picked up by the next package"""
+        if self.resolver:
+            self.resolver.please_die()
+            self.resolver = None
+        debug.dprint("DependsTree: stop_resolver(); dep ebuild cache " +
+            "hits=%d, misses=%d" %(self.dep_ebuilds.hits, self.dep_ebuilds.misses))
+        self.dep_ebuilds = DepEbuildCache()
+
     def expand_lazy(self, treeview, iter, path):
         #debug.dprint("DependsTree:  expand_lazy(): activated by  'test-expand-row'")
         # first find out if there are already kids to expand
@@ -291,6 +320,10 @@ class DependsTree(gtk.TreeStore):
             pack = self._get_package(atom)
             self._add_kids(atom=atom, depends_view=treeview, iter=iter,
                 add_kids=True, depth=0, pack=pack, dep_depth=0)
+            # keep the resolver ahead of the rows just added
+            dep_ebuild = self._get_ebuild(atom)
+            if dep_ebuild:
+                self.resolve_ahead([dep_ebuild], self.max_depth + RESOLVE_AHEAD)
         return True
 
     def fill_depends_tree(self, treeview, package, ebuild):
@@ -299,6 +332,7 @@ class DependsTree(gtk.TreeStore):
         # first reset the DepCache
         #start = datetime.datetime.now() #.microsecond
         self.dep_parser.cache.reset()
+        self.stop_resolver()
         depends = self.dep_parser.get_depends(package, ebuild)
         self.clear()
         if depends:
@@ -308,11 +342,16 @@ class DependsTree(gtk.TreeStore):
             #debug.dprint("DependsTree: calling self.dep_parser.parse();" +
                 #" ebuild=%s reduced depends = %s "
             #        % (ebuild, str(depends)))
-            atomized_depends = self.dep_parser.parse(depends)
+            atomized_depends = self.dep_parser.get_parsed(depends)
             #end = datetime.datetime.now() #.microsecond
             #debug.dprint(atomized_depends)
             self._add_list(atomized_depends, treeview,
                 ebuild = ebuild, is_new_child = True)
+            # the shown levels are resolved and cached by now, the
+            # resolver walks through them to the ones below
+            self.resolve_ahead([ebuild], self.max_depth + RESOLVE_AHEAD)
+            debug.dprint("DependsTree: fill_depends_tree(); parse cache " +
+                "hits=%d, misses=%d, maxsize=%d, size=%d" %self.dep_parser.parse_cache.info())
             #end2 = datetime.datetime.now() #.microsecond
         else:
             parent_iter = self.insert_before(None, None)
@@ -39,6 +39,9 @@ from porthole import config
 from porthole.utils.dispatcher import Dispatcher
 from porthole.views.packagebook.summary import Summary
 from porthole.views.depends import DependsView
+from porthole import db
+from porthole.views.revdepends import ReverseDependsView
+from porthole.views.closure import ClosureView
 from porthole.views.commontreeview import CommonTreeView
 from porthole.views.highlight import HighlightView
 from porthole.views.changelog import ChangeLogView
@@ -61,6 +64,7 @@ class PackageNotebook(object):
         self.wtree = wtree
         self.callbacks = callbacks
         self.plugin_package_tabs = plugin_package_tabs
+        self.package = None
         self.notebook = self.wtree.get_widget("notebook")
         self.installed_window = self.wtree.get_widget("installed_files_scrolled_window")
         #self.changelog = self.wtree.get_widget("changelog").get_buffer()
@@ -88,6 +92,21 @@ class PackageNotebook(object):
 
         self.use_flag_page = self.wtree.get_widget("use_scrolledwindow")
         self.use_flag_view = None
+        # the reverse dependencies tab, after the ones in the glade file
+        self.rdeps_view = ReverseDependsView()
+        scroller = gtk.ScrolledWindow()
+        scroller.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scroller.add(self.rdeps_view)
+        scroller.show_all()
+        self.rdeps_page = self.notebook.append_page(scroller, gtk.Label(_("Reverse depends")))
+        db.db.add_revdep_callback(self.revdep_index_ready)
+        # what an emerge of the ebuild pulls in and downloads
+        self.closure_view = ClosureView()
+        scroller = gtk.ScrolledWindow()
+        scroller.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scroller.add(self.closure_view)
+        scroller.show_all()
+        self.closure_page = self.notebook.append_page(scroller, gtk.Label(_("Emerge closure")))
         self.notebook.connect("switch-page", self.notebook_changed)
         self.reset_tabs()
 
@@ -103,8 +122,10 @@ class PackageNotebook(object):
     def reset_tabs(self):
         """set notebook tabs to load new package info"""
         debug.dprint("PackageNotebook reset_tabs()")
-        self.loaded = {"deps": False, "changelog": False, "installed": False, "ebuild": False}
-        self.loaded_version= {"ebuild" : None, "installed": None, "deps": None}
+        self.loaded = {"deps": False, "changelog": False, "installed": False, "ebuild": False,
+            "rdeps": False, "closure": False}
+        self.loaded_version= {"ebuild" : None, "installed": None, "deps": None,
+            "closure": None}
 
     def notebook_changed(self, widget, pointer, index):
         """Catch when the user changes the notebook"""
@@ -160,17 +181,35 @@ class PackageNotebook(object):
             frame.show()
             self.use_flag_page.add_with_viewport(frame)
             self.use_flag_page.show()
+        elif index == self.rdeps_page:
+            if not self.loaded["rdeps"]:
+                # not loaded until the index is, revdep_index_ready() refills it
+                self.loaded["rdeps"] = self.rdeps_view.fill(package)
+        elif index == self.closure_page:
+            if not self.loaded["closure"] or self.loaded_version["closure"] != self.summary.ebuild:
+                self.closure_view.fill(self.summary.ebuild)
+                self.loaded["closure"] = True
+                self.loaded_version["closure"] = self.summary.ebuild
         else:
             for i in self.plugin_package_tabs:
                 #Search through the plugins dictionary and select the correct one.
                 if self.plugin_package_tabs[i][2] == index:
                     self.plugin_package_tabs[i][0]( package )
 
+    def revdep_index_ready(self):
+        """db callback, fill the reverse depends tab if it is showing
+        the loading message"""
+        if (self.package and not self.loaded["rdeps"]
+                and self.notebook.get_current_page() == self.rdeps_page):
+            self.loaded["rdeps"] = self.rdeps_view.fill(self.package)
+
     def clear_notebook(self):
         """ Clear all notebook tabs & disable them """
         debug.dprint("PackageNotebook clear_notebook()")
         self.summary.update_package_info(None)
         self.deps_view.clear()
+        self.rdeps_view.clear()
+        self.closure_view.clear()
         self.changelog.set_text('')
         self.installed_files.set_text('')
         self.ebuild.set_text('')
@@ -212,6 +251,8 @@ class PackageNotebook(object):
         if self.dep_window["window"] != None and self.dep_window["notebook"] != None:
             self.dep_window["notebook"].close_window()
         if self.dep_window["window"]:
+            if self.dep_window["notebook"] != None:
+                db.db.remove_revdep_callback(self.dep_window["notebook"].revdep_index_ready)
             self.dep_window["window"].destroy()
             del self.dep_window["window"], self.dep_window["notebook"]
             self.dep_window["window"] = None
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+'''
+    Porthole Reverse Depends View
+    Lists the installed packages that depend on a package
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+'''
+
+import pygtk; pygtk.require("2.0") # make sure we have the right version
+import gtk, gobject
+from gettext import gettext as _
+
+from porthole.utils import debug
+from porthole.views.commontreeview import CommonTreeView
+from porthole import db
+
+
+class ReverseDependsView(CommonTreeView):
+    """ List the installed packages depending on a package """
+    def __init__(self):
+        """ Initialize """
+        CommonTreeView.__init__(self)
+        self.model = gtk.ListStore(
+                gobject.TYPE_STRING,       # installed dependent cpv
+                gobject.TYPE_STRING,       # DEPEND, RDEPEND or PDEPEND
+                gobject.TYPE_STRING        # the atom it depends with
+        )
+        self.column = {"cpv": 0, "kind": 1, "atom": 2}
+        for title, key in [(_("Reverse depends"), "cpv"), (_("Type"), "kind"),
+                (_("Dependency"), "atom")]:
+            text = gtk.CellRendererText()
+            column = gtk.TreeViewColumn(title, text, text = self.column[key])
+            column.set_resizable(True)
+            column.set_sort_column_id(self.column[key])
+            self.append_column(column)
+        self.set_model(self.model)
+        self.set_rules_hint(True)
+        debug.dprint("ReverseDependsView: initialized")
+
+    def fill(self, package):
+        """ Fill the view with the installed packages that depend on
+        package.  Returns False if the reverse dependency index is
+        still loading """
+        self.model.clear()
+        self.get_column(0).set_title(_("Reverse depends") + ":  " + package.full_name)
+        dependents = db.db.get_reverse_depends(package.full_name)
+        if dependents is None:
+            self.model.append([_("Loading the installed package dependencies..."), '', ''])
+            return False
+        debug.dprint("ReverseDependsView: fill(); %d dependencies on %s"
+            %(len(dependents), package.full_name))
+        if not dependents:
+            self.model.append([_("None"), '', ''])
+        for cpv, kind, atom in dependents:
+            self.model.append([cpv, kind, atom])
+        return True
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+'''
+    Porthole DatabaseReader benchmark
+    Times DatabaseReader.read_db() on synthetic trees of increasing size
+    to check that building the db scales linearly with the node count.
+    The trees are written to a temp dir, a package dir and an md5-cache
+    entry per node, so the listing and stat calls the tree scan makes
+    are timed too.  The cpu column is the time spent in this process,
+    where the gui thread would compete for the GIL.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+    usage: python scripts/bench_dbreader.py [-j workers] [nodes ...]
+    run from the top of the source tree, no portage install is needed.
+'''
+
+import sys, os, time, tempfile, gettext, imp, shutil
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP)
+gettext.install('porthole')
+
+SIZES = [5000, 20000, 50000]
+CATEGORIES = 150
+# fraction of the tree that is installed, ~2500 of 20k
+INSTALLED_EVERY = 8
+DEPRECATED = 50
+WORLD = 300
+
+
+class FakeSettings(object):
+    """just enough of portagelib.settings for the db modules"""
+    portdir = '/nonexistent'
+
+    def __init__(self):
+        self.world = []
+        self.world_set = set()
+
+    def get_world(self):
+        return self.world
+
+    def in_world(self, full_name):
+        return full_name in self.world_set
+
+
+class FakeBackend(object):
+    """stands in for portagelib, serving a synthetic tree written
+    under root"""
+
+    def __init__(self, nodes, root = None):
+        self.settings = FakeSettings()
+        self.repo = root and os.path.join(root, 'repo')
+        self.allnodes = []
+        for i in range(nodes):
+            self.allnodes.append("cat-%d/pkg-%d" %(i % CATEGORIES, i))
+        if root:
+            for entry in self.allnodes:
+                os.makedirs(os.path.join(self.repo, entry))
+                cache_dir = os.path.join(self.repo, 'metadata', 'md5-cache',
+                    entry.split('/')[0])
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                open(os.path.join(cache_dir, entry.split('/')[1] + '-1.0'), 'w').close()
+        self.installed = self.allnodes[::INSTALLED_EVERY] + \
+            ["gone-%d/old-%d" %(i % CATEGORIES, i) for i in range(DEPRECATED)]
+        self.settings.world = self.installed[:WORLD]
+        self.settings.world_set = set(self.settings.world)
+
+    def get_allnodes(self):
+        nodes = []
+        for category in self.get_tree_categories():
+            nodes.extend(self.get_category_nodes(category))
+        return nodes
+
+    def get_installed_list(self):
+        return self.installed[:]
+
+    def get_tree_categories(self):
+        if not self.repo:
+            return []
+        return sorted([name for name in os.listdir(self.repo)
+            if name != 'metadata'])
+
+    def get_category_nodes(self, category):
+        """as portagelib's, a listdir and an isdir per package"""
+        cat_dir = os.path.join(self.repo, category)
+        return sorted([category + '/' + name for name in os.listdir(cat_dir)
+            if os.path.isdir(os.path.join(cat_dir, name))])
+
+    def get_cache_signatures(self, categories = None):
+        """as portagelib's, a stat per md5-cache entry"""
+        signatures = {}
+        if not self.repo:
+            return signatures
+        cache_dir = os.path.join(self.repo, 'metadata', 'md5-cache')
+        for category in categories or os.listdir(cache_dir):
+            cat_dir = os.path.join(cache_dir, category)
+            if not os.path.isdir(cat_dir):
+                continue
+            for pf in os.listdir(cat_dir):
+                mtime = os.stat(os.path.join(cat_dir, pf)).st_mtime
+                signatures.setdefault(category + '/' + pf.rsplit('-', 1)[0],
+                    []).append((self.repo, pf, mtime))
+        return signatures
+
+    def get_repo_paths(self):
+        return []
+
+    def get_vdb_path(self):
+        return '/nonexistent'
+
+    def get_config_paths(self):
+        return []
+
+    def get_category(self, full_name):
+        return full_name.split('/')[0]
+
+    def get_name(self, full_name):
+        return full_name.split('/')[1]
+
+
+class Prefs(object):
+    EPREFIX = tempfile.mkdtemp()
+
+
+def setup():
+    """point the porthole modules at a FakeBackend,
+    returns the backend and the dbreader module"""
+    from porthole import backends, config
+    backend = FakeBackend(0)
+    backends.portage_lib = backend
+    config.Prefs = Prefs
+    # porthole.db creates the gui Database on import, register an
+    # empty package so only the reader modules get loaded
+    db_pkg = imp.new_module('porthole.db')
+    db_pkg.__path__ = [os.path.join(TOP, 'porthole', 'db')]
+    sys.modules['porthole.db'] = db_pkg
+    # for the modules doing 'from porthole import db'
+    import porthole
+    porthole.db = db_pkg
+    from porthole.db import dbreader
+    return backend, dbreader
+
+
+def main(sizes, workers = 0):
+    backend, dbreader = setup()
+
+    print
+    print "%8s %10s %10s %14s" %("nodes", "seconds", "cpu", "usec per node")
+    for size in sizes:
+        root = tempfile.mkdtemp()
+        try:
+            fake = FakeBackend(size, root)
+            # the modules bound portage_lib at import, so swap the contents
+            backend.__dict__.update(fake.__dict__)
+            reader = dbreader.DatabaseReader(lambda args: None, use_snapshot = False,
+                workers = workers)
+            start = time.time()
+            cpu = time.clock()
+            reader.read_db()
+            cpu = time.clock() - cpu
+            elapsed = time.time() - start
+        finally:
+            shutil.rmtree(root)
+        assert len(reader.db.list) == size + DEPRECATED
+        print "%8d %10.3f %10.3f %14.1f" %(size, elapsed, cpu, elapsed * 1e6 / size)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = 0
+    if args[:1] == ['-j']:
+        workers = int(args[1])
+        args = args[2:]
+    main([int(x) for x in args] or SIZES, workers)
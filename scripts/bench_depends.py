@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+'''
+    Porthole DEPEND parser benchmark
+    Times the old pop(0) based Depends.parse() against the index cursor
+    parser on the largest DEPEND+RDEPEND+PDEPEND lists in the tree, and
+    checks that both build the same DependAtom structure.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+    usage: python scripts/bench_depends.py [-n count] [repo ...]
+    run from the top of the source tree, no portage install is needed.
+    The dependencies are read from the md5-cache of the repos, by
+    default the main tree if it is found, else synthetic lists of
+    increasing size are used.
+'''
+
+import sys, os, time, datetime, gc
+
+from bench_dbreader import setup
+
+REPOS = ['/var/db/repos/gentoo', '/usr/portage']
+KEYS = ['DEPEND=', 'RDEPEND=', 'PDEPEND=']
+COUNT = 10
+REPEAT = 3
+SIZES = [1000, 10000, 50000]
+
+
+def read_tree(repos):
+    '''returns a list of (cpv, DEPEND token list) of every ebuild
+    in the md5-cache of repos'''
+    results = []
+    for repo in repos:
+        cache = os.path.join(repo, 'metadata', 'md5-cache')
+        if not os.path.isdir(cache):
+            continue
+        for category in os.listdir(cache):
+            path = os.path.join(cache, category)
+            if not os.path.isdir(path):
+                continue
+            for pvr in os.listdir(path):
+                depends = []
+                for line in open(os.path.join(path, pvr)):
+                    for key in KEYS:
+                        if line.startswith(key):
+                            depends.extend(line[len(key):].split())
+                results.append((category + '/' + pvr, depends))
+    return results
+
+def synthetic(size):
+    '''returns a meta-package like DEPEND list of about size tokens,
+    mostly plain atoms with a USE conditional and || group now and then'''
+    depends = []
+    i = 0
+    while len(depends) < size:
+        category = 'cat-%d' % (i % 50)
+        depends.append('>=%s/pkg-%d-1.0' % (category, i))
+        if i % 10 == 0:
+            depends.extend(['flag%d?' % i, '(', '||', '(', '%s/alt-%d' % (category, i),
+                '(', '%s/one-%d' % (category, i), '%s/two-%d:=' % (category, i), ')',
+                ')', '!%s/block-%d' % (category, i), ')'])
+        else:
+            depends.append('dev-libs/lib-%d[foo,-bar(+)]' % i)
+        i += 1
+    return depends
+
+def canonical(atoms):
+    '''returns a comparable form of a DependAtom list, the old parser
+    returns the atoms of a level in no particular order'''
+    return sorted([(atom.mytype, atom.useflag, atom.atom, canonical(atom.children))
+        for atom in atoms])
+
+
+def main(count, repos):
+    backend, dbreader = setup()
+    from porthole.views.packagebook.depends import Depends, DepCache
+    from porthole.utils import debug
+
+    class OldDepends(Depends):
+        '''the parser before the index cursor one, kept for comparison'''
+
+        def parse(self, depends_list, parent=''):
+            """DEPENDS string parsing function. Takes a list of the form:
+            portage.portdb.aux_get(<ebuild>, ["DEPEND"]).split()
+            and arranges it into a list of nested list-like DependAtom()s.
+            if more closing brackets are encountered than opening ones then it
+            will return, meaning we can recursively pass the unparsed part of the
+            list back to ourselves...
+
+            @param depends_list: of the form:
+                    portage.portdb.aux_get(<ebuild>, ["DEPEND"]).split()
+            @param parent: string if a unique parent DependAtom ID that any DependAtoms
+                    created from this code instance belong to.
+            @rtype a nested list of DependAtom instances ready for use.
+            """
+            atomized_set = set()
+            I_am = None
+            while depends_list:
+                item_type = useflag = ''
+                children = []
+                a_key = None
+                item = depends_list[0]
+                if item.startswith("||"):
+                    item_type = 'OPTION'
+                    if item != "||":
+                        depends_list[0] = item[2:]
+                    else:
+                        depends_list.pop(0)
+                    item = depends_list[0]
+                elif item.endswith("?"):
+                    if item.startswith("!"):
+                        item_type = 'NOTUSING'
+                        useflag=item[1:-1]
+                    else:
+                        item_type = 'USING'
+                        useflag=item[:-1]
+                    depends_list.pop(0)
+                    item = depends_list[0]
+                if item.startswith("("):
+                    if item_type == '': # two '(' in a row. Need to create a new atom?
+                        item_type = 'GROUP'
+                    if item != "(":
+                        depends_list[0] = item[1:]
+                    else:
+                        if not I_am:
+                            I_am = tuple((parent, datetime.datetime.now()))
+                        group, depends_list = self.split_group(depends_list)
+                        children = self.parse(group, I_am)
+                        a_key = self.cache.add(mytype=item_type, parent=I_am,
+                                                useflag=useflag, children=children)
+                        atomized_set.add(a_key)
+                        a_key = None
+                        continue
+                    if not I_am:
+                        I_am = tuple((parent, datetime.datetime.now()))
+                    children = self.parse(depends_list, I_am)
+                    a_key = cache.add(mytype=item_type, parent=I_am,
+                                            useflag=useflag, children=children)
+                    atomized_set.add(a_key)
+                    a_key = None
+                    continue
+                elif item.startswith(")"):
+                    if item != ")":
+                        depends_list[0] = item[1:]
+                    else:
+                        depends_list.pop(0)
+                    return self._atomized_list(atomized_set)
+                else: # hopefully a nicely formatted dependency
+                    if item.startswith("!"):
+                        item_type = "BLOCKER"
+                        item = item[1:]
+                    elif item.startswith('~'):
+                        item_type = "REVISIONABLE"
+                        item = item[1:]
+                    else:
+                        item_type = "DEP"
+
+                    a_key = self.cache.add(mydep=item, mytype=item_type)
+                    atomized_set.add(a_key)
+                    a_key = None
+                    depends_list.pop(0)
+            return self._atomized_list(atomized_set)
+
+
+        def split_group(self, dep_list):
+            """Separate out the ( ) grouped dependencies from a dependency list
+
+            @param dep_list: the list of dependencies to split
+            @rtype group: list of dependency members contained within the group
+            @rtype dep_list: the remainder of the dendency list supplied for splitting
+            """
+            group = []
+            remainder = []
+            if dep_list[0] != '(':
+                debug.dprint("Depends: split_group();dep_list passed does not " + \
+                    "start with a '(', returning")
+                return group, dep_list
+            dep_list.pop(0)
+            nest_level = 0
+            while dep_list:
+                x = dep_list[0]
+                if x in '(':
+                        nest_level += 1
+                elif x in ')':
+                    if nest_level == 0:
+                        dep_list.pop(0)
+                        break
+                    else:
+                        nest_level -= 1
+                group.append(x)
+                dep_list.pop(0)
+            return group, dep_list
+
+
+    lists = read_tree(repos)
+    if lists:
+        lists.sort(key = lambda x: len(x[1]), reverse = True)
+        lists = lists[:count]
+    else:
+        print "no md5-cache found, using synthetic lists"
+        lists = [('synthetic-%d' % size, synthetic(size)) for size in SIZES]
+
+    old, new = OldDepends(), Depends()
+    print
+    print "%-40s %8s %10s %10s %10s %8s" %("ebuild", "tokens", "old ms", "new ms",
+        "new us/tok", "speedup")
+    for cpv, depends in lists:
+        times = []
+        results = []
+        for parser in (old, new):
+            best = None
+            for i in range(REPEAT):
+                parser.cache = DepCache()
+                tokens = depends[:] # the old parser consumes its list
+                # as timeit, keep the collector out of the timings
+                gc.disable()
+                start = time.time()
+                atoms = parser.parse(tokens)
+                elapsed = time.time() - start
+                gc.enable()
+                if best is None or elapsed < best:
+                    best = elapsed
+            times.append(best)
+            results.append(canonical(atoms))
+        assert results[0] == results[1], "parsers differ for " + cpv
+        print "%-40s %8d %10.2f %10.2f %10.2f %8.1f" %(cpv[:40], len(depends),
+            times[0] * 1000, times[1] * 1000, times[1] * 1e6 / max(len(depends), 1),
+            times[0] / max(times[1], 1e-6))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    count = COUNT
+    if args[:1] == ['-n']:
+        count = int(args[1])
+        args = args[2:]
+    main(count, args or REPOS)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+'''
+    Porthole Package memory benchmark
+    Builds a synthetic package database with the DatabaseReader and
+    reports the resident size it added and the size per package.
+
+    Copyright (C) 2003 - 2009 Fredrik Arnerup, Daniel G. Taylor,
+    Wm. F. Wheeler, Brian Dolbec, Tommy Iorns
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+    usage: python scripts/bench_package_memory.py [nodes]
+    run from the top of the source tree on linux, no portage install
+    is needed.
+'''
+
+import sys, gc
+
+from bench_dbreader import FakeBackend, setup
+
+NODES = 20000
+
+
+def rss():
+    """returns the resident size of this process in kB"""
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1])
+    return 0
+
+
+def main(nodes):
+    backend, dbreader = setup()
+    backend.__dict__.update(FakeBackend(nodes).__dict__)
+    # every package name is a new string, as it is when read from disk
+    backend.allnodes = [''.join(list(x)) for x in backend.allnodes]
+    gc.collect()
+    before = rss()
+    reader = dbreader.DatabaseReader(lambda args: None, use_snapshot = False)
+    reader.read_db()
+    # drop the reader's temporary lists, only the db is kept
+    db = reader.db
+    del reader
+    backend.allnodes = backend.installed = []
+    gc.collect()
+    size = rss() - before
+    print
+    print "%8s %12s %16s" %("packages", "resident kB", "bytes per package")
+    print "%8d %12d %16d" %(len(db.list), size, size * 1024 / len(db.list))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:]:
+        main(int(sys.argv[1]))
+    else:
+        main(NODES)